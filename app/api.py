@@ -0,0 +1,563 @@
+"""The API routes, shared by the WSGI app (app.main) and the ASGI app (app.asgi).
+
+Each route is written once here, as a plain function of an ApiRequest that
+returns its JSON body, a (body, status) pair or an ApiResponse. The apps
+only read the request, call the route and turn the result into a response
+of their framework; app.asgi runs the routes in worker threads.
+"""
+import os
+from app.password_logic import PasswordManager, BatchError, credential_error, vault_cache
+from app.metrics import metrics, cache_collector
+from app.key_cache import KeyCache
+from app.serializers import payload_codec
+from app.crypto_pool import CryptoPool, DEFAULT_WORKERS, DEFAULT_MAX_QUEUE, DEFAULT_RETRY_AFTER
+from app.streaming_import import import_stream, ImportFormatError, DEFAULT_BATCH_SIZE, DEFAULT_MAX_BUFFER_BYTES
+from app.streaming_export import (
+    ExportHeader, iter_json_export, iter_encrypted_export, is_encrypted_export, DecryptedExportStream,
+    ExportDecryptionError,
+)
+import base64
+import binascii
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Imports are parsed and merged incrementally; these bound the memory one upload can use
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+IMPORT_MAX_BUFFER_BYTES = int(os.environ.get('IMPORT_MAX_BUFFER_BYTES', DEFAULT_MAX_BUFFER_BYTES))
+
+# How vault records are encoded before encryption, e.g. 'json' or 'binary+zlib'; any format is readable
+payload_codec.configure_from_spec(os.environ.get('VAULT_PAYLOAD_FORMAT', 'json'))
+
+MAX_PAGE_SIZE = 500
+MAX_BATCH_OPERATIONS = 10000
+MAX_TAG_SUGGESTIONS = 50
+# Entry keys a paginated listing may project; secrets are only sent when 'fields' is asked for
+LISTING_FIELDS = ('tags', 'fields')
+
+# Derived keys for active sessions, so only login and cold sessions pay for PBKDF2
+key_cache = KeyCache(
+    ttl=int(os.environ.get('KEY_CACHE_TTL', 15 * 60)),
+    max_entries=int(os.environ.get('KEY_CACHE_MAX_ENTRIES', 1024)),
+)
+
+# Key derivation runs here (logins, which also decrypt the vault once, cold sessions and encrypted
+# exports and imports); a full pool sheds load with 503 instead of queueing without bound
+crypto_pool = CryptoPool(
+    max_workers=int(os.environ.get('CRYPTO_POOL_WORKERS', DEFAULT_WORKERS)),
+    max_queue=int(os.environ.get('CRYPTO_POOL_MAX_QUEUE', DEFAULT_MAX_QUEUE)),
+    retry_after=int(os.environ.get('CRYPTO_POOL_RETRY_AFTER', DEFAULT_RETRY_AFTER)),
+)
+
+# Timing spans, per-route histograms and /metrics; off unless METRICS_ENABLED is set
+metrics.enabled = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+metrics.register_collector(cache_collector('pm_key_cache', 'Session key cache', key_cache))
+metrics.register_collector(cache_collector('pm_vault_cache', 'Decrypted vault cache', vault_cache))
+
+def crypto_pool_collector():
+    stats = crypto_pool.stats()
+    return [
+        ('pm_crypto_pool_in_flight', 'gauge', 'Crypto jobs running or queued.', [({}, stats['in_flight'])]),
+        ('pm_crypto_pool_completed_total', 'counter', 'Crypto jobs completed.', [({}, stats['completed'])]),
+        ('pm_crypto_pool_rejected_total', 'counter', 'Crypto jobs rejected because the pool was full.',
+         [({}, stats['rejected'])]),
+    ]
+
+metrics.register_collector(crypto_pool_collector)
+
+class ApiRequest:
+    """What the routes read from a request, taken from the framework's request by each app."""
+
+    def __init__(self, args, json, session, full_path, if_none_match, files=None, form=None):
+        self.args = args
+        # None unless the body is valid JSON
+        self.json = json
+        self.session = session
+        self.full_path = full_path
+        self.if_none_match = if_none_match
+        self.files = files if files is not None else {}
+        self.form = form if form is not None else {}
+
+class ApiResponse:
+    """A route result other than plain JSON: with a validator, a streamed body or no body at all."""
+
+    def __init__(self, body=None, status=200, etag=None, stream=None, mimetype=None, headers=None):
+        self.body = body
+        self.status = status
+        self.etag = etag
+        # An iterator of bytes, sent as it is produced
+        self.stream = stream
+        self.mimetype = mimetype
+        self.headers = headers or {}
+
+    @classmethod
+    def of(cls, result):
+        if isinstance(result, cls):
+            return result
+        if isinstance(result, tuple):
+            return cls(*result)
+        return cls(result)
+
+    def finish(self, response):
+        # Status and headers on a response the app built from this result
+        response.status_code = self.status
+        response.headers.update(self.headers)
+        if self.etag is not None:
+            # Browsers keep the body but revalidate it on every use, so a change is never missed
+            response.set_etag(self.etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+ROUTES = []
+
+def route(rule, methods=('GET',), uploads=False):
+    # uploads: the route reads files and form fields, which only multipart requests carry.
+    # Stacked, it serves one function under several rules.
+    def decorator(func):
+        ROUTES.append((rule, list(methods), func, uploads))
+        return func
+    return decorator
+
+NOT_LOGGED_IN = ({"error": "Not logged in"}, 401)
+
+def saturated(e):
+    return ApiResponse({"success": False, "message": "Server is busy. Please retry shortly."}, 503,
+                       headers={'Retry-After': str(e.retry_after)})
+
+def encode_cursor(service):
+    if service is None:
+        return None
+    return base64.urlsafe_b64encode(service.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return base64.b64decode(cursor.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def response_etag(version, full_path):
+    # Strong validator of one response: the vault's version and the exact path and query it answers
+    return hashlib.sha256(f"{version} {full_path}".encode()).hexdigest()[:32]
+
+def vault_etag(pm_instance, req):
+    # Taken before the body is built, so a concurrent write can only make the validator stale, never the body
+    version = pm_instance.vault_version()
+    return None if version is None else response_etag(version, req.full_path)
+
+def not_modified(etag):
+    return ApiResponse(status=304, etag=etag)
+
+def end_session(session):
+    key_token = session.pop('key_token', None)
+    if key_token:
+        key_cache.evict(key_token)
+    session.pop('logged_in', None)
+    session.pop('user_id', None) # Also remove user_id from session
+
+def get_password_manager(req):
+    session = req.session
+    user_id = session.get('user_id')
+    if not user_id:
+        logger.warning("Attempted API access without being logged in.")
+        return None
+    pm_instance = PasswordManager(user_id)
+    # A missing user means the vault moved away (e.g. a master password change, possibly
+    # in another worker whose key cache this one cannot see); never recreate it empty
+    if not pm_instance.exists():
+        logger.warning("Session user no longer has a vault. Ending the session.")
+        end_session(session)
+        return None
+    cached_key = key_cache.get(session.get('key_token'), user_id)
+    if cached_key is not None:
+        pm_instance.key = cached_key
+        if pm_instance.can_decrypt():
+            return pm_instance
+        # Another worker rehashed the vault under new KDF parameters; derive the key again, once
+        logger.warning("Cached key no longer opens the vault. Deriving it again.")
+        key_cache.evict(session.pop('key_token', None))
+        pm_instance.key = None
+    crypto_pool.run(pm_instance.set_key, user_id) # Re-set key for the current session
+    if pm_instance.key is None:
+        logger.error("Failed to set key for session user_id. Session might be invalid.")
+        end_session(session)
+        return None
+    session['key_token'] = key_cache.put(user_id, pm_instance.key)
+    return pm_instance
+
+@route('/api/login', methods=['POST'])
+def login(req):
+    data = req.json or {}
+    password = data.get('password')
+    logger.info("Attempting login for user.")
+
+    if not password:
+        logger.warning("Login attempt with empty password.")
+        return {"success": False, "message": "Password cannot be empty."}, 400
+
+    pm_instance = PasswordManager(password)
+
+    # A registry lookup for registered users; only legacy users need a filesystem probe
+    if not pm_instance.exists():
+        logger.warning("Login failed: No user found for the provided password.")
+        return {"success": False, "message": "No user found for this password. Please create a user first."}, 401
+
+    if crypto_pool.run(pm_instance.unlock, password):
+        if pm_instance.rehashed:
+            # Keys cached for other sessions were derived with the old KDF parameters
+            key_cache.evict_user(password)
+        req.session['logged_in'] = True
+        req.session['user_id'] = password # Store the password as user_id in session
+        req.session['key_token'] = key_cache.put(password, pm_instance.key)
+        logger.info("User logged in successfully.")
+        return {"success": True}
+    else:
+        logger.warning("Login failed: Incorrect password or corrupted data.")
+        return {"success": False, "message": "Incorrect password or corrupted data."}, 401
+
+@route('/api/credentials')
+def get_credentials(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    etag = vault_etag(pm_instance, req)
+    if etag is not None and req.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    if not any(param in req.args for param in ('limit', 'cursor', 'include')):
+        # Unpaginated listing: the whole decrypted vault, kept for existing clients
+        credentials = pm_instance.load_credentials()
+        if credentials is not None:
+            return ApiResponse(credentials, etag=etag)
+        else:
+            logger.error("Failed to load credentials for logged in user.")
+            return {"error": "Failed to load credentials"}, 500
+
+    limit = req.args.get('limit', 50, type=int)
+    include = [name for name in req.args.get('include', 'tags').split(',') if name]
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return {"error": f"Limit must be between 1 and {MAX_PAGE_SIZE}."}, 400
+    if any(name not in LISTING_FIELDS for name in include):
+        return {"error": f"Include may only list: {', '.join(LISTING_FIELDS)}."}, 400
+    try:
+        after = decode_cursor(req.args.get('cursor'))
+    except ValueError:
+        return {"error": "Invalid cursor."}, 400
+
+    items, last_service = pm_instance.list_credentials(after, limit, include)
+    if items is None:
+        logger.error("Failed to list credentials for logged in user.")
+        return {"error": "Failed to load credentials"}, 500
+    return ApiResponse({"items": items, "next_cursor": encode_cursor(last_service)}, etag=etag)
+
+@route('/api/sync')
+def sync_credentials(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    include = [name for name in req.args.get('include', 'tags').split(',') if name]
+    if any(name not in LISTING_FIELDS for name in include):
+        return {"error": f"Include may only list: {', '.join(LISTING_FIELDS)}."}, 400
+    if 'since' not in req.args:
+        # A new client only learns the revision to sync from, after loading the listing
+        since = None
+    else:
+        since = req.args.get('since', type=int)
+        if since is None or since < 0:
+            return {"error": "Since must be a non-negative integer."}, 400
+
+    changes = pm_instance.changes_since(since, include)
+    if changes is None:
+        logger.error("Failed to sync credentials for logged in user.")
+        return {"error": "Failed to load credentials"}, 500
+    revision, upserts, deletes = changes
+    if upserts is None:
+        # Too old for the change journal: reload through /api/credentials, then sync from revision
+        return {"revision": revision, "full_resync": True}
+    return {"revision": revision, "full_resync": False, "upserts": upserts, "deletes": deletes}
+
+# Its own prefix, so names with slashes or named like the search and filter routes still resolve;
+# the client updates and deletes through it too
+@route('/api/credential/<path:service>')
+def get_credential(req, service):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    credential = pm_instance.get_credential(service)
+    if credential is None:
+        return {"error": "Credential not found"}, 404
+    return credential
+
+@route('/api/credentials', methods=['POST'])
+def add_credential(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    data = req.json or {}
+    service = data.get('service')
+    tags = data.get('tags')
+    fields = data.get('fields')
+
+    if not service or not tags or not fields:
+        logger.warning("Attempted to add credential with missing data.")
+        return {"success": False, "message": "Missing service, tags, or fields."}, 400
+    reason = credential_error(service, tags, fields)
+    if reason is not None:
+        logger.warning("Attempted to add invalid credential: %s", reason)
+        return {"success": False, "message": reason}, 400
+
+    if pm_instance.create_credential(service, tags, fields):
+        logger.info("Credential '%s' added successfully.", service)
+        return {"success": True}
+    else:
+        return {"success": False, "message": "Failed to add credential."}, 500
+
+@route('/api/credentials/batch', methods=['POST'])
+def batch_credentials(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    data = req.json or {}
+    operations = data.get('operations')
+
+    if not isinstance(operations, list) or not operations:
+        logger.warning("Attempted batch without operations.")
+        return {"success": False, "message": "Expected a non-empty list of operations."}, 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return {"success": False, "message": f"A batch may hold at most {MAX_BATCH_OPERATIONS} operations."}, 400
+
+    try:
+        committed = pm_instance.apply_batch(operations)
+    except BatchError as e:
+        logger.warning("Rejected batch: %s", e)
+        return {"success": False, "message": str(e)}, 400
+    except Exception as e:
+        logger.error("Failed to apply batch: %s", e)
+        committed = False
+
+    if committed:
+        logger.info("Batch of %d operations applied successfully.", len(operations))
+        return {"success": True, "applied": len(operations)}
+    else:
+        return {"success": False, "message": "Failed to apply batch."}, 500
+
+@route('/api/credential/<path:service>', methods=['DELETE'])
+@route('/api/credentials/<service>', methods=['DELETE'])
+def delete_credential(req, service):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    if pm_instance.delete_credential(service):
+        logger.info("Credential '%s' deleted successfully.", service)
+        return {"success": True}
+    else:
+        logger.error("Failed to delete credential '%s'.", service)
+        return {"success": False, "message": "Failed to delete credential."}, 500
+
+@route('/api/credential/<path:service>', methods=['PUT'])
+@route('/api/credentials/<service>', methods=['PUT'])
+def update_credential(req, service):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    data = req.json or {}
+    new_tags = data.get('tags')
+    new_fields = data.get('fields')
+
+    if not new_tags or not new_fields:
+        logger.warning("Attempted to update credential with missing tags or fields.")
+        return {"success": False, "message": "Missing tags or fields for update."}, 400
+    reason = credential_error(service, new_tags, new_fields)
+    if reason is not None:
+        logger.warning("Attempted to update credential '%s' with invalid data: %s", service, reason)
+        return {"success": False, "message": reason}, 400
+
+    if pm_instance.update_credential(service, new_tags, new_fields):
+        logger.info("Credential '%s' updated successfully.", service)
+        return {"success": True}
+    else:
+        logger.error("Failed to update credential '%s'.", service)
+        return {"success": False, "message": "Failed to update credential."}, 500
+
+@route('/api/credentials/search')
+def search_credentials(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    etag = vault_etag(pm_instance, req)
+    if etag is not None and req.if_none_match.contains(etag):
+        return not_modified(etag)
+    query = req.args.get('q', '')
+    if req.args.get('fuzzy', '').lower() in ('1', 'true', 'yes'):
+        # Best matches first, typos tolerated
+        limit = req.args.get('limit', 20, type=int)
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            return {"error": f"Limit must be between 1 and {MAX_PAGE_SIZE}."}, 400
+        return ApiResponse([service for service, _ in pm_instance.fuzzy_search_credentials(query, limit)], etag=etag)
+    results = pm_instance.search_credentials(query)
+    logger.info("Search for '%s' returned %d results.", query, len(results))
+    return ApiResponse(results, etag=etag)
+
+@route('/api/credentials/filter')
+def filter_credentials(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    tags = req.args.getlist('tag')
+    mode = req.args.get('mode', 'or')
+    offset = req.args.get('offset', 0, type=int)
+    limit = req.args.get('limit', 50, type=int)
+
+    if mode not in ('and', 'or'):
+        return {"error": "Mode must be 'and' or 'or'."}, 400
+    if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        return {"error": f"Offset must be non-negative and limit between 1 and {MAX_PAGE_SIZE}."}, 400
+
+    results, total = pm_instance.filter_credentials(tags, mode, offset, limit)
+    logger.info("Filter by %d tags returned %d of %d results.", len(tags), len(results), total)
+    return {"results": results, "total": total, "offset": offset, "limit": limit}
+
+@route('/api/tags')
+def get_tags(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    etag = vault_etag(pm_instance, req)
+    if etag is not None and req.if_none_match.contains(etag):
+        return not_modified(etag)
+    if 'top' in req.args:
+        top = req.args.get('top', type=int)
+        if top is None or top <= 0:
+            return {"error": "Top must be a positive integer."}, 400
+        # Most used first; a list, since JSON object order is not preserved
+        return ApiResponse([{"tag": tag, "count": count} for tag, count in pm_instance.get_top_tags(top)], etag=etag)
+    tags = pm_instance.get_all_tags()
+    logger.info("Retrieved %d unique tags.", len(tags))
+    return ApiResponse(tags, etag=etag)
+
+@route('/api/tags/suggest')
+def suggest_tags(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    prefix = req.args.get('prefix', '')
+    limit = req.args.get('limit', 10, type=int)
+    if not 0 < limit <= MAX_TAG_SUGGESTIONS:
+        return {"error": f"Limit must be between 1 and {MAX_TAG_SUGGESTIONS}."}, 400
+    return [{"tag": tag, "count": count} for tag, count in pm_instance.suggest_tags(prefix, limit)]
+
+@route('/api/password', methods=['POST'])
+def change_master_password(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    data = req.json or {}
+    new_password = data.get('new_password')
+    if not new_password:
+        return {"success": False, "message": "New password cannot be empty."}, 400
+
+    new_manager = crypto_pool.run(pm_instance.change_master_password, new_password)
+    if new_manager is None:
+        return {"success": False, "message": "Failed to change master password."}, 400
+    # Other sessions of the old password can no longer reach the vault
+    key_cache.evict_user(req.session['user_id'])
+    req.session['user_id'] = new_password
+    req.session['key_token'] = key_cache.put(new_password, new_manager.key)
+    logger.info("Master password changed successfully.")
+    return {"success": True}
+
+@route('/api/logout', methods=['POST'])
+def logout(req):
+    end_session(req.session)
+    logger.info("User logged out successfully.")
+    return {"success": True}
+
+@route('/api/export', methods=['POST'])
+def export_credentials(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+    data = req.json or {}
+    export_password = data.get('password')
+
+    items = pm_instance.snapshot_items()
+    if items is None:
+        logger.error("Failed to load credentials for export.")
+        return {"success": False, "message": "Failed to load credentials for export."}, 500
+
+    # Entries are serialised and sent one at a time instead of building the whole document
+    chunks = iter_json_export(items)
+    if export_password:
+        header = ExportHeader.new()
+        # Derived before the response starts, so a saturated pool can still answer 503
+        key = crypto_pool.run(header.derive_key, export_password)
+        body = iter_encrypted_export(chunks, header, key)
+        mimetype = 'application/octet-stream'
+        download_name = 'credentials.pmexport'
+    else:
+        body = (chunk.encode('utf-8') for chunk in chunks)
+        mimetype = 'application/json'
+        download_name = 'credentials.json'
+
+    logger.info("Streaming export of %d credentials (encrypted: %s).", len(items), bool(export_password))
+    return ApiResponse(stream=body, mimetype=mimetype,
+                       headers={"Content-Disposition": f"attachment; filename={download_name}"})
+
+@route('/api/import', methods=['POST'], uploads=True)
+def import_credentials(req):
+    pm_instance = get_password_manager(req)
+    if not pm_instance:
+        return NOT_LOGGED_IN
+
+    if 'file' not in req.files:
+        logger.warning("Import attempt without a file.")
+        return {"success": False, "message": "No file part in the request."}, 400
+
+    file = req.files['file']
+    if file.filename == '':
+        logger.warning("Import attempt with empty filename.")
+        return {"success": False, "message": "No selected file."}, 400
+
+    if file and file.filename.endswith(('.json', '.pmexport')):
+        stream = file.stream
+        if is_encrypted_export(stream):
+            export_password = req.form.get('password')
+            if not export_password:
+                logger.warning("Encrypted import attempt without a password.")
+                return {"success": False, "message": "This export is encrypted. A password is required."}, 400
+            try:
+                header = ExportHeader.read(stream)
+            except ExportDecryptionError as e:
+                logger.warning("Import failed: Could not read uploaded export header. Error: %s", e)
+                return {"success": False, "message": str(e)}, 400
+            # The header picks the PBKDF2 cost, so the derivation goes through the bounded pool
+            stream = DecryptedExportStream(stream, header, crypto_pool.run(header.derive_key, export_password))
+        try:
+            report = import_stream(
+                pm_instance,
+                stream,
+                batch_size=IMPORT_BATCH_SIZE,
+                max_buffer_bytes=IMPORT_MAX_BUFFER_BYTES,
+            )
+        except ExportDecryptionError as e:
+            logger.warning("Import failed: Could not decrypt uploaded export. Error: %s", e)
+            return {"success": False, "message": str(e)}, 400
+        except ImportFormatError as e:
+            logger.warning("Import failed: Invalid JSON format in uploaded file. Error: %s", e)
+            result = e.report.to_dict()
+            return {"success": False, "message": f"Invalid JSON format: {e}", **result}, 400
+        except Exception as e:
+            logger.error("An unexpected error occurred during import: %s", e)
+            return {"success": False, "message": f"An unexpected error occurred: {e}"}, 500
+
+        logger.info("Credentials imported and merged successfully.")
+        message = f"Imported {report.imported} credentials."
+        if report.skipped_count:
+            message += f" Skipped {report.skipped_count} invalid entries."
+        return {"success": True, "message": message, **report.to_dict()}
+    else:
+        logger.warning("Import attempt with non-JSON file or invalid filename.")
+        return {"success": False, "message": "Only JSON and encrypted .pmexport files are supported for import."}, 400
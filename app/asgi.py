@@ -0,0 +1,109 @@
+"""Async ASGI entry point serving the same API as app.main.
+
+Run with an ASGI server, e.g.:
+
+    uvicorn app.asgi:app --host 0.0.0.0 --port 5000
+
+The routes are the ones in app.api, shared with the WSGI app. Request
+bodies are read and responses sent on the event loop, while each route
+runs in a worker thread, so vault I/O and key derivation never block it
+and one process can keep many slow clients in flight. The key cache,
+crypto pool, metrics and session cookies are shared with the WSGI app.
+"""
+import asyncio
+from quart import Quart, render_template, request, jsonify, session, Response, g
+from app import api
+from app import main as wsgi
+from app.api import ApiRequest, ApiResponse
+from app.metrics import metrics, format_server_timing
+from app.crypto_pool import PoolSaturatedError
+import logging
+
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__, template_folder='templates', static_folder='static')
+app.secret_key = wsgi.app.secret_key
+app.config['SERVER_TIMING'] = wsgi.app.config['SERVER_TIMING']
+
+# Export bodies are produced in a worker thread in blocks of about this size
+EXPORT_BLOCK_SIZE = 64 * 1024
+
+run_sync = asyncio.to_thread
+
+def _next_block(chunks):
+    # Joins small chunks so each worker thread hop produces a useful amount of output
+    block = []
+    size = 0
+    for chunk in chunks:
+        block.append(chunk)
+        size += len(chunk)
+        if size >= EXPORT_BLOCK_SIZE:
+            break
+    return block
+
+async def _offloaded(chunks):
+    chunks = iter(chunks)
+    while True:
+        block = await run_sync(_next_block, chunks)
+        if not block:
+            return
+        yield b''.join(block)
+
+def to_response(result):
+    # The Quart response for what an app.api route returned
+    result = ApiResponse.of(result)
+    if result.stream is not None:
+        response = Response(_offloaded(result.stream), mimetype=result.mimetype)
+    elif result.body is None:
+        response = Response('')
+    else:
+        response = jsonify(result.body)
+    return result.finish(response)
+
+@app.errorhandler(PoolSaturatedError)
+async def crypto_pool_saturated(e):
+    logger.warning("Rejected request to %s: crypto pool saturated.", request.path)
+    return to_response(api.saturated(e))
+
+@app.before_request
+async def start_request_timing():
+    g.metrics_token = metrics.start_request()
+
+@app.after_request
+async def finish_request_timing(response):
+    token = g.pop('metrics_token', None)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    spans = metrics.finish_request(token, route, request.method)
+    if spans is not None and app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = format_server_timing(spans)
+    return response
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/metrics')
+async def prometheus_metrics():
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def view(handler, uploads):
+    async def run_route(**kwargs):
+        files = form = None
+        if uploads:
+            files = await request.files
+            form = await request.form
+        req = ApiRequest(
+            request.args, await request.get_json(silent=True), session, request.full_path, request.if_none_match,
+            files, form,
+        )
+        return to_response(await run_sync(handler, req, **kwargs))
+    return run_route
+
+views = {}
+for rule, methods, handler, uploads in api.ROUTES:
+    # One view per route function, so rules sharing it share the endpoint
+    if handler not in views:
+        views[handler] = view(handler, uploads)
+    app.add_url_rule(rule, handler.__name__, views[handler], methods=methods)
@@ -0,0 +1,63 @@
+from collections import deque
+import logging
+from app.vault_log import OP_BATCH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024
+
+class ChangeJournal:
+    """The latest changes of one vault as (revision, op, service) entries, oldest first.
+
+    It holds every change made after revision `start`. Older entries are
+    dropped once there are more than max_entries, and start moves up with
+    them; a client that last synced before start has to reload the vault.
+    Snapshots store it in their encrypted header and appended records
+    extend it, so it survives compaction and reloads.
+    """
+
+    def __init__(self, start=0, max_entries=DEFAULT_MAX_ENTRIES):
+        self.start = start
+        self.max_entries = max_entries
+        self._entries = deque()
+
+    def add(self, revision, op, service):
+        self._entries.append((revision, op, service))
+        while len(self._entries) > self.max_entries:
+            self.start = self._entries.popleft()[0]
+
+    def add_record(self, revision, record):
+        # One entry per credential a log record touches; a batch shares its revision
+        if record.get('op') == OP_BATCH:
+            for sub_record in record['records']:
+                self.add_record(revision, sub_record)
+        else:
+            self.add(revision, record['op'], record['service'])
+
+    def changes_since(self, revision):
+        """{service: last op} for the changes after revision, or None if the journal no longer reaches back that far."""
+        if revision < self.start:
+            return None
+        changes = {}
+        # Newest first, so only the changes asked for are visited
+        for entry_revision, op, service in reversed(self._entries):
+            if entry_revision <= revision:
+                break
+            changes.setdefault(service, op)
+        return changes
+
+    def to_dict(self):
+        return {'start': self.start, 'entries': [list(entry) for entry in self._entries]}
+
+    def restore(self, data, revision):
+        # From a snapshot header; snapshots written without a journal are complete only from their own revision on
+        self._entries.clear()
+        if data is None:
+            self.start = revision
+            return
+        self.start = data.get('start', revision)
+        for entry_revision, op, service in data.get('entries', ()):
+            self.add(entry_revision, op, service)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,76 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_RETRY_AFTER = 1
+
+class PoolSaturatedError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Crypto worker pool is saturated.")
+        self.retry_after = retry_after
+
+class CryptoPool:
+    """Bounded pool for CPU-heavy key derivation and bulk decryption.
+
+    At most max_workers jobs run at once and at most max_queue more wait.
+    Anything beyond that is rejected immediately with PoolSaturatedError
+    instead of piling up behind a login storm. The cryptography backend
+    releases the GIL while hashing, so threads are enough to keep cheap
+    requests responsive.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE, retry_after=DEFAULT_RETRY_AFTER):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crypto')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, func, *args, **kwargs):
+        """Runs func in the pool and waits for its result."""
+        return self._submit(func, args, kwargs).result()
+
+    async def run_async(self, func, *args, **kwargs):
+        """Like run(), but awaits the result instead of blocking the event loop."""
+        return await asyncio.wrap_future(self._submit(func, args, kwargs))
+
+    def _submit(self, func, args, kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            logger.warning("Crypto pool saturated. Rejecting job.")
+            raise PoolSaturatedError(self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            # The caller's context carries per-request state such as timing spans
+            future = self._executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+        except BaseException:
+            self._job_done(None)
+            raise
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "completed": self.completed, "rejected": self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,122 @@
+import base64
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PBKDF2 = 'pbkdf2-sha256'
+SCRYPT = 'scrypt'
+ARGON2ID = 'argon2id'
+
+# What a salt file without a header has always meant
+LEGACY_PARAMS = {'algorithm': PBKDF2, 'iterations': 100000}
+# Calibration never goes below these, however slow the host
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 2 ** 14
+MIN_ARGON2_ITERATIONS = 2
+
+# Salt files with KDF parameters start with this line, followed by one JSON line.
+# Anything else is a legacy salt file: 16 raw bytes for LEGACY_PARAMS.
+KDF_MAGIC = b'PMKDF1\n'
+TARGET_PARAMS_FILENAME = 'kdf.json'
+
+class KDFError(ValueError):
+    pass
+
+# The cryptography backends are imported on first use, so importing the app
+# (and starting the server) does not pay for algorithms nobody derives with.
+
+def _argon2id_class():
+    try:
+        from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+    except ImportError as e: # Argon2 needs cryptography 44 or newer
+        raise KDFError("Argon2id needs a newer version of the cryptography package.") from e
+    return Argon2id
+
+def derive(password, salt, params):
+    """Derives 32 key bytes from password with the algorithm and costs in params."""
+    algorithm = params.get('algorithm')
+    if algorithm == PBKDF2:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=params['iterations'])
+    elif algorithm == SCRYPT:
+        from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+        kdf = Scrypt(salt=salt, length=32, n=params['n'], r=params['r'], p=params['p'])
+    elif algorithm == ARGON2ID:
+        kdf = _argon2id_class()(salt=salt, length=32, iterations=params['iterations'], lanes=params['lanes'],
+                       memory_cost=params['memory_cost'])
+    else:
+        raise KDFError(f"Unknown key derivation algorithm: {algorithm!r}")
+    return kdf.derive(password.encode())
+
+def _encode_entry(salt, params):
+    return {'salt': base64.b64encode(salt).decode('ascii'), 'kdf': params}
+
+def _decode_entry(entry):
+    return base64.b64decode(entry['salt']), entry['kdf']
+
+def encode_salt_file(salt, params, pending=None):
+    """Salt file contents. pending is a (salt, params) pair a rehash is switching to."""
+    header = _encode_entry(salt, params)
+    if pending is not None:
+        header['pending'] = _encode_entry(*pending)
+    return KDF_MAGIC + json.dumps(header).encode() + b'\n'
+
+def decode_salt_file(data):
+    """Returns (salt, params, pending) where pending is None or a (salt, params) pair."""
+    if not data.startswith(KDF_MAGIC):
+        return data, dict(LEGACY_PARAMS), None
+    try:
+        header = json.loads(data[len(KDF_MAGIC):])
+        salt, params = _decode_entry(header)
+        pending = _decode_entry(header['pending']) if 'pending' in header else None
+    except (ValueError, KeyError, TypeError) as e:
+        raise KDFError("Salt file has an invalid header.") from e
+    return salt, params, pending
+
+def load_target_params():
+    """Parameters new and rehashed vaults get: instance/kdf.json if calibrated, else LEGACY_PARAMS."""
+    try:
+        with open(os.path.join('instance', TARGET_PARAMS_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict(LEGACY_PARAMS)
+    except (OSError, ValueError) as e:
+        logger.error("Ignoring unreadable KDF parameters file: %s", e)
+        return dict(LEGACY_PARAMS)
+
+def save_target_params(params):
+    with open(os.path.join('instance', TARGET_PARAMS_FILENAME), 'w') as f:
+        json.dump(params, f, indent=2)
+
+def _time_derive(params, clock):
+    start = clock()
+    derive('calibration password', b'\0' * 16, params)
+    return clock() - start
+
+def calibrate(algorithm, target_seconds, max_memory_mib=256, clock=time.perf_counter):
+    """Picks the costliest parameters of algorithm whose derivation on this host stays within target_seconds."""
+    if algorithm == PBKDF2:
+        # Cost is linear in the iteration count, so one measurement is enough to scale from
+        sample = 20000
+        elapsed = _time_derive({'algorithm': PBKDF2, 'iterations': sample}, clock)
+        iterations = int(sample * target_seconds / max(elapsed, 1e-6)) // 1000 * 1000
+        return {'algorithm': PBKDF2, 'iterations': max(MIN_PBKDF2_ITERATIONS, iterations)}
+    if algorithm == SCRYPT:
+        params = {'algorithm': SCRYPT, 'n': MIN_SCRYPT_N, 'r': 8, 'p': 1}
+        # Scrypt uses 128 * n * r bytes; double n while both time and memory allow
+        while (128 * params['n'] * 2 * params['r'] <= max_memory_mib * 1024 * 1024
+               and _time_derive(dict(params, n=params['n'] * 2), clock) <= target_seconds):
+            params['n'] *= 2
+        return params
+    if algorithm == ARGON2ID:
+        _argon2id_class()
+        params = {'algorithm': ARGON2ID, 'iterations': MIN_ARGON2_ITERATIONS, 'lanes': 1,
+                  'memory_cost': min(64, max_memory_mib) * 1024}
+        while _time_derive(dict(params, iterations=params['iterations'] + 1), clock) <= target_seconds:
+            params['iterations'] += 1
+        return params
+    raise KDFError(f"Unknown key derivation algorithm: {algorithm!r}")
@@ -0,0 +1,73 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_ENTRIES = 1024
+
+class KeyCache:
+    """In-memory map of session tokens to derived Fernet keys with TTL and LRU eviction."""
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, user_id, key):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._entries[token] = (user_id, key, self._clock() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                logger.info("Key cache full. Evicted least recently used entry.")
+        return token
+
+    def get(self, token, user_id):
+        with self._lock:
+            entry = self._entries.get(token) if token else None
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_user_id, key, expires_at = entry
+            if expires_at <= self._clock() or cached_user_id != user_id:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            # Sliding expiry: an active session keeps its key warm
+            self._entries[token] = (cached_user_id, key, self._clock() + self.ttl)
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return key
+
+    def evict(self, token):
+        with self._lock:
+            return self._entries.pop(token, None) is not None
+
+    def evict_user(self, user_id):
+        # Ends every session of a user, e.g. after their master password changed
+        with self._lock:
+            tokens = [token for token, entry in self._entries.items() if entry[0] == user_id]
+            for token in tokens:
+                del self._entries[token]
+            return len(tokens)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
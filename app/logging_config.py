@@ -0,0 +1,12 @@
+import logging
+import os
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def configure_logging(level=None):
+    """Configures the root logger for an entry point; LOG_LEVEL overrides the INFO default.
+
+    Library modules only call logging.getLogger, so this is the one place
+    handlers are set up. Later calls are no-ops, like logging.basicConfig.
+    """
+    logging.basicConfig(level=(level or os.environ.get('LOG_LEVEL', 'INFO')).upper(), format=LOG_FORMAT)
@@ -0,0 +1,136 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+_NOOP_SPAN = contextlib.nullcontext()
+# Spans recorded during the current request, for the Server-Timing header; None outside requests
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            position = bisect.bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", repr(bound)),))} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+class Metrics:
+    """Timing spans, per-route latency histograms and pluggable gauges, rendered for Prometheus.
+
+    Disabled by default; span() then hands back a shared no-op context manager.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stage_seconds = Histogram('pm_stage_seconds', 'Time spent in PasswordManager stages.')
+        self.request_seconds = Histogram('pm_request_seconds', 'HTTP request latency by route.')
+        self._collectors = []
+
+    def span(self, stage):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return self._timed(stage)
+
+    @contextlib.contextmanager
+    def _timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds.observe(elapsed, stage=stage)
+            spans = _request_spans.get()
+            if spans is not None:
+                spans.append((stage, elapsed))
+
+    def start_request(self):
+        # Returns a token for finish_request(); spans recorded until then are attributed to it
+        if not self.enabled:
+            return None
+        return time.perf_counter(), _request_spans.set([])
+
+    def finish_request(self, token, route, method):
+        """Records the request's latency and returns its [(stage, seconds)] spans plus the total."""
+        if token is None:
+            return None
+        start, context_token = token
+        elapsed = time.perf_counter() - start
+        spans = _request_spans.get()
+        _request_spans.reset(context_token)
+        self.request_seconds.observe(elapsed, route=route, method=method)
+        return (spans or []) + [('total', elapsed)]
+
+    def register_collector(self, collector):
+        """collector() returns (name, type, help, [(labels dict, value)]) tuples rendered on every scrape."""
+        self._collectors.append(collector)
+
+    def render_prometheus(self):
+        lines = self.stage_seconds.render() + self.request_seconds.render()
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {value}')
+        return '\n'.join(lines) + '\n'
+
+def cache_collector(prefix, description, cache):
+    # Exposes a cache's stats() counters and hit ratio
+    def collect():
+        stats = cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        return [
+            (f'{prefix}_hits_total', 'counter', f'{description} hits.', [({}, stats['hits'])]),
+            (f'{prefix}_misses_total', 'counter', f'{description} misses.', [({}, stats['misses'])]),
+            (f'{prefix}_hit_ratio', 'gauge', f'{description} hit ratio since start.',
+             [({}, stats['hits'] / lookups if lookups else 0.0)]),
+            (f'{prefix}_entries', 'gauge', f'{description} entries.', [({}, stats['entries'])]),
+        ]
+    return collect
+
+def format_server_timing(spans):
+    # Repeated stages (e.g. several decrypts) are summed into one entry
+    totals = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in totals.items())
+
+metrics = Metrics()
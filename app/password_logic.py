@@ -1,37 +1,302 @@
 import json
 import os
 import hashlib
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import hmac
 import base64
-from difflib import get_close_matches
+import heapq
+import functools
+import tempfile
+import contextlib
 import logging
+from app.vault_cache import DEFAULT_MAX_BYTES, VaultCache, file_signature
+from app.search_index import SearchIndex, TagCounts
+from app.search_cache import SearchCache
+from app.change_journal import ChangeJournal
+from app.streaming_import import validate_entry
+from app.vault_lock import get_vault_lock
+from app.user_registry import DEFAULT_SHARD_DEPTH, get_registry, shard_paths
+from app.kdf import LEGACY_PARAMS, decode_salt_file, derive, encode_salt_file, load_target_params
+from app.metrics import metrics
+from app.vault_log import (
+    FORMAT_ENVELOPE, FORMAT_LEGACY, FORMAT_LOG, OP_BATCH, OP_DELETE, SealedFields, apply_record, batch_record,
+    delete_record, encode_envelope_record, encode_snapshot, generate_data_key, is_log, make_fernet, read_log, record_error,
+    rewrap_log, upsert_record,
+)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Decrypted vaults shared by every PasswordManager in this process
+vault_cache = VaultCache(max_bytes=int(os.environ.get('VAULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
+
+def _copy_value(value):
+    if isinstance(value, SealedFields):
+        return value.open()
+    return value.copy() if isinstance(value, (dict, list)) else value
+
+def _copy_vault(credentials):
+    # Two-level copy: callers may mutate entries and their tags/fields without touching the cache.
+    # Sealed fields are decrypted here, so only entries actually handed out pay for it.
+    copied = {}
+    for service, data in credentials.items():
+        if isinstance(data, dict):
+            data = {name: _copy_value(value) for name, value in data.items()}
+        copied[service] = data
+    return copied
+
+def _listing_item(service, data, include):
+    # The service name plus the requested keys of its entry, as listings and syncs return them
+    item = {'service': service}
+    for name in include:
+        if isinstance(data, dict) and name in data:
+            item[name] = _copy_value(data[name])
+    return item
+
+class _OpenedItems:
+    # (service, data) pairs whose fields are decrypted one entry at a time while iterating
+    def __init__(self, items):
+        self._items = items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        for service, data in self._items:
+            yield service, _copy_vault({service: data})[service]
+
+class BatchError(ValueError):
+    pass
+
+def credential_error(service, tags, fields):
+    """Why a credential cannot be stored as given, or None if it can."""
+    if not isinstance(service, str) or not service:
+        return "Service name must be a non-empty string."
+    # The same shape imported entries must have
+    return validate_entry({'tags': tags, 'fields': fields})
+
+_DELETED = object()
+
+class CredentialBatch:
+    """Stages upserts, patches and deletes against a vault snapshot.
+
+    Nothing touches the vault until PasswordManager.batch() commits every
+    staged change as a single log record.
+    """
+
+    def __init__(self, credentials):
+        self._credentials = credentials
+        self._staged = {}
+        self.records = []
+        self.committed = False
+
+    def get(self, service):
+        data = self._staged.get(service, self._credentials.get(service))
+        return None if data is _DELETED else data
+
+    def upsert(self, service, tags, fields):
+        if not service or not tags or not fields:
+            raise BatchError("Upsert needs a service, tags and fields.")
+        reason = credential_error(service, tags, fields)
+        if reason is not None:
+            raise BatchError(reason)
+        self._stage(upsert_record(service, {'tags': tags, 'fields': fields}))
+
+    def patch(self, service, tags=None, fields=None):
+        # Replaces tags and merges fields; a field set to None is removed
+        data = self.get(service)
+        if data is None:
+            raise BatchError(f"Cannot patch non-existent credential '{service}'.")
+        data = dict(data)
+        if tags is not None:
+            if not tags:
+                raise BatchError("Patched tags cannot be empty.")
+            if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+                raise BatchError("Tags must be a non-empty list of strings.")
+            data['tags'] = tags
+        if fields is not None:
+            if not isinstance(fields, dict) or not all(value is None or isinstance(value, str) for value in fields.values()):
+                raise BatchError("Patched fields must be an object of string or null values.")
+            merged = _copy_value(data.get('fields', {}))
+            for name, value in fields.items():
+                if value is None:
+                    merged.pop(name, None)
+                else:
+                    merged[name] = value
+            if not merged:
+                raise BatchError("Patched fields cannot be empty.")
+            data['fields'] = merged
+        self._stage(upsert_record(service, data))
+
+    def delete(self, service):
+        if self.get(service) is None:
+            raise BatchError(f"Cannot delete non-existent credential '{service}'.")
+        self._stage(delete_record(service))
+
+    def apply(self, operation):
+        """Stages one operation given as a dict, e.g. from the batch API."""
+        if not isinstance(operation, dict):
+            raise BatchError("Each operation must be an object.")
+        op = operation.get('op')
+        service = operation.get('service')
+        if not isinstance(service, str) or not service:
+            raise BatchError("Each operation needs a service name.")
+        if op == 'upsert':
+            self.upsert(service, operation.get('tags'), operation.get('fields'))
+        elif op == 'patch':
+            self.patch(service, operation.get('tags'), operation.get('fields'))
+        elif op == 'delete':
+            self.delete(service)
+        else:
+            raise BatchError(f"Unknown operation {op!r}.")
+
+    def _stage(self, record):
+        self.records.append(record)
+        self._staged[record['service']] = record['data'] if 'data' in record else _DELETED
+
+def _with_vault_lock(exclusive):
+    # Writers exclude other threads and processes; readers only other threads of this process
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with get_vault_lock(self.filename)(exclusive):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# Compact once the log holds this many records and at least twice as many as live credentials
+COMPACTION_MIN_RECORDS = 64
+# A cached search result for a prefix of the query is filtered instead of searching the index, up to this size
+REFINE_MAX_RESULTS = 2000
+# Memory a cached vault holds per credential on top of its file's bytes: the decoded index entry, its
+# n-gram, tag and word postings and its place in the sorted listings. Measured with tracemalloc at 10k-50k entries.
+ESTIMATED_BYTES_PER_CREDENTIAL = 4096
+
+def _refined_search(state, query_lower):
+    # Typing one more character narrows the cached results of the shorter query down; None without a small enough one
+    cached_prefix = state.search_cache.longest_prefix('search', query_lower)
+    if cached_prefix is None or len(cached_prefix[1]) > REFINE_MAX_RESULTS:
+        return None
+    return state.index.refine(cached_prefix[1], query_lower)
+
+class VaultState:
+    def __init__(self, credentials, file_format, record_count=0, data_key=None, tag_counts=None, revision=0, journal=None,
+                 index=None):
+        self.credentials = credentials
+        # Maintained by apply(), so tag listings never rescan the vault
+        self.tag_counts = tag_counts if tag_counts is not None else TagCounts.from_credentials(credentials)
+        # Recent search results of this vault, dropped on every change
+        self.search_cache = SearchCache()
+        self.file_format = file_format
+        self.record_count = record_count
+        # Bumped by every write that changes the credentials, and persisted with them
+        self.revision = revision
+        # What changed in recent revisions, for clients that sync deltas
+        self.journal = journal if journal is not None else ChangeJournal(revision)
+        # Envelope vaults only: the key every record and fields blob is encrypted under
+        self.data_key = data_key
+        # Envelope vaults only: file bytes up to the end of the last complete record, where appends go
+        self.log_length = None
+        # Built with the state rather than on the first search, which runs under the reader lock; maintained by apply()
+        if index is None:
+            with metrics.span('index'):
+                index = SearchIndex.build(credentials)
+        self.index = index
+
+    def apply(self, record):
+        self.search_cache.clear()
+        if record.get('op') == OP_BATCH:
+            for sub_record in record['records']:
+                self.apply(sub_record)
+            return
+        service = record['service']
+        if service in self.credentials:
+            self.index.remove(service, self.credentials[service])
+        apply_record(self.credentials, record, self.tag_counts)
+        if service in self.credentials:
+            self.index.add(service, self.credentials[service])
+
+    def estimated_size(self, file_size):
+        # What the vault cache counts against its bound; the encrypted tokens kept in memory are about the file's size
+        return file_size + len(self.credentials) * ESTIMATED_BYTES_PER_CREDENTIAL
+
+    def needs_compaction(self):
+        return self.record_count >= COMPACTION_MIN_RECORDS and self.record_count > 2 * len(self.credentials)
+
 class PasswordManager:
     def __init__(self, user_id):
-        hashed_user_id = hashlib.sha256(user_id.encode()).hexdigest()
-        self.filename = os.path.join('instance', f'{hashed_user_id}_credentials.json')
-        self.salt_filename = os.path.join('instance', f'{hashed_user_id}_salt.key')
+        self.user_key = hashlib.sha256(user_id.encode()).hexdigest()
+        entry = get_registry().lookup(self.user_key)
+        self.registered = entry is not None
+        if entry is not None:
+            self.filename = entry['vault']
+            self.salt_filename = entry['salt']
+        else:
+            # Users created before the registry keep their flat files and are registered on login
+            self.filename = os.path.join('instance', f'{self.user_key}_credentials.json')
+            self.salt_filename = os.path.join('instance', f'{self.user_key}_salt.key')
         self.key = None
+        # Set with the key, from the salt file's header
+        self.kdf_params = None
+        self.rehashed = False
+        # The last state this instance loaded or wrote, with the file signature and key it belongs to
+        self._loaded = None
 
-    def derive_key(self, password, salt):
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+    def exists(self):
+        """Whether this user has a vault. Registered users are answered without touching the instance directory."""
+        return self.registered or os.path.exists(self.salt_filename)
+
+    def register(self):
+        get_registry().register(self.user_key, self.filename, self.salt_filename, self.kdf_params)
+        self.registered = True
+
+    def registry_row(self):
+        return self.user_key, self.filename, self.salt_filename, self.kdf_params
+
+    def provision(self, shard_depth=DEFAULT_SHARD_DEPTH, register=True):
+        """Creates a new user's salt and empty vault in a sharded directory, without deriving a key.
+
+        Returns False if the user already exists or the files could not be
+        created. Bulk onboarding passes register=False and registers all
+        users at once with UserRegistry.register_many(registry_row() ...).
+        """
+        if self.exists():
+            logger.warning("Cannot provision user: a vault already exists at %s.", self.filename)
+            return False
+        self.filename, self.salt_filename = shard_paths(self.user_key, shard_depth)
+        return self._create_files(register) is not None
+
+    def _create_files(self, register=True):
+        # Salt, empty credentials file and registry entry of a new user; returns the salt or None
+        try:
+            os.makedirs(os.path.dirname(self.salt_filename), exist_ok=True)
+        except OSError as e:
+            logger.error("Error creating vault directory for %s: %s", self.salt_filename, e)
+            return None
+        salt = self.generate_salt()
+        if salt is None:
+            return None
+        try:
+            with open(self.filename, 'wb') as f:
+                pass
+            logger.info("Empty credentials file created at %s", self.filename)
+        except IOError as e:
+            logger.error("Error creating empty credentials file at %s: %s", self.filename, e)
+            return None
+        if register:
+            self.register()
+        return salt
+
+    def derive_key(self, password, salt, params=None):
+        with metrics.span('kdf'):
+            return base64.urlsafe_b64encode(derive(password, salt, params or LEGACY_PARAMS))
 
     def generate_salt(self):
+        # New salts are stored with the configured KDF parameters in the file's header
         try:
             salt = os.urandom(16)
+            params = load_target_params()
             with open(self.salt_filename, 'wb') as f:
-                f.write(salt)
+                f.write(encode_salt_file(salt, params))
+            self.kdf_params = params
             logger.info("Salt generated and saved to %s", self.salt_filename)
             return salt
         except IOError as e:
@@ -39,39 +304,143 @@ class PasswordManager:
             return None
 
     def load_salt(self):
+        loaded = self.load_kdf()
+        return None if loaded is None else loaded[0]
+
+    def load_kdf(self):
+        """Returns (salt, params, pending) from the salt file, or None if it cannot be read."""
         try:
             with open(self.salt_filename, 'rb') as f:
-                salt = f.read()
+                loaded = decode_salt_file(f.read())
             logger.info("Salt loaded from %s", self.salt_filename)
-            return salt
-        except IOError as e:
+            return loaded
+        except (IOError, ValueError) as e:
             logger.error("Error loading salt from %s: %s", self.salt_filename, e)
             return None
 
     def set_key(self, password):
-        if not os.path.exists(self.salt_filename):
-            salt = self.generate_salt()
+        if not self.exists():
+            # Also creates an empty credentials file
+            salt = self._create_files()
             if salt is None: # Handle error in salt generation
                 self.key = None
                 return
-            # Also create an empty credentials file
-            try:
-                with open(self.filename, 'wb') as f:
-                    pass
-                logger.info("Empty credentials file created at %s", self.filename)
-            except IOError as e:
-                logger.error("Error creating empty credentials file at %s: %s", self.filename, e)
-                self.key = None
-                return
         else:
-            salt = self.load_salt()
-            if salt is None: # Handle error in salt loading
+            loaded = self.load_kdf()
+            if loaded is None: # Handle error in salt loading
                 self.key = None
                 return
-        self.key = self.derive_key(password, salt)
+            salt, self.kdf_params, _ = loaded
+        self.key = self.derive_key(password, salt, self.kdf_params)
         logger.info("Encryption key set.")
 
+    def unlock(self, password):
+        """Derives the key and decrypts the vault once, leaving it cached. False if the password does not open it.
+
+        Vaults whose KDF parameters differ from the configured ones are rehashed on the way.
+        """
+        self.rehashed = False
+        self.set_key(password)
+        if self.key is None:
+            return False
+        if not self.can_decrypt() and not self._finish_pending_rehash(password):
+            return False
+        if not self.registered:
+            self.register()
+        target = load_target_params()
+        if self.kdf_params != target:
+            self.rehashed = self._rehash(password, target)
+        return True
+
+    @_with_vault_lock(exclusive=True)
+    def _rehash(self, password, params):
+        # Re-wraps the data key under a key derived with params; no credential is re-encrypted
+        state = self._load_state()
+        if state is None:
+            return False
+        try:
+            if state.file_format != FORMAT_ENVELOPE:
+                if not self._write_vault(dict(state.credentials), revision=state.revision):
+                    return False
+                state = self._load_state()
+            old_salt, old_params, _ = decode_salt_file(self._read_file(self.salt_filename))
+            salt = os.urandom(16)
+            key = self.derive_key(password, salt, params)
+            with metrics.span('encrypt'):
+                data = rewrap_log(self._read_file(self.filename), make_fernet(self.key), make_fernet(key))
+            # The new salt is only pending until the vault is swapped, so a crash in between loses nothing
+            with metrics.span('write'):
+                self._replace_file(encode_salt_file(old_salt, old_params, pending=(salt, params)), self.salt_filename)
+                signature = self._replace_file(data)
+                self._replace_file(encode_salt_file(salt, params), self.salt_filename)
+        except Exception as e:
+            self._forget_state()
+            logger.error("Error rehashing %s: %s", self.filename, e)
+            return False
+        self.key = key
+        self.kdf_params = params
+        state.log_length = len(data)
+        self._cache_state(signature, state, state.estimated_size(len(data)))
+        get_registry().update_kdf(self.user_key, params)
+        logger.info("Rehashed %s with %s key derivation.", self.filename, params.get('algorithm'))
+        return True
+
+    @_with_vault_lock(exclusive=True)
+    def _finish_pending_rehash(self, password):
+        # A rehash interrupted after swapping the vault left its new salt pending
+        loaded = self.load_kdf()
+        if loaded is None or loaded[2] is None:
+            return False
+        salt, params = loaded[2]
+        key = self.derive_key(password, salt, params)
+        previous_key, self.key = self.key, key
+        if self._load_state() is None:
+            self.key = previous_key
+            return False
+        try:
+            self._replace_file(encode_salt_file(salt, params), self.salt_filename)
+        except OSError as e:
+            logger.error("Error completing rehash of %s: %s", self.salt_filename, e)
+        self.kdf_params = params
+        logger.info("Completed an interrupted rehash of %s.", self.filename)
+        return True
+
+    @staticmethod
+    def _read_file(filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    @_with_vault_lock(exclusive=False)
+    def can_decrypt(self):
+        """Whether the key opens the vault. The vault stays cached, so reads that follow are served from memory."""
+        return self._load_state() is not None
+
+    @_with_vault_lock(exclusive=False)
     def load_credentials(self):
+        credentials = self._load_vault()
+        if credentials is None:
+            return None
+        try:
+            return _copy_vault(credentials)
+        except Exception as e:
+            logger.error("Failed to decrypt credential fields in %s: %s", self.filename, e)
+            return None
+
+    def _load_vault(self):
+        # Returns the shared cached vault; callers must not mutate it
+        state = self._load_state()
+        return None if state is None else state.credentials
+
+    def _cache_state(self, signature, state, size):
+        # Also kept on the instance, so a request loads a vault the shared cache evicted only once
+        self._loaded = (signature, self.key, state)
+        vault_cache.put(self.filename, self.key, signature, state, size)
+
+    def _forget_state(self):
+        self._loaded = None
+        vault_cache.invalidate(self.filename)
+
+    def _load_state(self):
         if not self.key:
             logger.warning("Attempted to load credentials without a key being set.")
             return None
@@ -79,106 +448,508 @@ class PasswordManager:
         if os.path.exists(self.filename):
             try:
                 with open(self.filename, 'rb') as f:
-                    encrypted_data = f.read()
+                    stat_result = os.fstat(f.fileno())
+                    signature = file_signature(stat_result)
+                    cached = vault_cache.get(self.filename, self.key, signature)
+                    if cached is not None:
+                        return cached
+                    if self._loaded is not None:
+                        loaded_signature, loaded_key, loaded = self._loaded
+                        if loaded_signature == signature and hmac.compare_digest(loaded_key, self.key):
+                            return loaded
+                    with metrics.span('read'):
+                        encrypted_data = f.read()
+                fernet = make_fernet(self.key)
                 if not encrypted_data:
                     logger.info("Credentials file %s is empty.", self.filename)
-                    return {}
-                fernet = Fernet(self.key)
-                decrypted_data = fernet.decrypt(encrypted_data)
-                logger.info("Credentials loaded and decrypted from %s.", self.filename)
-                return json.loads(decrypted_data)
+                    state = VaultState({}, FORMAT_LEGACY)
+                elif is_log(encrypted_data):
+                    tag_counts = TagCounts()
+                    journal = ChangeJournal()
+                    credentials, record_count, data_key, revision, log_length = read_log(
+                        fernet, encrypted_data, tag_counts, journal)
+                    logger.info("Credentials replayed from %d log records in %s.", record_count, self.filename)
+                    file_format = FORMAT_LOG if data_key is None else FORMAT_ENVELOPE
+                    state = VaultState(credentials, file_format, record_count, data_key, tag_counts, revision, journal)
+                    state.log_length = log_length
+                else:
+                    with metrics.span('decrypt'):
+                        decrypted_data = fernet.decrypt(encrypted_data)
+                    logger.info("Credentials loaded and decrypted from legacy vault %s.", self.filename)
+                    with metrics.span('parse'):
+                        state = VaultState(json.loads(decrypted_data), FORMAT_LEGACY)
+                self._cache_state(signature, state, state.estimated_size(stat_result.st_size))
+                return state
             except Exception as e:
                 logger.error("Decryption failed for %s. Wrong master password or corrupted data. Error: %s", self.filename, e)
                 return None
+        if not self.exists():
+            # No salt and no registry entry: the vault moved away, e.g. its master password was changed
+            # by another process. Never start an empty one, or writes would land in a vault nobody can open.
+            logger.error("No user owns %s. Refusing to start an empty vault.", self.filename)
+            return None
         logger.info("Credentials file %s does not exist. Returning empty credentials.", self.filename)
-        return {}
+        return VaultState({}, FORMAT_LEGACY)
 
+    @_with_vault_lock(exclusive=True)
     def save_credentials(self, credentials):
         if not self.key:
             logger.warning("Attempted to save credentials without a key being set.")
             return False
+        previous = self._load_state()
+        revision = previous.revision + 1 if previous is not None else 1
+        return self._write_vault(_copy_vault(credentials), revision=revision)
 
+    @_with_vault_lock(exclusive=True)
+    def compact(self):
+        """Rewrites the vault as a compacted log. Also migrates legacy and version 1 vaults."""
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for compaction.")
+            return False
+        return self._write_vault(dict(state.credentials), state.data_key, state.revision, state.journal, state.index)
+
+    def _write_vault(self, credentials, data_key=None, revision=0, journal=None, index=None):
+        # Takes ownership of credentials, which becomes the cached vault. Sealed fields are
+        # copied as they are, so they need the data key they were sealed under. Without
+        # a journal to carry over, syncing clients have to reload from this revision on.
+        # A search index passed in must already cover credentials, as a compacted state's does.
+        if data_key is None:
+            data_key = generate_data_key()
+        if journal is None:
+            journal = ChangeJournal(revision)
         try:
-            fernet = Fernet(self.key)
-            encrypted_data = fernet.encrypt(json.dumps(credentials, indent=4).encode())
-            with open(self.filename, 'wb') as f:
-                f.write(encrypted_data)
+            # Built before the file is replaced, so credentials it cannot hold leave the old vault in place
+            state = VaultState(credentials, FORMAT_ENVELOPE, len(credentials), data_key, revision=revision, journal=journal,
+                               index=index)
+            with metrics.span('encrypt'):
+                encrypted_data = encode_snapshot(make_fernet(self.key), data_key, credentials, revision, journal)
+            with metrics.span('write'):
+                signature = self._replace_file(encrypted_data)
+            state.log_length = len(encrypted_data)
+            self._cache_state(signature, state, state.estimated_size(len(encrypted_data)))
             logger.info("Credentials saved and encrypted to %s.", self.filename)
             return True
         except IOError as e:
+            self._forget_state()
             logger.error("Error saving credentials to %s: %s", self.filename, e)
             return False
         except Exception as e:
+            self._forget_state()
             logger.error("Error encrypting or saving credentials to %s: %s", self.filename, e)
             return False
 
+    def _replace_file(self, data, filename=None):
+        # Write a sibling temp file and swap it in, so a crash never leaves a half-written vault
+        filename = filename or self.filename
+        directory = os.path.dirname(filename) or '.'
+        fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                signature = file_signature(os.fstat(f.fileno()))
+            os.replace(temp_filename, filename)
+        except BaseException:
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
+            raise
+        if hasattr(os, 'O_DIRECTORY'):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        return signature
+
+    def _append_records(self, state, records):
+        # Persists mutations by appending to the log, so each one costs O(1) instead of O(vault size)
+        for record in records:
+            # Checked before anything is written, so a record that cannot be replayed never reaches the file
+            reason = record_error(record)
+            if reason is not None:
+                logger.error("Refusing to write invalid record to %s: %s", self.filename, reason)
+                return False
+        if state.file_format != FORMAT_ENVELOPE:
+            # Legacy, empty and version 1 vaults are migrated to the envelope log format on their first write
+            credentials = dict(state.credentials)
+            for record in records:
+                apply_record(credentials, record)
+                state.journal.add_record(state.revision + 1, record)
+            logger.info("Migrating %s to the envelope log vault format.", self.filename)
+            return self._write_vault(credentials, revision=state.revision + 1, journal=state.journal)
+
+        try:
+            fernet = make_fernet(state.data_key)
+            with metrics.span('encrypt'):
+                encrypted_data = b''.join(encode_envelope_record(fernet, record, state.revision + position)
+                                          for position, record in enumerate(records, 1))
+            with metrics.span('write'), open(self.filename, 'r+b') as f:
+                if os.fstat(f.fileno()).st_size != state.log_length:
+                    # Cut off a record torn by a crash, or the new ones would continue its line
+                    logger.warning("Truncating incomplete trailing record of %s.", self.filename)
+                    f.truncate(state.log_length)
+                f.seek(state.log_length)
+                f.write(encrypted_data)
+                f.flush()
+                os.fsync(f.fileno())
+                stat_result = os.fstat(f.fileno())
+        except Exception as e:
+            self._forget_state()
+            logger.error("Error appending to credentials log %s: %s", self.filename, e)
+            return False
+
+        for position, record in enumerate(records, 1):
+            state.apply(record)
+            state.journal.add_record(state.revision + position, record)
+        state.record_count += len(records)
+        state.revision += len(records)
+        state.log_length += len(encrypted_data)
+        self._cache_state(file_signature(stat_result), state, state.estimated_size(stat_result.st_size))
+        logger.info("Appended %d records to %s.", len(records), self.filename)
+
+        if state.needs_compaction():
+            logger.info("Compacting %s (%d records for %d credentials).", self.filename, state.record_count, len(state.credentials))
+            return self._write_vault(dict(state.credentials), state.data_key, state.revision, state.journal, state.index)
+        return True
+
+    @_with_vault_lock(exclusive=True)
+    def change_master_password(self, new_password):
+        """Moves the vault to new_password and returns its PasswordManager, or None on failure.
+
+        Only the data key is re-wrapped under the new master key; records and
+        fields blobs are copied byte for byte, so the cost does not depend on
+        how many credentials the vault holds.
+        """
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for changing the master password.")
+            return None
+        if state.file_format != FORMAT_ENVELOPE:
+            if not self._write_vault(dict(state.credentials), revision=state.revision):
+                return None
+            state = self._load_state()
+
+        new_manager = PasswordManager(new_password)
+        if new_manager.user_key == self.user_key or new_manager.exists():
+            logger.warning("Cannot change master password: a vault for the new password already exists.")
+            return None
+        new_manager.filename, new_manager.salt_filename = shard_paths(new_manager.user_key)
+        try:
+            os.makedirs(os.path.dirname(new_manager.filename), exist_ok=True)
+        except OSError as e:
+            logger.error("Error creating vault directory for %s: %s", new_manager.filename, e)
+            return None
+        with get_vault_lock(new_manager.filename)(exclusive=True):
+            try:
+                salt = os.urandom(16)
+                new_manager.kdf_params = load_target_params()
+                new_manager.key = new_manager.derive_key(new_password, salt, new_manager.kdf_params)
+                with metrics.span('encrypt'):
+                    data = rewrap_log(self._read_file(self.filename), make_fernet(self.key), make_fernet(new_manager.key))
+                # The salt goes last: until it exists, the new password finds no user
+                with metrics.span('write'):
+                    signature = new_manager._replace_file(data)
+                    new_manager._replace_file(encode_salt_file(salt, new_manager.kdf_params), new_manager.salt_filename)
+            except Exception as e:
+                logger.error("Error re-wrapping vault %s: %s", self.filename, e)
+                for filename in (new_manager.filename, new_manager.salt_filename):
+                    with contextlib.suppress(OSError):
+                        os.remove(filename)
+                return None
+            state.log_length = len(data)
+            new_manager._cache_state(signature, state, state.estimated_size(len(data)))
+            new_manager.register()
+
+        get_registry().remove(self.user_key)
+        self._forget_state()
+        for filename in (self.filename, self.salt_filename):
+            with contextlib.suppress(OSError):
+                os.remove(filename)
+        logger.info("Master password changed; vault moved to %s.", new_manager.filename)
+        return new_manager
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Yields a CredentialBatch and persists its changes once, all or nothing, on exit.
+
+        An exception inside the block discards every staged change. Check
+        batch.committed afterwards to learn whether the write succeeded.
+        """
+        with get_vault_lock(self.filename)(exclusive=True):
+            state = self._load_state()
+            if state is None:
+                logger.error("Failed to load credentials for batch.")
+                raise RuntimeError("Failed to load credentials for batch.")
+            batch = CredentialBatch(state.credentials)
+            yield batch
+            if not batch.records:
+                batch.committed = True
+                return
+            batch.committed = self._append_records(state, [batch_record(batch.records)])
+            if batch.committed:
+                logger.info("Batch of %d operations applied.", len(batch.records))
+            else:
+                logger.error("Failed to persist batch of %d operations.", len(batch.records))
+
+    def apply_batch(self, operations):
+        with self.batch() as batch:
+            for position, operation in enumerate(operations):
+                try:
+                    batch.apply(operation)
+                except BatchError as e:
+                    raise BatchError(f"Operation {position}: {e}") from e
+        return batch.committed
+
+    @_with_vault_lock(exclusive=True)
     def create_credential(self, service, tags, fields):
-        credentials = self.load_credentials()
-        if credentials is None:
+        state = self._load_state()
+        if state is None:
             logger.error("Failed to load credentials for creating new credential.")
             return False
 
         if not service or not tags or not fields:
             logger.warning("Attempted to create credential with missing service, tags, or fields.")
             return False
+        reason = credential_error(service, tags, fields)
+        if reason is not None:
+            logger.warning("Rejected new credential: %s", reason)
+            return False
 
-        credentials[service] = {
+        logger.info("Credential '%s' created.", service)
+        return self._append_records(state, [upsert_record(service, {
             'tags': tags,
             'fields': fields
-        }
-        logger.info("Credential '%s' created.", service)
-        return self.save_credentials(credentials)
+        })])
 
+    @_with_vault_lock(exclusive=True)
     def delete_credential(self, service):
-        credentials = self.load_credentials()
-        if credentials is None:
+        state = self._load_state()
+        if state is None:
             logger.error("Failed to load credentials for deleting credential.")
             return False
 
-        if service in credentials:
-            del credentials[service]
+        if service in state.credentials:
             logger.info("Credential '%s' deleted.", service)
-            return self.save_credentials(credentials)
+            return self._append_records(state, [delete_record(service)])
         logger.warning("Attempted to delete non-existent credential '%s'.", service)
         return False
 
+    @_with_vault_lock(exclusive=True)
     def update_credential(self, service, new_tags, new_fields):
-        credentials = self.load_credentials()
-        if credentials is None:
+        state = self._load_state()
+        if state is None:
             logger.error("Failed to load credentials for updating credential.")
             return False
 
-        if service in credentials:
-            credentials[service]['tags'] = new_tags
-            credentials[service]['fields'] = new_fields
+        reason = credential_error(service, new_tags, new_fields)
+        if reason is not None:
+            logger.warning("Rejected update of credential '%s': %s", service, reason)
+            return False
+        if service in state.credentials:
             logger.info("Credential '%s' updated.", service)
-            return self.save_credentials(credentials)
+            data = dict(state.credentials[service], tags=new_tags, fields=new_fields)
+            return self._append_records(state, [upsert_record(service, data)])
         logger.warning("Attempted to update non-existent credential '%s'.", service)
         return False
 
+    @_with_vault_lock(exclusive=False)
+    def vault_version(self):
+        """An opaque string that changes whenever the credentials do, or None if the vault cannot be read.
+
+        Comes from the cached vault state, so while the vault is cached it costs
+        a stat call and no decryption. It is keyed with the vault's own key,
+        so it says nothing about the vault and cannot match another vault's.
+        """
+        state = self._load_state()
+        if state is None:
+            return None
+        secret = state.data_key or self.key
+        return hmac.new(secret, str(state.revision).encode(), hashlib.sha256).hexdigest()[:32]
+
+    @_with_vault_lock(exclusive=False)
     def search_credentials(self, query):
-        credentials = self.load_credentials()
-        if credentials is None:
+        state = self._load_state()
+        if state is None:
             logger.error("Failed to load credentials for searching.")
             return []
-        
+
         query_lower = query.lower()
-        results = []
-        for service, data in credentials.items():
-            if query_lower in service.lower() or any(query_lower in tag.lower() for tag in data.get('tags', [])):
-                results.append(service)
+        results = state.search_cache.get(('search', query_lower))
+        if results is None:
+            with metrics.span('search'):
+                results = _refined_search(state, query_lower)
+                if results is None:
+                    results = state.index.search(query_lower)
+            state.search_cache.put(('search', query_lower), results)
         logger.info("Search for '%s' returned %d results.", query, len(results))
-        return results
+        return list(results)
 
-    def get_all_tags(self):
-        credentials = self.load_credentials()
+    @_with_vault_lock(exclusive=False)
+    def fuzzy_search_credentials(self, query, limit=20):
+        """The limit best matches of query as (service, score) pairs; typos in names and tags are tolerated."""
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for searching.")
+            return []
+        query_lower = query.lower()
+        key = ('fuzzy', query_lower, limit)
+        results = state.search_cache.get(key)
+        if results is None:
+            with metrics.span('search'):
+                # The substring matches, when they are cheap to get, are cached for the next keystroke to refine
+                matches = state.search_cache.get(('search', query_lower))
+                if matches is None:
+                    matches = _refined_search(state, query_lower)
+                    if matches is None:
+                        matches = state.index.narrow_search(query_lower, REFINE_MAX_RESULTS)
+                    if matches is not None:
+                        state.search_cache.put(('search', query_lower), matches)
+                results = state.index.fuzzy_search(query_lower, limit, matches)
+            state.search_cache.put(key, results)
+        logger.info("Fuzzy search returned %d results.", len(results))
+        return list(results)
+
+    @_with_vault_lock(exclusive=False)
+    def snapshot_items(self):
+        """Returns a sized iterable of (service, data) pairs that later writes will not disturb.
+
+        Each entry is copied, with its fields decrypted, only when iteration reaches it.
+        """
+        credentials = self._load_vault()
+        if credentials is None:
+            logger.error("Failed to load credentials for snapshot.")
+            return None
+        # Fields are decrypted as the caller iterates, not up front
+        return _OpenedItems(list(credentials.items()))
+
+    @_with_vault_lock(exclusive=False)
+    def get_credential(self, service):
+        credentials = self._load_vault()
         if credentials is None:
+            logger.error("Failed to load credentials for fetching credential.")
+            return None
+        data = credentials.get(service)
+        if data is None:
+            logger.warning("Attempted to fetch non-existent credential '%s'.", service)
+            return None
+        try:
+            return _copy_vault({service: data})[service]
+        except Exception as e:
+            logger.error("Failed to decrypt fields of credential '%s': %s", service, e)
+            return None
+
+    @_with_vault_lock(exclusive=False)
+    def list_credentials(self, after=None, limit=50, include=('tags',)):
+        """Returns (items, last_service) for one page of credentials in name order.
+
+        Each item holds the service name plus the requested keys of its entry.
+        last_service is None on the final page and otherwise continues the listing.
+        """
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for listing.")
+            return None, None
+
+        services = state.index.page_after(after, limit)
+        has_more = len(services) > limit
+        services = services[:limit]
+        items = [_listing_item(service, state.credentials[service], include) for service in services]
+        logger.info("Listed %d credentials.", len(items))
+        return items, services[-1] if has_more else None
+
+    @_with_vault_lock(exclusive=False)
+    def changes_since(self, since, include=('tags',)):
+        """Returns (revision, upserts, deletes) describing what changed after revision since.
+
+        upserts holds listing items (see list_credentials) of credentials added
+        or changed, and deletes the names of credentials removed; both are
+        None when since is None or the change journal does not reach back to
+        it, and the client must reload the whole vault. Returns None if the
+        vault cannot be read. The cost depends on the number of changes, not
+        on the size of the vault.
+        """
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for syncing.")
+            return None
+        # A client ahead of the vault saw a history that has since been replaced
+        changes = None if since is None or since > state.revision else state.journal.changes_since(since)
+        if changes is None:
+            logger.info("Sync from revision %s needs a full reload (journal starts at %d).", since, state.journal.start)
+            return state.revision, None, None
+        upserts = []
+        deletes = []
+        for service in sorted(changes):
+            data = state.credentials.get(service)
+            if changes[service] == OP_DELETE or data is None:
+                deletes.append(service)
+            else:
+                upserts.append(_listing_item(service, data, include))
+        logger.info("Sync from revision %d returned %d changes.", since, len(changes))
+        return state.revision, upserts, deletes
+
+    @_with_vault_lock(exclusive=False)
+    def filter_credentials(self, tags, mode='or', offset=0, limit=50):
+        """Returns (page, total) for credentials carrying all ('and') or any ('or') of tags.
+
+        The page lists {'service', 'matches'} dicts, most matching tags first.
+        """
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for filtering.")
+            return [], 0
+
+        tags = list(dict.fromkeys(tags))
+        postings = [state.index.services_with_tag(tag) for tag in tags]
+        if not postings:
+            matches = {}
+        elif mode == 'and':
+            postings.sort(key=len)
+            matched = set(postings[0])
+            for posting in postings[1:]:
+                matched &= posting
+            matches = dict.fromkeys(matched, len(tags))
+        elif mode == 'or':
+            matches = {}
+            for posting in postings:
+                for service in posting:
+                    matches[service] = matches.get(service, 0) + 1
+        else:
+            raise ValueError(f"Unknown filter mode: {mode!r}")
+
+        # Only the requested page is ordered; the rest of the matches are never sorted
+        ranked = heapq.nsmallest(offset + limit, matches.items(), key=lambda item: (-item[1], item[0].lower(), item[0]))
+        page = [{'service': service, 'matches': count} for service, count in ranked[offset:]]
+        logger.info("Filter by %d tags (%s) matched %d credentials.", len(tags), mode, len(matches))
+        return page, len(matches)
+
+    @_with_vault_lock(exclusive=False)
+    def get_all_tags(self):
+        state = self._load_state()
+        if state is None:
             logger.error("Failed to load credentials for getting all tags.")
             return {}
-        
-        tag_counts = {}
-        for data in credentials.values():
-            for tag in data.get('tags', []):
-                tag_counts[tag] = tag_counts.get(tag, 0) + 1
-        logger.info("Retrieved %d unique tags.", len(tag_counts))
-        return tag_counts
\ No newline at end of file
+        logger.info("Retrieved %d unique tags.", len(state.tag_counts))
+        return dict(state.tag_counts.counts)
+
+    @_with_vault_lock(exclusive=False)
+    def suggest_tags(self, prefix, limit=10):
+        """Autocomplete for tags: (tag, count) pairs starting with prefix, then close matches."""
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for suggesting tags.")
+            return []
+        return state.index.suggest_tags(prefix, limit)
+
+    @_with_vault_lock(exclusive=False)
+    def get_top_tags(self, n):
+        """The n most used tags as (tag, count) pairs, most used first."""
+        state = self._load_state()
+        if state is None:
+            logger.error("Failed to load credentials for getting top tags.")
+            return []
+        return state.tag_counts.top(n)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 64
+
+class SearchCache:
+    """LRU cache of recent search results for one vault.
+
+    It lives on the vault's cached state, so it is per user and goes away
+    with the state; the state clears it whenever a record is applied.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def longest_prefix(self, kind, query):
+        """The cached (prefix, value) of kind for the longest proper prefix of query, or None.
+
+        Lookups here do not count as hits or misses.
+        """
+        with self._lock:
+            for end in range(len(query) - 1, 0, -1):
+                value = self._entries.get((kind, query[:end]))
+                if value is not None:
+                    self._entries.move_to_end((kind, query[:end]))
+                    return query[:end], value
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
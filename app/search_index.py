@@ -0,0 +1,530 @@
+import bisect
+import heapq
+import itertools
+import logging
+import re
+from collections import Counter
+from difflib import get_close_matches
+
+logger = logging.getLogger(__name__)
+
+# Substrings of these lengths are indexed; longer queries intersect their trigrams
+GRAM_SIZES = (2, 3)
+# Tags sharing the most n-grams with a prefix that are compared with difflib, at most
+MAX_FUZZY_CANDIDATES = 64
+# Prefixes matching more tags than this are answered by walking the tags from most used down
+PREFIX_SCAN_LIMIT = 256
+# Sorts after every character that can follow a prefix
+_PREFIX_END = '\U0010ffff'
+
+def _grams(text):
+    grams = set()
+    for size in GRAM_SIZES:
+        for i in range(len(text) - size + 1):
+            grams.add(text[i:i + size])
+    return grams
+
+def _query_grams(query):
+    if len(query) <= max(GRAM_SIZES):
+        return {query}
+    size = max(GRAM_SIZES)
+    return {query[i:i + size] for i in range(len(query) - size + 1)}
+
+# Typo tolerance: words of up to this length may be this many edits away, longer ones two
+FUZZY_ONE_EDIT_MAX_LENGTH = 5
+# Words shorter than this are only matched exactly
+FUZZY_MIN_LENGTH = 3
+# Trigrams shared by more words than this are too common to narrow the candidates down
+FUZZY_STOP_GRAM_WORDS = 2000
+# Query words matching more keys than this only score keys found through the other words
+FUZZY_COMMON_WORD_KEYS = 2000
+# Keys matching only some words of a longer query need at least this mean similarity
+FUZZY_MIN_SIMILARITY = 0.5
+# Typo matches rank below exact ones, and matches through a tag below matches in the name
+FUZZY_WEIGHT = 0.9
+TAG_MATCH_WEIGHT = 0.95
+
+_WORD = re.compile(r'[^\W\d_]+|\d+')
+
+def _words(text_lower):
+    return set(_WORD.findall(text_lower))
+
+def _word_grams(word):
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance of a and b, or limit + 1 once it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+def entry_tags(data):
+    # Only string tags; anything else an older version let in is ignored rather than breaking the vault
+    tags = data.get('tags', []) if isinstance(data, dict) else []
+    return [tag for tag in tags if isinstance(tag, str)] if isinstance(tags, list) else []
+
+class TagCounts:
+    """How many credentials use each tag, kept up to date as records are applied."""
+
+    def __init__(self):
+        self.counts = {}
+
+    @classmethod
+    def from_credentials(cls, credentials):
+        tag_counts = cls()
+        for data in credentials.values():
+            tag_counts.add(data)
+        return tag_counts
+
+    def add(self, data):
+        for tag in entry_tags(data):
+            self.counts[tag] = self.counts.get(tag, 0) + 1
+
+    def remove(self, data):
+        for tag in entry_tags(data):
+            count = self.counts.get(tag, 0) - 1
+            if count > 0:
+                self.counts[tag] = count
+            else:
+                self.counts.pop(tag, None)
+
+    def top(self, n):
+        # (tag, count) pairs, most used first and ties by name, in O(tags * log n)
+        return heapq.nsmallest(n, self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def __len__(self):
+        return len(self.counts)
+
+class _GramIndex:
+    """Maps n-grams of lowercased keys to the keys containing them."""
+
+    def __init__(self):
+        self.postings = {}
+        self.keys = {}
+
+    def add(self, key):
+        lowered = key.lower()
+        self.keys[key] = lowered
+        for gram in _grams(lowered):
+            self.postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        lowered = self.keys.pop(key, None)
+        if lowered is None:
+            return
+        for gram in _grams(lowered):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self.postings[gram]
+
+    def find(self, query_lower):
+        if len(query_lower) < min(GRAM_SIZES):
+            # Too short to index, every key has to be checked
+            return {key for key, lowered in self.keys.items() if query_lower in lowered}
+        postings = []
+        for gram in _query_grams(query_lower):
+            posting = self.postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return candidates
+        if len(query_lower) <= max(GRAM_SIZES):
+            return candidates
+        # Sharing every trigram does not guarantee a contiguous match
+        return {key for key in candidates if query_lower in self.keys[key]}
+
+class _WordIndex:
+    """Words of keys, with a trigram index over the distinct words, for typo-tolerant lookups.
+
+    Candidates are the words sharing the most trigrams with a query word
+    plus those starting with the same two letters, so only a bounded number
+    of edit distances is computed per query.
+    """
+
+    def __init__(self):
+        self.word_keys = {}
+        self.gram_words = {}
+        self.ordered_words = []
+
+    @classmethod
+    def build(cls, keys):
+        index = cls()
+        for key in keys:
+            index._add_words(key)
+        index.ordered_words = sorted(index.word_keys)
+        return index
+
+    def add(self, key):
+        for word in self._add_words(key):
+            bisect.insort(self.ordered_words, word)
+
+    def _add_words(self, key):
+        # Returns the words no other key had
+        new_words = []
+        for word in _words(key.lower()):
+            keys = self.word_keys.get(word)
+            if keys is None:
+                keys = self.word_keys[word] = set()
+                new_words.append(word)
+                # Numbers only ever match exactly, so they need no trigrams
+                if not word.isdigit():
+                    for gram in _word_grams(word):
+                        self.gram_words.setdefault(gram, set()).add(word)
+            keys.add(key)
+        return new_words
+
+    def remove(self, key):
+        for word in _words(key.lower()):
+            keys = self.word_keys.get(word)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.word_keys[word]
+                _remove_sorted(self.ordered_words, word)
+                for gram in () if word.isdigit() else _word_grams(word):
+                    words = self.gram_words.get(gram)
+                    if words is not None:
+                        words.discard(word)
+                        if not words:
+                            del self.gram_words[gram]
+
+    def _candidates(self, query_word):
+        shared = Counter()
+        for gram in _word_grams(query_word):
+            words = self.gram_words.get(gram)
+            if words and len(words) <= FUZZY_STOP_GRAM_WORDS:
+                shared.update(words)
+        candidates = {word for word, _ in shared.most_common(MAX_FUZZY_CANDIDATES)}
+        # Short words with swapped letters share few trigrams, but rarely a different start
+        start = bisect.bisect_left(self.ordered_words, query_word[:2])
+        end = bisect.bisect_left(self.ordered_words, query_word[:2] + _PREFIX_END)
+        candidates.update(self.ordered_words[start:min(end, start + MAX_FUZZY_CANDIDATES)])
+        return candidates
+
+    def similar_words(self, query_word):
+        """(word, similarity) pairs for query_word itself and words within the allowed edits of it or of their start."""
+        matches = [(query_word, 1.0)] if query_word in self.word_keys else []
+        if len(query_word) < FUZZY_MIN_LENGTH or query_word.isdigit():
+            return matches
+        limit = 1 if len(query_word) <= FUZZY_ONE_EDIT_MAX_LENGTH else 2
+        for word in self._candidates(query_word):
+            distance = edit_distance(query_word, word, limit)
+            similarity = 1 - distance / max(len(query_word), len(word))
+            if len(word) > len(query_word):
+                # A query still being typed is compared with the start of the word, at a small discount
+                prefix_distance = edit_distance(query_word, word[:len(query_word)], limit)
+                if prefix_distance < distance:
+                    distance = prefix_distance
+                    similarity = 0.95 * (1 - distance / len(query_word))
+            if word != query_word and distance <= limit:
+                matches.append((word, similarity))
+        return matches
+
+    def find(self, query_lower):
+        """(similarity, keys) groups of keys within a few typos of the query, best first.
+
+        With several query words a key scores the mean of its best similarity per
+        word, and keys below FUZZY_MIN_SIMILARITY are dropped.
+        """
+        query_words = _words(query_lower)
+        if len(query_words) == 1:
+            (query_word,) = query_words
+            return sorted(((similarity, self.word_keys[word]) for word, similarity in self.similar_words(query_word)),
+                          key=lambda group: -group[0])
+        matches = [self.similar_words(query_word) for query_word in query_words]
+        sizes = [sum(len(self.word_keys[word]) for word, _ in words) for words in matches]
+        order = sorted(range(len(matches)), key=lambda i: sizes[i])
+        # When every word is common, only the least common one gathers candidates
+        selective = [i for i in order if sizes[i] <= FUZZY_COMMON_WORD_KEYS] or order[:1]
+        common = [dict(matches[i]) for i in order if i not in selective]
+        totals = Counter()
+        for i in selective:
+            best = {}
+            for word, similarity in matches[i]:
+                for key in self.word_keys[word]:
+                    if similarity > best.get(key, 0):
+                        best[key] = similarity
+            totals.update(best)
+        # Words found in a large share of keys only add to the scores of keys found through the others
+        for key in totals:
+            key_words = _words(key.lower())
+            for words in common:
+                totals[key] += max((similarity for word, similarity in words.items() if word in key_words), default=0)
+        groups = {}
+        for key, total in totals.items():
+            similarity = total / len(query_words)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                groups.setdefault(similarity, set()).add(key)
+        return sorted(groups.items(), key=lambda group: -group[0])
+
+def _remove_sorted(items, item):
+    position = bisect.bisect_left(items, item)
+    if position < len(items) and items[position] == item:
+        del items[position]
+
+class SearchIndex:
+    """In-memory n-gram index over service names plus a tag to services posting map.
+
+    It is rebuilt from the decrypted vault and never written to disk, so it
+    needs no encryption of its own. Entries whose service name is not a
+    string cannot be searched for and are left out.
+    """
+
+    def __init__(self):
+        self.services = _GramIndex()
+        self.tag_names = _GramIndex()
+        # Word indexes for fuzzy_search()
+        self.service_words = _WordIndex()
+        self.tag_words = _WordIndex()
+        self.tag_postings = {}
+        # (lowercased name, name) pairs in listing order, for cursor pagination
+        self.ordered_services = []
+        # The same for tags, and (-count, tag) pairs most used first, for suggest_tags()
+        self.ordered_tags = []
+        self.tags_by_count = []
+
+    @classmethod
+    def build(cls, credentials):
+        index = cls()
+        for service, data in credentials.items():
+            if isinstance(service, str):
+                index._add_postings(service, data)
+        index.ordered_services = sorted((service.lower(), service) for service in index.services.keys)
+        index.ordered_tags = sorted((tag.lower(), tag) for tag in index.tag_postings)
+        index.tags_by_count = sorted((-len(posting), tag) for tag, posting in index.tag_postings.items())
+        # Built here rather than on the first fuzzy query, which would otherwise pay for it
+        index.service_words = _WordIndex.build(index.services.keys)
+        index.tag_words = _WordIndex.build(index.tag_postings)
+        logger.info("Search index built for %d credentials.", len(credentials))
+        return index
+
+    def add(self, service, data):
+        if not isinstance(service, str):
+            return
+        bisect.insort(self.ordered_services, (service.lower(), service))
+        self._add_postings(service, data)
+        self.service_words.add(service)
+        for tag in set(entry_tags(data)):
+            count = len(self.tag_postings[tag])
+            if count == 1:
+                bisect.insort(self.ordered_tags, (tag.lower(), tag))
+                self.tag_words.add(tag)
+            else:
+                _remove_sorted(self.tags_by_count, (1 - count, tag))
+            bisect.insort(self.tags_by_count, (-count, tag))
+
+    def _add_postings(self, service, data):
+        self.services.add(service)
+        for tag in entry_tags(data):
+            posting = self.tag_postings.get(tag)
+            if posting is None:
+                posting = self.tag_postings[tag] = set()
+                self.tag_names.add(tag)
+            posting.add(service)
+
+    def remove(self, service, data):
+        if not isinstance(service, str):
+            return
+        self.services.remove(service)
+        self.service_words.remove(service)
+        _remove_sorted(self.ordered_services, (service.lower(), service))
+        for tag in set(entry_tags(data)):
+            posting = self.tag_postings.get(tag)
+            if posting is None or service not in posting:
+                continue
+            _remove_sorted(self.tags_by_count, (-len(posting), tag))
+            posting.discard(service)
+            if posting:
+                bisect.insort(self.tags_by_count, (-len(posting), tag))
+            else:
+                del self.tag_postings[tag]
+                self.tag_names.remove(tag)
+                self.tag_words.remove(tag)
+                _remove_sorted(self.ordered_tags, (tag.lower(), tag))
+
+    def page_after(self, service, limit):
+        # Services listed after the given one (from the start when None); one past the page signals more
+        start = 0 if service is None else bisect.bisect_right(self.ordered_services, (service.lower(), service))
+        return [name for _, name in self.ordered_services[start:start + limit + 1]]
+
+    def services_with_tag(self, tag):
+        return self.tag_postings.get(tag, set())
+
+    def search(self, query):
+        query_lower = query.lower()
+        if not query_lower:
+            return sorted(self.services.keys, key=str.lower)
+        results = self.services.find(query_lower)
+        for tag in self.tag_names.find(query_lower):
+            results |= self.tag_postings[tag]
+        return sorted(results, key=str.lower)
+
+    def refine(self, candidates, query):
+        """The candidates matched by query, given they are the results of searching a substring of it.
+
+        Every match of query also matches its substrings, so this filters
+        instead of searching again and keeps the order of candidates.
+        """
+        query_lower = query.lower()
+        tags = self.tag_names.find(query_lower)
+        return [
+            service for service in candidates
+            if query_lower in self.services.keys[service] or any(service in self.tag_postings[tag] for tag in tags)
+        ]
+
+    def narrow_search(self, query, max_results):
+        """search(query) if the postings show it matches at most max_results services, else None.
+
+        Broad queries are not collected at all, so this stays cheap on every keystroke.
+        """
+        query_lower = query.lower()
+        if len(query_lower) < min(GRAM_SIZES):
+            return None
+        tags = self.tag_names.find(query_lower)
+        bound = min(len(self.services.postings.get(gram, ())) for gram in _query_grams(query_lower))
+        bound += sum(len(self.tag_postings[tag]) for tag in tags)
+        if bound > max_results:
+            return None
+        results = self.services.find(query_lower)
+        for tag in tags:
+            results |= self.tag_postings[tag]
+        return sorted(results, key=str.lower)
+
+    def fuzzy_search(self, query, limit, matches=None):
+        """Up to limit (service, score) pairs, best first, tolerating typos in names and tags.
+
+        Names starting with the query score 1.2 and other substring matches
+        1.0; services tagged with a matching tag score a little less. Typo
+        matches score by edit distance below all of those. Ties are listed
+        by name, and tiers that cannot reach the top limit are never computed.
+        matches, the result of search(query) if the caller has it, saves
+        looking the substring matches up again.
+        """
+        query_lower = query.lower()
+        results = []
+        chosen = set()
+        tiers = self._fuzzy_tiers(query_lower, limit) if matches is None else self._refined_tiers(query_lower, matches)
+        for score, services in tiers:
+            needed = limit - len(results)
+            if isinstance(services, set) and len(services) * needed <= len(self.ordered_services):
+                picked = heapq.nsmallest(needed, services - chosen, key=str.lower)
+            else:
+                if isinstance(services, set):
+                    # Large sets are dense in the name order, so walking it finds the first few sooner
+                    members = services
+                    services = (service for _, service in self.ordered_services if service in members)
+                # Already in name order, and possibly lazy
+                picked = list(itertools.islice((service for service in services if service not in chosen), needed))
+            results.extend((service, score) for service in picked)
+            chosen.update(picked)
+            if len(results) >= limit:
+                break
+        return results
+
+    def _refined_tiers(self, query_lower, matches):
+        # The same tiers as _fuzzy_tiers, with the substring matches split out of matches in their name order
+        keys = self.services.keys
+        yield 1.2, [service for service in matches if keys[service].startswith(query_lower)]
+        if not query_lower:
+            return
+        yield 1.0, [service for service in matches if query_lower in keys[service]]
+        # Whatever matched without the name did through a tag
+        yield TAG_MATCH_WEIGHT, matches
+        yield from self._typo_tiers(query_lower)
+
+    def _fuzzy_tiers(self, query_lower, limit):
+        # Yields (score, services) in descending score order; services is a set or in name order
+        ordered = self.ordered_services
+        start = bisect.bisect_left(ordered, (query_lower,))
+        end = bisect.bisect_left(ordered, (query_lower + _PREFIX_END,))
+        yield 1.2, (ordered[i][1] for i in range(start, end))
+        if not query_lower:
+            return
+        grams = _query_grams(query_lower) if len(query_lower) >= min(GRAM_SIZES) else ()
+        smallest = min((len(self.services.postings.get(gram, ())) for gram in grams), default=len(ordered))
+        if smallest * smallest > limit * len(ordered):
+            # So many names match that walking them in order reaches the first few sooner than collecting all
+            yield 1.0, (service for lowered, service in ordered if query_lower in lowered)
+        else:
+            yield 1.0, self.services.find(query_lower)
+        tagged = set()
+        for tag in self.tag_names.find(query_lower):
+            tagged |= self.tag_postings[tag]
+        yield TAG_MATCH_WEIGHT, tagged
+        yield from self._typo_tiers(query_lower)
+
+    def _typo_tiers(self, query_lower):
+        tiers = {}
+        for similarity, services in self.service_words.find(query_lower):
+            tiers.setdefault(similarity * FUZZY_WEIGHT, set()).update(services)
+        for similarity, tags in self.tag_words.find(query_lower):
+            score = similarity * FUZZY_WEIGHT * TAG_MATCH_WEIGHT
+            for tag in tags:
+                tiers.setdefault(score, set()).update(self.tag_postings[tag])
+        for score in sorted(tiers, reverse=True):
+            yield score, tiers[score]
+
+    def suggest_tags(self, prefix, limit):
+        """Up to limit (tag, count) pairs for autocomplete, most used first.
+
+        Tags starting with prefix (case-insensitively) come first. If there
+        are fewer than limit of them, close matches from the tags sharing the
+        most n-grams with the prefix fill the rest, so typos still suggest.
+        """
+        prefix_lower = prefix.lower()
+        ranked = self._tags_with_prefix(prefix_lower, limit)
+        if len(ranked) < limit and len(prefix_lower) >= min(GRAM_SIZES):
+            # Every prefix match is already in ranked
+            ranked += self._close_tags(prefix_lower, limit - len(ranked), set(ranked))
+        return [(tag, len(self.tag_postings[tag])) for tag in ranked]
+
+    def _tags_with_prefix(self, prefix_lower, limit):
+        start = bisect.bisect_left(self.ordered_tags, (prefix_lower,))
+        end = bisect.bisect_left(self.ordered_tags, (prefix_lower + _PREFIX_END,))
+        if end - start <= max(PREFIX_SCAN_LIMIT, limit):
+            matches = (tag for _, tag in self.ordered_tags[start:end])
+            return heapq.nsmallest(limit, matches, key=lambda tag: (-len(self.tag_postings[tag]), tag))
+        # Common prefixes match most tags, so the most used ones turn up early
+        ranked = []
+        for _, tag in self.tags_by_count:
+            if tag.lower().startswith(prefix_lower):
+                ranked.append(tag)
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    def _close_tags(self, prefix_lower, limit, exclude):
+        shared = Counter()
+        for gram in _grams(prefix_lower):
+            shared.update(self.tag_names.postings.get(gram, ()))
+        nearby = [tag for tag, _ in shared.most_common(MAX_FUZZY_CANDIDATES)]
+        # Transposed letters share few n-grams, so the most used tags with the same first letter are tried too
+        nearby += self._tags_with_prefix(prefix_lower[0], MAX_FUZZY_CANDIDATES)
+        candidates = {}
+        for tag in set(nearby) - exclude:
+            # Compared against the start of each tag, the part a prefix stands for
+            candidates.setdefault(self.tag_names.keys[tag][:len(prefix_lower) + 1], []).append(tag)
+        close = get_close_matches(prefix_lower, list(candidates), n=limit, cutoff=0.6)
+        tags = [tag for key in close for tag in candidates[key]]
+        return sorted(tags, key=lambda tag: (-len(self.tag_postings[tag]), tag))[:limit]
@@ -0,0 +1,129 @@
+import json
+import zlib
+import logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Plaintexts other than plain JSON start with TAG and one byte holding the
+# serializer id (high nibble) and compression id (low nibble). JSON never
+# starts with a NUL byte, so vaults written before tagging still decode.
+TAG = b'\x00'
+
+JSON = 'json'
+BINARY = 'binary'
+SERIALIZER_IDS = {JSON: 0, BINARY: 1}
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+COMPRESSION_IDS = {None: 0, ZLIB: 1, ZSTD: 2}
+
+# Records smaller than this are never worth compressing
+MIN_COMPRESS_BYTES = 128
+
+class SerializationError(ValueError):
+    pass
+
+def pack_binary(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+def unpack_binary(data):
+    if msgpack is None:
+        raise SerializationError("This vault holds binary records; install the msgpack package to read it.")
+    try:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except ValueError as e:
+        raise SerializationError("Truncated or invalid binary payload.") from e
+
+def _compress(compression, data):
+    if compression == ZLIB:
+        return zlib.compress(data, 6)
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+def _decompress(compression_id, data):
+    if compression_id == COMPRESSION_IDS[ZLIB]:
+        return zlib.decompress(data)
+    if compression_id == COMPRESSION_IDS[ZSTD]:
+        if zstandard is None:
+            raise SerializationError("This vault is zstd-compressed; install the zstandard package to read it.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise SerializationError(f"Unknown compression id {compression_id}")
+
+class PayloadCodec:
+    """Turns vault records into the plaintext that gets encrypted, and back.
+
+    Writing uses the configured serializer and compression; reading detects
+    them from each plaintext, so vaults may mix formats and a configuration
+    change never needs a migration.
+    """
+
+    def __init__(self, serializer=JSON, compression=None):
+        self.configure(serializer, compression)
+
+    def configure(self, serializer=JSON, compression=None):
+        if serializer not in SERIALIZER_IDS:
+            raise SerializationError(f"Unknown serializer: {serializer!r}")
+        if compression not in COMPRESSION_IDS:
+            raise SerializationError(f"Unknown compression: {compression!r}")
+        if serializer == BINARY and msgpack is None:
+            raise SerializationError("The binary format needs the msgpack package.")
+        if compression == ZSTD and zstandard is None:
+            raise SerializationError("zstd compression needs the zstandard package.")
+        self.serializer = serializer
+        self.compression = compression
+
+    def configure_from_spec(self, spec):
+        """Configures from a 'serializer[+compression]' string such as 'binary+zlib'."""
+        serializer, _, compression = spec.strip().lower().partition('+')
+        self.configure(serializer or JSON, compression or None)
+
+    @property
+    def spec(self):
+        return self.serializer + (f'+{self.compression}' if self.compression else '')
+
+    def dumps(self, obj):
+        if self.serializer == BINARY:
+            data = pack_binary(obj)
+        else:
+            data = json.dumps(obj, separators=(',', ':')).encode()
+        compression = self.compression
+        if compression and len(data) >= MIN_COMPRESS_BYTES:
+            compressed = _compress(compression, data)
+            # Kept only when it pays for itself; the tag says which it was
+            if len(compressed) < len(data):
+                data = compressed
+            else:
+                compression = None
+        else:
+            compression = None
+        if self.serializer == JSON and compression is None:
+            return data
+        return TAG + bytes([SERIALIZER_IDS[self.serializer] << 4 | COMPRESSION_IDS[compression]]) + data
+
+def loads(data):
+    """Decodes a plaintext written by any PayloadCodec configuration, or plain JSON."""
+    if not data.startswith(TAG):
+        return json.loads(data)
+    if len(data) < 2:
+        raise SerializationError("Truncated payload tag.")
+    serializer_id, compression_id = data[1] >> 4, data[1] & 0x0f
+    body = data[2:]
+    if compression_id:
+        body = _decompress(compression_id, body)
+    if serializer_id == SERIALIZER_IDS[JSON]:
+        return json.loads(body)
+    if serializer_id == SERIALIZER_IDS[BINARY]:
+        return unpack_binary(body)
+    raise SerializationError(f"Unknown serializer id {serializer_id}")
+
+# Used for every vault write in this process; app.main configures it from VAULT_PAYLOAD_FORMAT
+payload_codec = PayloadCodec()
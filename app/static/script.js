@@ -25,6 +25,32 @@ document.addEventListener('DOMContentLoaded', () => {
             closeOnSelect: false
         }
     });
+
+    // Tag autocomplete asks the server for the best matches of the text being typed,
+    // instead of downloading every tag; a newer keystroke cancels the older request
+    let tagSuggestController = null;
+    tagify.on('input', async (e) => {
+        const prefix = e.detail.value;
+        if (tagSuggestController) {
+            tagSuggestController.abort();
+        }
+        tagSuggestController = new AbortController();
+        try {
+            const response = await fetch(`/api/tags/suggest?prefix=${encodeURIComponent(prefix)}`,
+                                         { signal: tagSuggestController.signal });
+            if (!response.ok) {
+                return;
+            }
+            const suggestions = await response.json();
+            // searchBy keeps close matches that do not contain the typed text in Tagify's dropdown
+            tagify.settings.whitelist = suggestions.map(entry => ({ value: entry.tag, searchBy: prefix }));
+            tagify.dropdown.show(prefix);
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                throw error;
+            }
+        }
+    });
     const addButton = document.getElementById('add-button');
     const addEditTitle = document.getElementById('add-edit-title');
 
@@ -47,6 +73,37 @@ document.addEventListener('DOMContentLoaded', () => {
 
     let currentServiceToUpdate = null;
 
+    const FILTER_PAGE_SIZE = 500;
+    const LIST_PAGE_SIZE = 200;
+    const SEARCH_RESULT_LIMIT = 20;
+
+    // The last body and ETag of each vault-derived GET. While the vault is unchanged the server
+    // answers with 304 and no body, and callers can tell from `changed` that there is nothing to redraw.
+    const VALIDATED_RESPONSES_MAX = 100;
+    const validatedResponses = new Map();
+
+    async function fetchValidated(url, options = {}) {
+        const cached = validatedResponses.get(url);
+        const headers = cached ? { 'If-None-Match': cached.etag } : {};
+        const response = await fetch(url, { ...options, headers, cache: 'no-store' });
+        if (response.status === 304 && cached) {
+            return { ok: true, data: cached.data, changed: false };
+        }
+        if (!response.ok) {
+            return { ok: false, data: null, changed: true };
+        }
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        validatedResponses.delete(url);
+        if (etag) {
+            validatedResponses.set(url, { etag, data });
+            if (validatedResponses.size > VALIDATED_RESPONSES_MAX) {
+                validatedResponses.delete(validatedResponses.keys().next().value);
+            }
+        }
+        return { ok: true, data, changed: true };
+    }
+
     // Function to display messages to the user
     function displayMessage(message, isError = false) {
         messageContainer.textContent = message;
@@ -83,10 +140,6 @@ document.addEventListener('DOMContentLoaded', () => {
         currentServiceToUpdate = null;
         addEditTitle.textContent = 'Add New Credential';
 
-        const response = await fetch('/api/tags');
-        const tags = await response.json();
-        tagify.settings.whitelist = Object.keys(tags);
-
         showView(addView);
     });
 
@@ -132,6 +185,8 @@ document.addEventListener('DOMContentLoaded', () => {
         });
 
         if (response.ok) {
+            validatedResponses.clear();
+            listRevision = null;
             displayMessage('Logged out successfully!');
             loginContainer.style.display = 'block';
             mainContainer.style.display = 'none';
@@ -180,7 +235,7 @@ document.addEventListener('DOMContentLoaded', () => {
         let method = 'POST';
 
         if (action === 'update' && currentServiceToUpdate) {
-            url = `/api/credentials/${currentServiceToUpdate}`;
+            url = `/api/credential/${encodeURIComponent(currentServiceToUpdate)}`;
             method = 'PUT';
         }
 
@@ -208,27 +263,130 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    // Load Credentials (for Browse view)
+    function createCredentialItem(credential) {
+        const item = document.createElement('div');
+        item.className = 'credential-item';
+        item.textContent = credential.service;
+        item.dataset.service = credential.service;
+        item.dataset.tags = (credential.tags || []).join(',');
+        return item;
+    }
+
+    // The server lists services case-insensitively, ties broken by the exact name
+    function compareServices(a, b) {
+        const lowerA = a.toLowerCase();
+        const lowerB = b.toLowerCase();
+        if (lowerA !== lowerB) {
+            return lowerA < lowerB ? -1 : 1;
+        }
+        return a < b ? -1 : a > b ? 1 : 0;
+    }
+
+    // Vault revision the rendered list reflects. Later loads ask /api/sync for the changes since then
+    // and patch the list; only when the server's change journal no longer reaches back is it reloaded.
+    let listRevision = null;
+
+    function applyCredentialChanges(listElement, changes) {
+        const itemsByService = new Map(Array.from(listElement.children, item => [item.dataset.service, item]));
+        changes.deletes.forEach(service => {
+            const item = itemsByService.get(service);
+            if (item) {
+                item.remove();
+            }
+        });
+        changes.upserts.forEach(credential => {
+            const existing = itemsByService.get(credential.service);
+            if (existing) {
+                existing.dataset.tags = (credential.tags || []).join(',');
+                return;
+            }
+            const next = Array.from(listElement.children)
+                .find(item => compareServices(item.dataset.service, credential.service) > 0);
+            listElement.insertBefore(createCredentialItem(credential), next || null);
+        });
+        if (activeFilters.length > 0) {
+            applyTagFilters();
+        }
+    }
+
     async function loadCredentials(listElement) {
-        const response = await fetch('/api/credentials');
-        const credentials = await response.json();
-        listElement.innerHTML = '';
-        for (const service in credentials) {
-            const item = document.createElement('div');
-            item.className = 'credential-item';
-            item.textContent = service;
-            item.dataset.service = service;
-            item.dataset.tags = credentials[service].tags.join(',');
-            listElement.appendChild(item);
+        const params = new URLSearchParams({ include: 'tags' });
+        if (listRevision !== null) params.set('since', listRevision);
+        const response = await fetch(`/api/sync?${params}`);
+        if (!response.ok) {
+            displayMessage('Failed to load credentials.', true);
+            return;
+        }
+        const changes = await response.json();
+        if (changes.full_resync) {
+            if (!await loadAllCredentials(listElement)) {
+                return;
+            }
+        } else {
+            applyCredentialChanges(listElement, changes);
         }
+        // Changes made while the pages loaded are reported again by the next sync, which is harmless
+        listRevision = changes.revision;
+    }
+
+    // Load Credentials (for Browse view), one page of names and tags at a time
+    async function loadAllCredentials(listElement) {
+        let cursor = null;
+        let firstPage = true;
+        do {
+            const params = new URLSearchParams({ limit: LIST_PAGE_SIZE, include: 'tags' });
+            if (cursor) params.set('cursor', cursor);
+            const result = await fetchValidated(`/api/credentials?${params}`);
+            if (!result.ok) {
+                displayMessage('Failed to load credentials.', true);
+                return false;
+            }
+            if (firstPage) {
+                // Every page's validator changes with the vault, so an unchanged first page means an unchanged list
+                if (!result.changed && listElement.childElementCount > 0) {
+                    return true;
+                }
+                listElement.innerHTML = '';
+                firstPage = false;
+            }
+            const page = result.data;
+            page.items.forEach(credential => listElement.appendChild(createCredentialItem(credential)));
+            cursor = page.next_cursor;
+        } while (cursor);
+        return true;
+    }
+
+    // Fetch a single credential, including its secret fields
+    async function fetchCredential(service) {
+        const response = await fetch(`/api/credential/${encodeURIComponent(service)}`);
+        if (!response.ok) {
+            return null;
+        }
+        return response.json();
+    }
+
+    // Load Tags (for Browse view). The collapsed filter bar shows two rows, so only the most
+    // used tags are fetched up front; the rest are fetched when the bar is expanded.
+    const TOP_TAGS = 30;
+
+    function appendTagButtons(container, tagNames) {
+        tagNames.forEach(tag => {
+            const button = document.createElement('button');
+            button.className = 'tag-filter-button';
+            button.textContent = tag;
+            button.dataset.tag = tag;
+            container.appendChild(button);
+        });
     }
 
-    // Load Tags (for Browse view)
     async function loadTags() {
-        const response = await fetch('/api/tags');
-        const tags = await response.json();
+        const result = await fetchValidated(`/api/tags?top=${TOP_TAGS}`);
         const tagFilterWrapper = document.getElementById('tag-filter-wrapper');
         const tagFilterContainer = document.getElementById('tag-filter-container');
+        if (!result.ok || (!result.changed && tagFilterContainer.childElementCount > 0)) {
+            return;
+        }
+        const topTags = result.data;
         tagFilterContainer.innerHTML = '';
         tagFilterWrapper.classList.remove('expanded');
 
@@ -237,28 +395,34 @@ document.addEventListener('DOMContentLoaded', () => {
             existingShowMoreButton.remove();
         }
 
-        const sortedTags = Object.entries(tags).sort((a, b) => b[1] - a[1]);
-
         const resetButton = document.createElement('button');
         resetButton.className = 'tag-filter-button reset-tag-button';
         resetButton.textContent = 'Reset';
         resetButton.dataset.tag = 'all';
         tagFilterContainer.appendChild(resetButton);
 
-        sortedTags.forEach(([tag, count]) => {
-            const button = document.createElement('button');
-            button.className = 'tag-filter-button';
-            button.textContent = tag;
-            button.dataset.tag = tag;
-            tagFilterContainer.appendChild(button);
-        });
+        const shownTags = new Set(topTags.map(entry => entry.tag));
+        appendTagButtons(tagFilterContainer, topTags.map(entry => entry.tag));
+        let allTagsLoaded = topTags.length < TOP_TAGS;
 
         setTimeout(() => {
-            if (tagFilterContainer.scrollHeight > tagFilterContainer.clientHeight) {
+            if (!allTagsLoaded || tagFilterContainer.scrollHeight > tagFilterContainer.clientHeight) {
                 const showMoreButton = document.createElement('button');
                 showMoreButton.id = 'show-more-tags-button';
                 showMoreButton.textContent = 'Show More';
-                showMoreButton.addEventListener('click', () => {
+                showMoreButton.addEventListener('click', async () => {
+                    if (!allTagsLoaded) {
+                        const allTags = await fetchValidated('/api/tags');
+                        if (!allTags.ok) {
+                            return;
+                        }
+                        const tags = allTags.data;
+                        const remaining = Object.entries(tags)
+                            .filter(([tag]) => !shownTags.has(tag))
+                            .sort((a, b) => b[1] - a[1] || a[0].localeCompare(b[0]));
+                        appendTagButtons(tagFilterContainer, remaining.map(([tag]) => tag));
+                        allTagsLoaded = true;
+                    }
                     const isExpanded = tagFilterWrapper.classList.toggle('expanded');
                     showMoreButton.textContent = isExpanded ? 'Show Less' : 'Show More';
                 });
@@ -286,46 +450,68 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             }
 
-            const credentialItems = Array.from(document.querySelectorAll('.credential-item'));
-            const results = [];
+            applyTagFilters();
+        }
+    });
 
-            credentialItems.forEach(item => {
-                const itemTags = item.dataset.tags.split(',');
-                let matchCount = 0;
-                if (activeFilters.length > 0) {
-                    activeFilters.forEach(filter => {
-                        if (itemTags.includes(filter)) {
-                            matchCount++;
-                        }
-                    });
-                }
+    // Matching and ranking by tags happens server-side; only service names come back
+    async function applyTagFilters() {
+        const credentialItems = Array.from(document.querySelectorAll('.credential-item'));
+        if (activeFilters.length === 0) {
+            credentialItems.forEach(item => item.style.display = 'block');
+            return;
+        }
 
-                item.style.display = 'none';
+        const results = [];
+        let total = 0;
+        do {
+            const params = new URLSearchParams({ mode: 'or', offset: results.length, limit: FILTER_PAGE_SIZE });
+            activeFilters.forEach(tag => params.append('tag', tag));
+            const response = await fetch(`/api/credentials/filter?${params}`);
+            if (!response.ok) {
+                displayMessage('Failed to filter credentials.', true);
+                return;
+            }
+            const page = await response.json();
+            results.push(...page.results);
+            total = page.total;
+            if (page.results.length === 0) break;
+        } while (results.length < total);
+
+        const itemsByService = new Map(credentialItems.map(item => [item.dataset.service, item]));
+        credentialItems.forEach(item => item.style.display = 'none');
+        results.forEach(result => {
+            const item = itemsByService.get(result.service);
+            if (item) {
+                item.style.display = 'block';
+                credentialsList.appendChild(item);
+            }
+        });
+    }
 
-                if (activeFilters.length === 0) {
-                    item.style.display = 'block';
-                } else if (matchCount > 0) {
-                    results.push({ item: item, matches: matchCount });
-                }
-            });
+    // Search Functionality: the best matches first, tolerating typos. Requests wait until typing
+    // pauses, and a newer query cancels the one still in flight, so only the last answer is shown.
+    const SEARCH_DEBOUNCE_MS = 150;
+    let searchTimer = null;
+    let searchController = null;
 
-            if (activeFilters.length > 0) {
-                results.sort((a, b) => b.matches - a.matches);
+    function clearSearchResults() {
+        searchResults.innerHTML = '';
+        searchResults.style.display = 'none';
+    }
 
-                results.forEach(result => {
-                    result.item.style.display = 'block';
-                    credentialsList.appendChild(result.item);
-                });
-            }
+    async function runSearch(query) {
+        if (searchController) {
+            searchController.abort();
         }
-    });
-
-    // Search Functionality
-    searchBox.addEventListener('input', async () => {
-        const query = searchBox.value;
-        if (query.length >= 2) {
-            const response = await fetch(`/api/credentials/search?q=${query}`);
-            const results = await response.json();
+        searchController = new AbortController();
+        const params = new URLSearchParams({ q: query, fuzzy: 1, limit: SEARCH_RESULT_LIMIT });
+        try {
+            const result = await fetchValidated(`/api/credentials/search?${params}`, { signal: searchController.signal });
+            if (!result.ok) {
+                return;
+            }
+            const results = result.data;
             searchResults.innerHTML = '';
             results.forEach(service => {
                 const item = document.createElement('div');
@@ -335,9 +521,23 @@ document.addEventListener('DOMContentLoaded', () => {
                 searchResults.appendChild(item);
             });
             searchResults.style.display = 'block';
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                throw error;
+            }
+        }
+    }
+
+    searchBox.addEventListener('input', () => {
+        const query = searchBox.value;
+        clearTimeout(searchTimer);
+        if (query.length >= 2) {
+            searchTimer = setTimeout(() => runSearch(query), SEARCH_DEBOUNCE_MS);
         } else {
-            searchResults.innerHTML = '';
-            searchResults.style.display = 'none';
+            if (searchController) {
+                searchController.abort();
+            }
+            clearSearchResults();
         }
     });
 
@@ -451,9 +651,7 @@ document.addEventListener('DOMContentLoaded', () => {
     document.addEventListener('click', async (e) => {
         if (e.target.classList.contains('search-result-item') || e.target.classList.contains('credential-item')) {
             const service = e.target.dataset.service;
-            const response = await fetch('/api/credentials');
-            const credentials = await response.json();
-            const credential = credentials[service];
+            const credential = await fetchCredential(service);
 
             if (credential) {
                 openCredentialCardPopup(service, credential);
@@ -483,9 +681,7 @@ document.addEventListener('DOMContentLoaded', () => {
         // Handle Update from popup
         if (e.target.classList.contains('update-credential-button')) {
             const serviceToUpdate = e.target.dataset.service;
-            const response = await fetch('/api/credentials');
-            const credentials = await response.json();
-            const credential = credentials[serviceToUpdate];
+            const credential = await fetchCredential(serviceToUpdate);
 
             if (credential) {
                 serviceInput.value = serviceToUpdate;
@@ -499,10 +695,6 @@ document.addEventListener('DOMContentLoaded', () => {
                 currentServiceToUpdate = serviceToUpdate;
                 addEditTitle.textContent = 'Update Credential';
 
-                const tagsResponse = await fetch('/api/tags');
-                const tags = await tagsResponse.json();
-                tagify.settings.whitelist = Object.keys(tags);
-
                 showView(addView);
                 closeCredentialCardPopup();
             }
@@ -511,7 +703,7 @@ document.addEventListener('DOMContentLoaded', () => {
         // Delete from popup
         if (e.target.classList.contains('delete-credential-button')) {
             const serviceToDelete = e.target.dataset.service;
-            const response = await fetch(`/api/credentials/${serviceToDelete}`, {
+            const response = await fetch(`/api/credential/${encodeURIComponent(serviceToDelete)}`, {
                 method: 'DELETE'
             });
 
@@ -530,12 +722,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Export Credentials
     exportButton.addEventListener('click', async () => {
+        const exportPassword = window.prompt('Optional: enter a password to encrypt the export. Leave empty for a plain JSON file.');
+        if (exportPassword === null) {
+            return; // Export cancelled
+        }
         try {
             const response = await fetch('/api/export', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
-                }
+                },
+                body: JSON.stringify(exportPassword ? { password: exportPassword } : {})
             });
 
             if (response.ok) {
@@ -544,7 +741,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const a = document.createElement('a');
                 a.style.display = 'none';
                 a.href = url;
-                a.download = 'credentials.json'; // Filename
+                a.download = exportPassword ? 'credentials.pmexport' : 'credentials.json'; // Filename
                 document.body.appendChild(a);
                 a.click();
                 window.URL.revokeObjectURL(url);
@@ -570,13 +767,22 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        if (file.type !== 'application/json') {
-            displayMessage('Only JSON files can be imported.', true);
+        const isEncryptedExport = file.name.endsWith('.pmexport');
+        if (file.type !== 'application/json' && !isEncryptedExport) {
+            displayMessage('Only JSON and encrypted .pmexport files can be imported.', true);
             return;
         }
 
         const formData = new FormData();
         formData.append('file', file);
+        if (isEncryptedExport) {
+            const exportPassword = window.prompt('Enter the password this export was encrypted with.');
+            if (!exportPassword) {
+                event.target.value = '';
+                return;
+            }
+            formData.append('password', exportPassword);
+        }
 
         try {
             const response = await fetch('/api/import', {
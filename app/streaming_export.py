@@ -0,0 +1,167 @@
+import base64
+import json
+import os
+import struct
+import logging
+from app.kdf import PBKDF2, derive
+
+logger = logging.getLogger(__name__)
+
+# Encrypted exports start with this line, followed by a JSON header line and
+# then length-prefixed AES-GCM segments of the plain JSON export.
+ENCRYPTED_MAGIC = b'PMEXPORT1\n'
+SEGMENT_SIZE = 64 * 1024
+EXPORT_KDF_ITERATIONS = 100000
+_NONCE_PREFIX_SIZE = 7
+_LENGTH = struct.Struct('>I')
+_MAX_SEGMENTS = 2 ** 32
+_MAX_SEGMENT_LENGTH = 16 * 1024 * 1024
+# Bounds the work an untrusted export header can ask for
+_MAX_KDF_ITERATIONS = 10_000_000
+
+class ExportDecryptionError(ValueError):
+    pass
+
+def iter_json_export(items):
+    """Yields a JSON object for (service, data) items, one entry per chunk."""
+    yield '{'
+    separator = '\n'
+    for service, data in items:
+        yield f'{separator}    {json.dumps(service)}: {json.dumps(data)}'
+        separator = ',\n'
+    yield '\n}\n'
+
+class ExportHeader:
+    """Key derivation and nonce parameters of one encrypted export, stored on its header line.
+
+    Deriving the key is the expensive step, so it is separate: servers run
+    derive_key() in their crypto pool before streaming anything.
+    """
+
+    def __init__(self, salt, nonce_prefix, iterations=EXPORT_KDF_ITERATIONS, line=None):
+        self.salt = salt
+        self.nonce_prefix = nonce_prefix
+        self.iterations = iterations
+        # The exact bytes are authenticated with every segment
+        self.line = line if line is not None else json.dumps({
+            'kdf': 'pbkdf2-sha256',
+            'iterations': iterations,
+            'salt': base64.b64encode(salt).decode('ascii'),
+            'nonce_prefix': base64.b64encode(nonce_prefix).decode('ascii'),
+        }).encode() + b'\n'
+
+    @classmethod
+    def new(cls):
+        return cls(os.urandom(16), os.urandom(_NONCE_PREFIX_SIZE))
+
+    @classmethod
+    def read(cls, stream):
+        """Reads the magic and header line of an encrypted export, leaving stream at its first segment."""
+        if stream.read(len(ENCRYPTED_MAGIC)) != ENCRYPTED_MAGIC:
+            raise ExportDecryptionError("Not an encrypted export.")
+        line = stream.readline(4096)
+        try:
+            params = json.loads(line)
+            salt = base64.b64decode(params['salt'])
+            nonce_prefix = base64.b64decode(params['nonce_prefix'])
+            iterations = int(params['iterations'])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ExportDecryptionError("Encrypted export has an invalid header.") from e
+        if (params.get('kdf') != 'pbkdf2-sha256' or len(nonce_prefix) != _NONCE_PREFIX_SIZE
+                or not 0 < iterations <= _MAX_KDF_ITERATIONS):
+            raise ExportDecryptionError("Encrypted export uses unsupported parameters.")
+        return cls(salt, nonce_prefix, iterations, line)
+
+    def derive_key(self, password):
+        return derive(password, self.salt, {'algorithm': PBKDF2, 'iterations': self.iterations})
+
+def _export_cipher(key):
+    # AES-GCM is only loaded once somebody asks for an encrypted export
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return AESGCM(key)
+
+def _nonce(prefix, counter, last):
+    # STREAM construction: a per-segment counter and a final-segment flag stop reordering and truncation
+    return prefix + struct.pack('>I', counter) + (b'\x01' if last else b'\x00')
+
+def iter_encrypted_export(chunks, header, key, segment_size=SEGMENT_SIZE):
+    """Encrypts text chunks under key, derived with header.derive_key(), yielding bytes as segments fill."""
+    aesgcm = _export_cipher(key)
+    nonce_prefix = header.nonce_prefix
+    associated_data = header.line
+    yield ENCRYPTED_MAGIC + header.line
+
+    counter = 0
+    pending = bytearray()
+    for chunk in chunks:
+        pending += chunk.encode('utf-8')
+        # Keep at least one full segment back, so the last one can be flagged as final
+        while len(pending) > segment_size:
+            segment = aesgcm.encrypt(_nonce(nonce_prefix, counter, False), bytes(pending[:segment_size]), associated_data)
+            del pending[:segment_size]
+            counter += 1
+            yield _LENGTH.pack(len(segment)) + segment
+    segment = aesgcm.encrypt(_nonce(nonce_prefix, counter, True), bytes(pending), associated_data)
+    yield _LENGTH.pack(len(segment)) + segment
+
+def is_encrypted_export(stream):
+    # Peeks without consuming, for streams that support it (e.g. werkzeug uploads)
+    position = stream.tell()
+    prefix = stream.read(len(ENCRYPTED_MAGIC))
+    stream.seek(position)
+    return prefix == ENCRYPTED_MAGIC
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ExportDecryptionError("Encrypted export is truncated.")
+    return data
+
+def iter_decrypted_export(stream, header, key):
+    """Yields the plaintext segments of an encrypted export after ExportHeader.read(), verifying each one."""
+    from cryptography.exceptions import InvalidTag
+    aesgcm = _export_cipher(key)
+    nonce_prefix = header.nonce_prefix
+    associated_data = header.line
+
+    counter = 0
+    next_length = stream.read(_LENGTH.size)
+    while True:
+        if len(next_length) != _LENGTH.size:
+            raise ExportDecryptionError("Encrypted export is truncated.")
+        (length,) = _LENGTH.unpack(next_length)
+        if length > _MAX_SEGMENT_LENGTH:
+            raise ExportDecryptionError("Encrypted export has an oversized segment.")
+        segment = _read_exact(stream, length)
+        # Reading ahead tells us whether this is the segment that must carry the final flag
+        next_length = stream.read(_LENGTH.size)
+        last = not next_length
+        try:
+            plaintext = aesgcm.decrypt(_nonce(nonce_prefix, counter, last), segment, associated_data)
+        except InvalidTag as e:
+            raise ExportDecryptionError("Wrong export password or corrupted export.") from e
+        yield plaintext
+        if last:
+            return
+        counter += 1
+        if counter >= _MAX_SEGMENTS:
+            raise ExportDecryptionError("Encrypted export has too many segments.")
+
+class DecryptedExportStream:
+    """Read-only binary stream over iter_decrypted_export, so encrypted exports can be re-imported."""
+
+    def __init__(self, stream, header, key):
+        self._segments = iter_decrypted_export(stream, header, key)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            segment = next(self._segments, None)
+            if segment is None:
+                break
+            self._buffer += segment
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
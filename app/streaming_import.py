@@ -0,0 +1,170 @@
+import codecs
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_BUFFER_BYTES = 16 * 1024 * 1024
+MAX_REPORTED_SKIPS = 100
+
+_WHITESPACE = ' \t\n\r'
+
+class ImportFormatError(ValueError):
+    pass
+
+class ImportTooLargeError(ImportFormatError):
+    pass
+
+class _Reader:
+    """Text buffer over a binary stream that only holds the part not yet parsed."""
+
+    def __init__(self, stream, chunk_size, max_buffer_bytes):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._max_buffer_bytes = max_buffer_bytes
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._decode = json.JSONDecoder().raw_decode
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        self.bytes_read += len(chunk)
+        if not chunk:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self._decoder.decode(b'', final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self._decoder.decode(chunk)
+        self.pos = 0
+        if len(self.buffer) > self._max_buffer_bytes:
+            raise ImportTooLargeError(f"A single entry exceeds the import buffer limit of {self._max_buffer_bytes} bytes.")
+        return True
+
+    def peek(self):
+        # Next non-whitespace character, or '' at the end of the input
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, characters):
+        found = self.peek()
+        if not found or found not in characters:
+            raise ImportFormatError(f"Expected one of {characters!r} but found {found or 'end of file'!r}.")
+        self.pos += 1
+        return found
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if not self._fill():
+                    raise ImportFormatError(f"Invalid JSON: {e.msg}") from e
+                continue
+            # A number cut off by the chunk boundary decodes fine, so insist on a following character
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_json_object_items(stream, chunk_size=DEFAULT_CHUNK_SIZE, max_buffer_bytes=DEFAULT_MAX_BUFFER_BYTES):
+    """Yields (key, value) pairs of a top-level JSON object while reading the stream in chunks."""
+    reader = _Reader(stream, chunk_size, max_buffer_bytes)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            if reader.peek() != '"':
+                raise ImportFormatError("Expected a service name.")
+            key = reader.value()
+            reader.expect(':')
+            yield key, reader.value()
+            if reader.expect(',}') == '}':
+                break
+    if reader.peek():
+        raise ImportFormatError("Unexpected data after the JSON object.")
+
+def validate_entry(data):
+    """Returns why an imported entry is unusable, or None if it is valid."""
+    if not isinstance(data, dict):
+        return "Entry is not an object."
+    tags = data.get('tags')
+    if not isinstance(tags, list) or not tags or not all(isinstance(tag, str) for tag in tags):
+        return "Tags must be a non-empty list of strings."
+    fields = data.get('fields')
+    if not isinstance(fields, dict) or not fields or not all(isinstance(value, str) for value in fields.values()):
+        return "Fields must be a non-empty object of string values."
+    return None
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.skipped = []
+        self.skipped_count = 0
+        self.batches = 0
+
+    def skip(self, service, reason):
+        self.skipped_count += 1
+        if len(self.skipped) < MAX_REPORTED_SKIPS:
+            self.skipped.append({'service': service, 'reason': reason})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'skipped_count': self.skipped_count,
+            'batches': self.batches,
+        }
+
+def import_stream(pm_instance, stream, batch_size=DEFAULT_BATCH_SIZE, max_buffer_bytes=DEFAULT_MAX_BUFFER_BYTES,
+                  chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Merges a JSON export into the vault, batch_size entries per write.
+
+    Imported entries overwrite existing ones with the same service name.
+    Memory use is bounded by max_buffer_bytes for parsing plus one batch of
+    entries. Batches committed before a parse error stay committed; the
+    raised ImportFormatError carries the partial report as .report.
+    """
+    report = ImportReport()
+    pending = []
+
+    def flush():
+        with pm_instance.batch() as batch:
+            for service, data in pending:
+                batch.upsert(service, data['tags'], data['fields'])
+        if not batch.committed:
+            raise IOError("Failed to save imported credentials.")
+        report.imported += len(pending)
+        report.batches += 1
+        pending.clear()
+        logger.info("Import progress: %d imported, %d skipped.", report.imported, report.skipped_count)
+        if progress is not None:
+            progress(report)
+
+    try:
+        for service, data in iter_json_object_items(stream, chunk_size, max_buffer_bytes):
+            reason = "Service name is empty." if not service else validate_entry(data)
+            if reason is not None:
+                report.skip(service, reason)
+                continue
+            pending.append((service, data))
+            if len(pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
+    except ImportFormatError as e:
+        e.report = report
+        raise
+    return report
@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILENAME = 'registry.sqlite3'
+# Vaults of new users go to instance/<first N hex pairs of their key>/, so no directory grows without bound
+DEFAULT_SHARD_DEPTH = 1
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    user_key TEXT PRIMARY KEY,
+    vault TEXT NOT NULL,
+    salt TEXT NOT NULL,
+    kdf TEXT,
+    created_at REAL NOT NULL
+) WITHOUT ROWID
+'''
+
+def shard_paths(user_key, depth=DEFAULT_SHARD_DEPTH):
+    """Vault and salt paths for a new user, under depth levels of two-character directories."""
+    shards = [user_key[2 * level:2 * level + 2] for level in range(depth)]
+    return (
+        os.path.join('instance', *shards, f'{user_key}_credentials.json'),
+        os.path.join('instance', *shards, f'{user_key}_salt.key'),
+    )
+
+class UserRegistry:
+    """SQLite index of user keys to vault locations and KDF parameters.
+
+    A login is one primary-key lookup instead of probing the instance
+    directory. One connection is shared by the threads of a process and
+    reopened after a fork.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            return self._connect().execute(sql, parameters)
+
+    def lookup(self, user_key):
+        """Returns {'vault', 'salt', 'kdf'} for a registered user, or None."""
+        try:
+            row = self._execute('SELECT vault, salt, kdf FROM users WHERE user_key = ?', (user_key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("User registry lookup failed in %s: %s", self.path, e)
+            return None
+        if row is None:
+            return None
+        return {'vault': row[0], 'salt': row[1], 'kdf': json.loads(row[2]) if row[2] else None}
+
+    def register(self, user_key, vault, salt, kdf=None):
+        """Adds a user. Returns False if the key is already registered or the write failed."""
+        try:
+            cursor = self._execute(
+                'INSERT OR IGNORE INTO users (user_key, vault, salt, kdf, created_at) VALUES (?, ?, ?, ?, ?)',
+                (user_key, vault, salt, json.dumps(kdf) if kdf else None, time.time()),
+            )
+        except sqlite3.Error as e:
+            logger.error("Failed to register user in %s: %s", self.path, e)
+            return False
+        return cursor.rowcount == 1
+
+    def register_many(self, users):
+        """Adds (user_key, vault, salt, kdf) tuples in one transaction. Returns how many were new."""
+        now = time.time()
+        rows = [(user_key, vault, salt, json.dumps(kdf) if kdf else None, now) for user_key, vault, salt, kdf in users]
+        with self._lock:
+            connection = self._connect()
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                before = connection.total_changes
+                connection.executemany(
+                    'INSERT OR IGNORE INTO users (user_key, vault, salt, kdf, created_at) VALUES (?, ?, ?, ?, ?)', rows)
+                added = connection.total_changes - before
+                connection.execute('COMMIT')
+            except sqlite3.Error as e:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+                logger.error("Failed to register %d users in %s: %s", len(rows), self.path, e)
+                return 0
+        return added
+
+    def update_kdf(self, user_key, kdf):
+        try:
+            return self._execute('UPDATE users SET kdf = ? WHERE user_key = ?', (json.dumps(kdf), user_key)).rowcount == 1
+        except sqlite3.Error as e:
+            logger.error("Failed to update KDF parameters in %s: %s", self.path, e)
+            return False
+
+    def remove(self, user_key):
+        try:
+            return self._execute('DELETE FROM users WHERE user_key = ?', (user_key,)).rowcount == 1
+        except sqlite3.Error as e:
+            logger.error("Failed to remove user from %s: %s", self.path, e)
+            return False
+
+    def __len__(self):
+        return self._execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+_registries = {}
+_registries_guard = threading.Lock()
+
+def get_registry():
+    """The registry of the current instance directory, shared per process."""
+    path = os.path.abspath(os.path.join('instance', REGISTRY_FILENAME))
+    with _registries_guard:
+        registry = _registries.get(path)
+        if registry is None:
+            registry = _registries[path] = UserRegistry(path)
+        return registry
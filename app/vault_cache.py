@@ -0,0 +1,94 @@
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 32
+# Counted in estimated memory of the cached states (see VaultState.estimated_size), not file bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def file_signature(stat_result):
+    # Changes whenever the vault file is rewritten, replaced or appended to
+    return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+class VaultCache:
+    """Bounded LRU cache of decrypted vaults, keyed by vault file and validated against its signature.
+
+    Callers give each vault's size when they put it; the cache evicts the
+    least recently used vaults once the sizes add up to more than max_bytes,
+    but never the most recently used one.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key_fingerprint(key):
+        return hashlib.sha256(key).digest()
+
+    def get(self, filename, key, signature):
+        path = os.path.abspath(filename)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_signature, fingerprint, vault, _ = entry
+            if cached_signature != signature:
+                self._remove(path)
+                self.misses += 1
+                return None
+            # Never serve a vault to a caller holding a different key
+            if not hmac.compare_digest(fingerprint, self._key_fingerprint(key)):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return vault
+
+    def put(self, filename, key, signature, vault, size):
+        path = os.path.abspath(filename)
+        if size > self.max_bytes:
+            logger.info("Vault %s is larger than the cache bound (%d bytes). Caching it alone.", filename, size)
+        with self._lock:
+            self._remove(path)
+            self._entries[path] = (signature, self._key_fingerprint(key), vault, size)
+            self._total_bytes += size
+            # The vault just put is always kept, so one larger than the bound is not reloaded on every request
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                logger.info("Vault cache full. Evicted least recently used vault.")
+
+    def invalidate(self, filename):
+        with self._lock:
+            self._remove(os.path.abspath(filename))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._total_bytes -= entry[3]
@@ -0,0 +1,83 @@
+import os
+import threading
+import weakref
+import logging
+
+try:
+    import fcntl
+except ImportError: # Windows has no fcntl; only in-process locking is available there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_locks = weakref.WeakValueDictionary()
+_locks_guard = threading.Lock()
+
+class VaultLock:
+    """Per-vault lock: a reentrant in-process lock plus an fcntl lock on a sidecar file.
+
+    Writers hold both, so concurrent threads and processes (e.g. gunicorn
+    workers) serialise their read-modify-write cycles. Readers only need the
+    in-process lock, which keeps threads from observing a vault mid-mutation.
+    """
+
+    def __init__(self, filename):
+        self.lock_filename = f'{filename}.lock'
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._lock_file = None
+        self._lock_file_depth = None
+
+    def acquire(self, exclusive=True):
+        self._rlock.acquire()
+        try:
+            self._depth += 1
+            if exclusive and fcntl is not None and self._lock_file is None:
+                lock_file = open(self.lock_filename, 'a+b')
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                except BaseException:
+                    lock_file.close()
+                    raise
+                self._lock_file = lock_file
+                self._lock_file_depth = self._depth
+        except BaseException:
+            self._depth -= 1
+            self._rlock.release()
+            raise
+
+    def release(self):
+        try:
+            if self._lock_file is not None and self._lock_file_depth == self._depth:
+                try:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                finally:
+                    self._lock_file.close()
+                    self._lock_file = None
+                    self._lock_file_depth = None
+        finally:
+            self._depth -= 1
+            self._rlock.release()
+
+    def __call__(self, exclusive=True):
+        return _Held(self, exclusive)
+
+class _Held:
+    def __init__(self, lock, exclusive):
+        self._lock = lock
+        self._exclusive = exclusive
+
+    def __enter__(self):
+        self._lock.acquire(self._exclusive)
+        return self._lock
+
+    def __exit__(self, exc_type, exc, tb):
+        self._lock.release()
+
+def get_vault_lock(filename):
+    path = os.path.abspath(filename)
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = VaultLock(path)
+        return lock
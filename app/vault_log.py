@@ -0,0 +1,230 @@
+import logging
+from app.metrics import metrics
+from app.serializers import loads as decode_payload, payload_codec
+
+logger = logging.getLogger(__name__)
+
+# Vault files in the log format start with this line. Anything else is a
+# legacy vault: one Fernet token holding the whole credentials dict.
+MAGIC = b'PMVAULT1\n'
+
+FORMAT_LEGACY = 'legacy'
+# Version 1 logs encrypt every record, fields included, under the master key
+FORMAT_LOG = 'log'
+# Version 2 logs use envelope encryption: the header wraps a random data key
+# under the master key, and each record line is an index token (service name
+# and tags) followed by one separately encrypted blob per credential's fields.
+FORMAT_ENVELOPE = 'envelope'
+
+LOG_VERSION = 1
+ENVELOPE_VERSION = 2
+
+OP_HEADER = 'header'
+OP_UPSERT = 'upsert'
+OP_DELETE = 'delete'
+OP_BATCH = 'batch'
+
+class VaultFormatError(Exception):
+    pass
+
+def make_fernet(key):
+    # cryptography is imported on first use, so starting the server does not wait for it
+    from cryptography.fernet import Fernet
+    return Fernet(key)
+
+def generate_data_key():
+    from cryptography.fernet import Fernet
+    return Fernet.generate_key()
+
+class SealedFields:
+    """A credential's encrypted fields, decrypted on first use and then kept."""
+
+    __slots__ = ('token', '_fernet', '_service', '_fields')
+
+    def __init__(self, fernet, service, token):
+        self.token = token
+        self._fernet = fernet
+        self._service = service
+        self._fields = None
+
+    def open(self):
+        # Returns a fresh copy of the fields dict
+        if self._fields is None:
+            with metrics.span('decrypt'):
+                payload = decode_payload(self._fernet.decrypt(self.token))
+            # Blobs are bound to their service, so they cannot be swapped between entries
+            if payload.get('service') != self._service:
+                raise VaultFormatError(f"Fields blob does not belong to '{self._service}'.")
+            self._fields = payload['fields']
+        return dict(self._fields)
+
+def seal_fields(fernet, service, fields):
+    return fernet.encrypt(payload_codec.dumps({'service': service, 'fields': fields}))
+
+def is_log(data):
+    return data.startswith(MAGIC)
+
+def encode_record(fernet, record):
+    return fernet.encrypt(payload_codec.dumps(record)) + b'\n'
+
+def _seal_record(fernet, record, blobs):
+    # Moves each upsert's fields into a blob; the record keeps only index data
+    op = record.get('op')
+    if op == OP_BATCH:
+        return {'op': OP_BATCH, 'records': [_seal_record(fernet, sub_record, blobs) for sub_record in record['records']]}
+    data = record.get('data')
+    if op != OP_UPSERT or not isinstance(data, dict) or 'fields' not in data:
+        return record
+    fields = data['fields']
+    blobs.append(fields.token if isinstance(fields, SealedFields) else seal_fields(fernet, record['service'], fields))
+    index_data = {name: value for name, value in data.items() if name != 'fields'}
+    return {'op': OP_UPSERT, 'service': record['service'], 'data': index_data, 'sealed': True}
+
+def encode_envelope_record(fernet, record, revision=None):
+    """One log line: the encrypted index record, then its fields blobs separated by spaces.
+
+    Appended records carry the vault revision they create; snapshot records do not.
+    """
+    blobs = []
+    index_record = _seal_record(fernet, record, blobs)
+    if revision is not None:
+        index_record = dict(index_record, revision=revision)
+    return b' '.join([fernet.encrypt(payload_codec.dumps(index_record))] + blobs) + b'\n'
+
+def _unseal_record(fernet, record, blobs):
+    op = record.get('op')
+    if op == OP_BATCH:
+        for sub_record in record['records']:
+            _unseal_record(fernet, sub_record, blobs)
+    elif op == OP_UPSERT and record.pop('sealed', False):
+        try:
+            token = next(blobs)
+        except StopIteration:
+            raise VaultFormatError("Vault record is missing a fields blob.") from None
+        record['data']['fields'] = SealedFields(fernet, record['service'], token)
+
+def upsert_record(service, data):
+    return {'op': OP_UPSERT, 'service': service, 'data': data}
+
+def delete_record(service):
+    return {'op': OP_DELETE, 'service': service}
+
+def batch_record(records):
+    # Several mutations in one encrypted record, so a torn write drops all of them or none
+    return {'op': OP_BATCH, 'records': records}
+
+def record_error(record):
+    """Why a record could not be replayed, or None if it can."""
+    op = record.get('op')
+    if op == OP_BATCH:
+        for sub_record in record['records']:
+            reason = record_error(sub_record)
+            if reason is not None:
+                return reason
+        return None
+    if op not in (OP_UPSERT, OP_DELETE):
+        return f"Unknown vault record operation: {op!r}"
+    if not isinstance(record.get('service'), str) or not record['service']:
+        return "Service name must be a non-empty string."
+    if op == OP_UPSERT and not isinstance(record.get('data'), dict):
+        return "Credential data must be an object."
+    return None
+
+def encode_header(master_fernet, data_key, revision=0, journal=None):
+    # The only line encrypted under the master key; re-wrapping it is all a password change needs
+    header = {'op': OP_HEADER, 'version': ENVELOPE_VERSION, 'data_key': data_key.decode('ascii'), 'revision': revision}
+    if journal is not None:
+        header['journal'] = journal.to_dict()
+    return encode_record(master_fernet, header)
+
+def encode_snapshot(master_fernet, data_key, credentials, revision=0, journal=None):
+    # A compacted log: the header, holding the revision and change journal of the snapshot, then one upsert per live credential
+    fernet = make_fernet(data_key)
+    parts = [MAGIC, encode_header(master_fernet, data_key, revision, journal)]
+    for service, data in credentials.items():
+        parts.append(encode_envelope_record(fernet, upsert_record(service, data)))
+    return b''.join(parts)
+
+def rewrap_log(data, master_fernet, new_master_fernet):
+    """Returns an envelope log with its data key wrapped under a new master key; records are copied untouched."""
+    header_end = data.index(b'\n', len(MAGIC))
+    header = decode_payload(master_fernet.decrypt(data[len(MAGIC):header_end]))
+    if header.get('version') != ENVELOPE_VERSION:
+        raise VaultFormatError("Only envelope vaults can be re-wrapped.")
+    # Everything else in the header, such as the revision and change journal, is kept as it was.
+    # A record torn by a crash is left behind, so the new log ends with a complete one.
+    return MAGIC + encode_record(new_master_fernet, header) + data[header_end + 1:data.rindex(b'\n') + 1]
+
+def apply_record(credentials, record, tag_counts=None):
+    # tag_counts, a TagCounts of credentials, is updated along with it
+    op = record.get('op')
+    if op == OP_UPSERT:
+        if tag_counts is not None:
+            previous = credentials.get(record['service'])
+            if previous is not None:
+                tag_counts.remove(previous)
+            tag_counts.add(record['data'])
+        credentials[record['service']] = record['data']
+    elif op == OP_DELETE:
+        previous = credentials.pop(record['service'], None)
+        if tag_counts is not None and previous is not None:
+            tag_counts.remove(previous)
+    elif op == OP_BATCH:
+        for sub_record in record['records']:
+            apply_record(credentials, sub_record, tag_counts)
+    else:
+        raise VaultFormatError(f"Unknown vault record operation: {op!r}")
+
+def read_log(master_fernet, data, tag_counts=None, journal=None):
+    """Replays a log-format vault.
+
+    Returns the credentials dict, the number of records replayed, the data
+    key (None for version 1 logs), the vault revision, which counts the
+    writes that changed the vault and survives compaction, and the length of
+    data up to the end of its last complete record, where the next record
+    has to be appended. Fields of envelope vaults are left
+    as SealedFields; only the index tokens are decrypted here. A TagCounts
+    passed as tag_counts is filled in during the replay, and so is a
+    ChangeJournal passed as journal.
+    """
+    lines = data[len(MAGIC):].split(b'\n')
+    length = len(data) - len(lines[-1])
+    if lines[-1]:
+        # Records are always newline terminated, so this is a write torn by a crash
+        logger.warning("Ignoring incomplete trailing record in vault log.")
+    lines = [line for line in lines[:-1] if line]
+    if not lines:
+        raise VaultFormatError("Vault log has no header record.")
+    with metrics.span('decrypt'):
+        # The encrypted header lets a wrong key be detected even for an empty vault
+        header = decode_payload(master_fernet.decrypt(lines[0]))
+    if header.get('op') != OP_HEADER:
+        raise VaultFormatError("Vault log does not start with a header record.")
+    version = header.get('version')
+    if version == LOG_VERSION:
+        data_key = None
+        fernet = master_fernet
+    elif version == ENVELOPE_VERSION:
+        data_key = header['data_key'].encode('ascii')
+        fernet = make_fernet(data_key)
+    else:
+        raise VaultFormatError(f"Unsupported vault log version: {version!r}")
+
+    with metrics.span('decrypt'):
+        split_lines = [line.split(b' ') for line in lines[1:]]
+        plaintexts = [fernet.decrypt(parts[0]) for parts in split_lines]
+    revision = header.get('revision', 0)
+    if journal is not None:
+        journal.restore(header.get('journal'), revision)
+    with metrics.span('parse'):
+        credentials = {}
+        for plaintext, parts in zip(plaintexts, split_lines):
+            record = decode_payload(plaintext)
+            blobs = iter(parts[1:])
+            _unseal_record(fernet, record, blobs)
+            apply_record(credentials, record, tag_counts)
+            if 'revision' in record:
+                revision = record['revision']
+                if journal is not None:
+                    journal.add_record(revision, record)
+    return credentials, len(lines) - 1, data_key, revision, length
@@ -0,0 +1,148 @@
+"""Measures cheap-route latency while concurrent logins saturate the crypto pool.
+
+Run from the project root:
+
+    python -m benchmarks.bench_login_storm --storm-clients 32 --duration 5
+
+By default the app runs under gunicorn with gunicorn.conf.py, as it is
+deployed, so the thread count and crypto pool sizing are the shipped ones;
+--server werkzeug serves it in process on a threaded WSGI server instead.
+Probe clients time POST /api/logout and a small authenticated listing,
+first with the server idle and then during a login storm. With the pool
+bounded below the request threads, their tail latency should stay close
+to the idle numbers while surplus logins get 503.
+"""
+import argparse
+import contextlib
+import json
+import sys
+import threading
+import time
+from benchmarks.bench_startup import available_servers, free_port, server_environment, server_process, wait_for_login
+from benchmarks.harness import summarize, http_request
+from benchmarks.run import PASSWORD, vault_workspace
+from benchmarks.synthetic import synthetic_vault
+
+PROBE_ROUTES = (
+    ('POST', '/api/logout'),
+    ('GET', '/api/credentials?limit=50'),
+)
+
+def _login(port):
+    return http_request(port, 'POST', '/api/login', {"password": PASSWORD})
+
+def _probe(port, cookie, duration):
+    samples = {f'{method} {path}': [] for method, path in PROBE_ROUTES}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for method, path in PROBE_ROUTES:
+            # Logout must not end the probe's own session, so it goes without the cookie
+            start = time.perf_counter()
+            status, _ = http_request(port, method, path, cookie=cookie if method == 'GET' else None)
+            samples[f'{method} {path}'].append(time.perf_counter() - start)
+            assert status == 200, (path, status)
+    return {name: summarize(values) for name, values in samples.items()}
+
+def _storm(port, clients, stop):
+    statuses = {}
+    lock = threading.Lock()
+
+    def client():
+        while not stop.is_set():
+            status, _ = _login(port)
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads, statuses
+
+@contextlib.contextmanager
+def _gunicorn(workers, max_queue):
+    # Pool settings go through the environment, where gunicorn.conf.py still caps the queue below the threads
+    overrides = {}
+    if workers:
+        overrides['CRYPTO_POOL_WORKERS'] = str(workers)
+    if max_queue is not None:
+        overrides['CRYPTO_POOL_MAX_QUEUE'] = str(max_queue)
+    port = free_port()
+    with server_process('gunicorn', port, server_environment(**overrides)) as process:
+        yield port, wait_for_login(process, port)
+
+@contextlib.contextmanager
+def _werkzeug(workers, max_queue):
+    from werkzeug.serving import make_server
+    from app import api, main
+    from app.crypto_pool import CryptoPool
+
+    previous_pool = api.crypto_pool
+    api.crypto_pool = CryptoPool(
+        max_workers=workers or previous_pool.max_workers,
+        max_queue=previous_pool.max_queue if max_queue is None else max_queue,
+    )
+    try:
+        api.key_cache.clear()
+        server = make_server('127.0.0.1', 0, main.app, threaded=True)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        try:
+            status, cookie = _login(server.port)
+            assert status == 200, status
+            yield server.port, cookie
+        finally:
+            server.shutdown()
+            server_thread.join()
+    finally:
+        api.crypto_pool.shutdown()
+        api.crypto_pool = previous_pool
+
+def run(size, storm_clients, duration, server='gunicorn', workers=None, max_queue=None):
+    serve = _gunicorn if server == 'gunicorn' else _werkzeug
+    with vault_workspace(synthetic_vault(size)):
+        with serve(workers, max_queue) as (port, cookie):
+            cookie = cookie.split(';', 1)[0]
+            idle = _probe(port, cookie, duration)
+            stop = threading.Event()
+            threads, statuses = _storm(port, storm_clients, stop)
+            storm = _probe(port, cookie, duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+    return {
+        "size": size,
+        "server": server,
+        "storm_clients": storm_clients,
+        "idle": idle,
+        "storm": storm,
+        "login_statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1000, help="Credentials in the synthetic vault.")
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'], default=available_servers()[0])
+    parser.add_argument('--storm-clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per phase.")
+    parser.add_argument('--workers', type=int, help="Crypto pool workers (default: the app's setting).")
+    parser.add_argument('--max-queue', type=int, help="Crypto pool queue depth (default: the app's setting).")
+    parser.add_argument('--output', help="Write results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    results = run(args.size, args.storm_clients, args.duration, args.server, args.workers, args.max_queue)
+    for phase in ('idle', 'storm'):
+        print(f"\n{phase}")
+        for name, summary in results[phase].items():
+            print(f"  {name:<32} p50 {summary['p50_ms']:>9.3f} ms  p99 {summary['p99_ms']:>9.3f} ms"
+                  f"  max {summary['max_ms']:>9.3f} ms")
+    print(f"\nLogin responses during the storm: {results['login_statuses']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
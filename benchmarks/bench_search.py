@@ -0,0 +1,119 @@
+"""Compares SearchIndex lookups with the linear scan search_credentials() used to do,
+and checks typo-tolerant search against a latency budget.
+
+Run from the project root:
+
+    python -m benchmarks.bench_search
+    python -m benchmarks.bench_search --fuzzy-only --fuzzy-size 50000 --budget-ms 25
+
+The fuzzy check exits with status 1 when any query's p99, or the first query
+on a freshly built index, exceeds the budget.
+"""
+import argparse
+import random
+import sys
+import time
+from app.search_index import SearchIndex
+from benchmarks.harness import measure
+from benchmarks.synthetic import synthetic_vault
+
+SIZES = (1_000, 10_000, 100_000)
+QUERIES = ("go", "git", "mail", "service12", "zzzz", "wor")
+REPEAT = 20
+FUZZY_SIZE = 50_000
+FUZZY_LIMIT = 20
+# Per keystroke, so well under the time between two keystrokes
+FUZZY_BUDGET_MS = 25
+# Misspellings of the synthetic tags and of the shared part of every name
+FIXED_FUZZY_QUERIES = ("emial", "wrok", "fiannce", "shoping", "servce", "sevrice12")
+
+def linear_search(credentials, query):
+    query_lower = query.lower()
+    return [
+        service for service, data in credentials.items()
+        if query_lower in service.lower() or any(query_lower in tag.lower() for tag in data.get('tags', []))
+    ]
+
+def best_of(func, *args):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def typo(word, rng):
+    # One transposition, deletion or substitution
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(('swap', 'drop', 'replace'))
+    if kind == 'swap':
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 'drop':
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+def fuzzy_queries(credentials, count=10, seed=0):
+    """Misspelled names of random entries, some only partly typed, plus FIXED_FUZZY_QUERIES."""
+    rng = random.Random(seed)
+    queries = list(FIXED_FUZZY_QUERIES)
+    for service in rng.sample(sorted(credentials), count):
+        name = service.split('-')[0]
+        misspelled = typo(name, rng)
+        queries.append(misspelled if rng.random() < 0.5 else misspelled[:max(3, len(misspelled) - 2)])
+    return queries
+
+def bench_fuzzy(size, repeat=REPEAT, limit=FUZZY_LIMIT):
+    credentials = synthetic_vault(size)
+    queries = fuzzy_queries(credentials)
+    start = time.perf_counter()
+    index = SearchIndex.build(credentials)
+    results = {'size': size, 'index_build_ms': (time.perf_counter() - start) * 1000, 'queries': {}}
+    # What the first keystroke after a vault is loaded costs, with nothing warmed up
+    start = time.perf_counter()
+    index.fuzzy_search(queries[0], limit)
+    results['first_query_ms'] = (time.perf_counter() - start) * 1000
+    for query in queries:
+        results['queries'][query] = measure(lambda: index.fuzzy_search(query, limit), repeat=repeat, warmup=1)
+    return results
+
+def over_budget(results, budget_ms):
+    slow = {query: summary['p99_ms'] for query, summary in results['queries'].items() if summary['p99_ms'] > budget_ms}
+    if results['first_query_ms'] > budget_ms:
+        slow['(first query)'] = results['first_query_ms']
+    return slow
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fuzzy-only', action='store_true', help="Skip the substring search comparison.")
+    parser.add_argument('--fuzzy-size', type=int, default=FUZZY_SIZE)
+    parser.add_argument('--budget-ms', type=float, default=FUZZY_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    if not args.fuzzy_only:
+        print(f"{'entries':>8} {'query':>10} {'scan ms':>10} {'index ms':>10} {'speedup':>8}")
+        for size in SIZES:
+            credentials = synthetic_vault(size)
+            start = time.perf_counter()
+            index = SearchIndex.build(credentials)
+            print(f"{size:>8} {'(build)':>10} {'':>10} {(time.perf_counter() - start) * 1000:>10.2f}")
+            for query in QUERIES:
+                scan = best_of(linear_search, credentials, query)
+                indexed = best_of(index.search, query)
+                print(f"{size:>8} {query:>10} {scan * 1000:>10.3f} {indexed * 1000:>10.3f} {scan / indexed:>7.1f}x")
+
+    results = bench_fuzzy(args.fuzzy_size)
+    print(f"\nFuzzy search over {results['size']} entries (index built in {results['index_build_ms']:.0f} ms,"
+          f" first query {results['first_query_ms']:.1f} ms)")
+    print(f"{'query':>14} {'p50 ms':>10} {'p99 ms':>10}")
+    for query, summary in results['queries'].items():
+        print(f"{query:>14} {summary['p50_ms']:>10.3f} {summary['p99_ms']:>10.3f}")
+    slow = over_budget(results, args.budget_ms)
+    if slow:
+        print(f"\nOver the {args.budget_ms:g} ms budget: {', '.join(sorted(slow))}", file=sys.stderr)
+        sys.exit(1)
+    print(f"\nAll queries within the {args.budget_ms:g} ms budget.")
+
+if __name__ == '__main__':
+    main()
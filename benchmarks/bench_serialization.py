@@ -0,0 +1,83 @@
+"""Compares vault file size and save/load time for each payload format.
+
+Run from the project root:
+
+    python -m benchmarks.bench_serialization --sizes 1000 10000 --output serialization.json
+
+Each format is written with VAULT_PAYLOAD_FORMAT set to it. The binary
+variants are only measured when the msgpack package is installed, and the
+zstd variants when the zstandard package is.
+"""
+import argparse
+import json
+import os
+import sys
+from app import serializers
+from app.serializers import payload_codec
+from benchmarks.harness import measure
+from benchmarks.run import repeat_for, vault_workspace
+from benchmarks.synthetic import synthetic_vault
+
+DEFAULT_SIZES = (1_000, 10_000)
+
+def available_formats():
+    serializer_names = ['json'] + (['binary'] if serializers.msgpack is not None else [])
+    compressions = ['', '+zlib'] + (['+zstd'] if serializers.zstandard is not None else [])
+    return [name + compression for compression in compressions for name in serializer_names]
+
+def bench_format(credentials, repeat):
+    from app.password_logic import vault_cache
+    scaled = repeat_for(len(credentials), repeat)
+    with vault_workspace(credentials) as manager:
+        result = {'file_bytes': os.path.getsize(manager.filename)}
+        result['save'] = measure(lambda: manager.save_credentials(credentials), repeat=scaled, warmup=1)
+        # Index records only, as a login or listing decrypts them
+        result['load_index'] = measure(manager.can_decrypt, repeat=scaled, warmup=1, setup=vault_cache.clear)
+        # Every fields blob as well, as an export does
+        result['load_all'] = measure(manager.load_credentials, repeat=scaled, warmup=1, setup=vault_cache.clear)
+    return result
+
+def run(sizes, formats, repeat):
+    previous = payload_codec.spec
+    runs = []
+    try:
+        for size in sizes:
+            credentials = synthetic_vault(size)
+            run_result = {'size': size, 'formats': {}}
+            for spec in formats:
+                payload_codec.configure_from_spec(spec)
+                run_result['formats'][spec] = bench_format(credentials, repeat)
+            runs.append(run_result)
+            print(f"Finished {size} credentials.", file=sys.stderr)
+    finally:
+        payload_codec.configure_from_spec(previous)
+    return {'msgpack': serializers.msgpack is not None, 'runs': runs}
+
+def print_table(results):
+    for run_result in results['runs']:
+        print(f"\n{run_result['size']} credentials")
+        print(f"  {'format':<14} {'file KiB':>10} {'save ms':>10} {'index ms':>10} {'all ms':>10}")
+        for spec, result in run_result['formats'].items():
+            print(f"  {spec:<14} {result['file_bytes'] / 1024:>10.1f} {result['save']['p50_ms']:>10.2f}"
+                  f" {result['load_index']['p50_ms']:>10.2f} {result['load_all']['p50_ms']:>10.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--formats', nargs='+', default=available_formats())
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help="Write results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    import logging
+    logging.disable(logging.INFO)
+
+    results = run(args.sizes, args.formats, args.repeat)
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Compares concurrent-client throughput of the WSGI app and the async ASGI app.
+
+Run from the project root (the ASGI mode needs quart and uvicorn, from requirements-asgi.txt):
+
+    python -m benchmarks.bench_serving --clients 1 8 32 --duration 5
+
+Each mode is served on a local port: WSGI by werkzeug's threaded server and
+ASGI by uvicorn. Every client logs in once and then loops over a mix of
+read and write routes until the phase ends.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import socket
+import sys
+import threading
+import time
+from benchmarks.harness import summarize, http_request
+from benchmarks.run import PASSWORD, vault_workspace
+from benchmarks.synthetic import synthetic_vault
+
+DEFAULT_CLIENTS = (1, 8, 32)
+
+@contextlib.contextmanager
+def wsgi_server():
+    from werkzeug.serving import make_server
+    from app import main
+    server = make_server('127.0.0.1', 0, main.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.port
+    finally:
+        server.shutdown()
+        thread.join()
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+@contextlib.contextmanager
+def asgi_server():
+    import uvicorn
+    from app import asgi
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(asgi.app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.01)
+    try:
+        yield port
+    finally:
+        server.should_exit = True
+        thread.join()
+
+SERVERS = {'wsgi': wsgi_server, 'asgi': asgi_server}
+
+def _workload(services):
+    counter = itertools.count()
+    return [
+        lambda: ('GET', '/api/credentials?limit=50', None),
+        lambda: ('GET', f'/api/credential/{services[next(counter) % len(services)]}', None),
+        lambda: ('GET', '/api/credentials/search?q=serv', None),
+        lambda: ('GET', '/api/credentials/filter?tag=email&tag=work&mode=or', None),
+        lambda: ('PUT', f'/api/credential/{services[next(counter) % len(services)]}',
+                 {"tags": ["bench"], "fields": {"u": "x"}}),
+    ]
+
+def measure_clients(port, clients, duration, services):
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client():
+        status, cookie = http_request(port, 'POST', '/api/login', {"password": PASSWORD})
+        cookie = cookie.split(';', 1)[0] if status == 200 else None
+        start_barrier.wait()
+        deadline = time.perf_counter() + duration
+        local = []
+        for request in itertools.cycle(_workload(services)):
+            if time.perf_counter() >= deadline:
+                break
+            method, path, body = request()
+            started = time.perf_counter()
+            status, _ = http_request(port, method, path, body, cookie)
+            local.append(time.perf_counter() - started)
+            if status != 200:
+                with lock:
+                    errors.append(status)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    summary = summarize(samples)
+    summary['throughput_rps'] = len(samples) / elapsed if elapsed else 0.0
+    summary['errors'] = len(errors)
+    return summary
+
+def run(modes, client_counts, duration, size):
+    credentials = synthetic_vault(size)
+    services = list(credentials)
+    results = {"size": size, "duration": duration, "modes": {}}
+    for mode in modes:
+        results['modes'][mode] = {}
+        with vault_workspace(credentials):
+            with SERVERS[mode]() as port:
+                for clients in client_counts:
+                    results['modes'][mode][str(clients)] = measure_clients(port, clients, duration, services)
+                    print(f"Finished {mode} with {clients} clients.", file=sys.stderr)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['wsgi', 'asgi'])
+    parser.add_argument('--clients', type=int, nargs='+', default=list(DEFAULT_CLIENTS))
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per client count.")
+    parser.add_argument('--size', type=int, default=1000, help="Credentials in the synthetic vault.")
+    parser.add_argument('--output', help="Write results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    results = run(args.modes, args.clients, args.duration, args.size)
+    for mode, by_clients in results['modes'].items():
+        print(f"\n{mode}")
+        for clients, summary in by_clients.items():
+            print(f"  {clients:>4} clients  {summary['throughput_rps']:>9.1f} req/s  p50 {summary['p50_ms']:>9.3f} ms"
+                  f"  p99 {summary['p99_ms']:>9.3f} ms  errors {summary['errors']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
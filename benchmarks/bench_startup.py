@@ -0,0 +1,143 @@
+"""Measures cold start: import time of the app and time to the first successful login.
+
+Run from the project root:
+
+    python -m benchmarks.bench_startup --servers gunicorn werkzeug --repeat 5
+
+Every sample uses a fresh interpreter. The import phase times `import
+app.main` and reports whether the cryptography backend was loaded by it.
+The login phase starts a server process against a vault with one user and
+polls POST /api/login until it succeeds, timing from process spawn.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.harness import http_request
+from benchmarks.run import PASSWORD, vault_workspace
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPEAT = 5
+LOGIN_TIMEOUT = 60
+
+_IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({'import_s': elapsed, 'cryptography_loaded': 'cryptography' in sys.modules}))
+"""
+
+def server_environment(**overrides):
+    return dict(os.environ, PYTHONPATH=PROJECT_ROOT, LOG_LEVEL='WARNING', **overrides)
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def server_command(server, port):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '--config', os.path.join(PROJECT_ROOT, 'gunicorn.conf.py'),
+                '--bind', f'127.0.0.1:{port}', 'app.main:app']
+    return [sys.executable, '-c',
+            f"from werkzeug.serving import run_simple; from app.main import app; "
+            f"run_simple('127.0.0.1', {port}, app, threaded=True)"]
+
+def available_servers():
+    servers = ['werkzeug']
+    if importlib.util.find_spec('gunicorn') is not None:
+        servers.insert(0, 'gunicorn')
+    return servers
+
+def measure_import():
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', _IMPORT_SNIPPET], cwd=PROJECT_ROOT, env=server_environment(),
+                            capture_output=True, text=True, check=True).stdout
+    process_s = time.perf_counter() - start
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_s'] = process_s
+    return result
+
+@contextlib.contextmanager
+def server_process(server, port, environment=None):
+    """Runs server on port in its own process until the block exits. Run inside a vault_workspace."""
+    process = subprocess.Popen(server_command(server, port), env=environment or server_environment(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def wait_for_login(process, port):
+    """Polls POST /api/login until it returns 200, and returns that response's Set-Cookie header."""
+    deadline = time.perf_counter() + LOGIN_TIMEOUT
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            status, cookie = http_request(port, 'POST', '/api/login', {"password": PASSWORD})
+        except OSError:
+            status = None
+        if status == 200:
+            return cookie
+        time.sleep(0.01)
+    raise RuntimeError(f"No successful login within {LOGIN_TIMEOUT} s")
+
+def measure_first_login(server):
+    """Seconds from spawning server until POST /api/login first returns 200. Run inside a vault_workspace."""
+    port = free_port()
+    start = time.perf_counter()
+    with server_process(server, port) as process:
+        wait_for_login(process, port)
+        return time.perf_counter() - start
+
+def _milliseconds(samples):
+    return {'p50_ms': statistics.median(samples) * 1000, 'min_ms': min(samples) * 1000, 'max_ms': max(samples) * 1000}
+
+def run(servers, repeat):
+    imports = [measure_import() for _ in range(repeat)]
+    results = {
+        'import': _milliseconds([sample['import_s'] for sample in imports]),
+        'import_process': _milliseconds([sample['process_s'] for sample in imports]),
+        'cryptography_loaded_on_import': any(sample['cryptography_loaded'] for sample in imports),
+        'first_login': {},
+    }
+    with vault_workspace({"GitHub": {"tags": ["dev"], "fields": {"username": "octocat"}}}):
+        for server in servers:
+            results['first_login'][server] = _milliseconds([measure_first_login(server) for _ in range(repeat)])
+            print(f"Finished {server}.", file=sys.stderr)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', nargs='+', choices=['gunicorn', 'werkzeug'], default=available_servers())
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--output', help="Write results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    results = run(args.servers, args.repeat)
+    print(f"{'phase':<28} {'p50 ms':>10} {'min ms':>10} {'max ms':>10}")
+    rows = [('import app.main', results['import']), ('interpreter + import', results['import_process'])]
+    rows += [(f'first login ({server})', summary) for server, summary in results['first_login'].items()]
+    for label, summary in rows:
+        print(f"{label:<28} {summary['p50_ms']:>10.1f} {summary['min_ms']:>10.1f} {summary['max_ms']:>10.1f}")
+    print(f"\ncryptography loaded by the import: {'yes' if results['cryptography_loaded_on_import'] else 'no'}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Compares two benchmarks.run result files and flags p50 regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 1.25
+
+Exits with status 1 when any benchmark got slower than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+def _index(results):
+    entries = {}
+    for run_result in results['runs']:
+        for group in ('password_manager', 'routes'):
+            for name, summary in run_result.get(group, {}).items():
+                entries[(run_result['size'], run_result['tag_cardinality'], name)] = summary
+    return entries
+
+def compare(baseline, candidate, threshold):
+    old, new = _index(baseline), _index(candidate)
+    regressions = []
+    for key in sorted(old.keys() & new.keys(), key=str):
+        size, tag_cardinality, name = key
+        before, after = old[key]['p50_ms'], new[key]['p50_ms']
+        ratio = after / before if before else float('inf')
+        marker = ''
+        if ratio > threshold:
+            marker = '  REGRESSION'
+            regressions.append(key)
+        print(f"{size:>7} {tag_cardinality:>5} {name:<40} {before:>10.3f} -> {after:>10.3f} ms  x{ratio:.2f}{marker}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=1.25, help="Slowdown ratio that counts as a regression.")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    regressions = compare(baseline, candidate, args.threshold)
+    print(f"\n{len(regressions)} regressions.")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
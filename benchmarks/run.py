@@ -0,0 +1,227 @@
+"""Benchmarks PasswordManager hot paths and every /api route against synthetic vaults.
+
+Run from the project root:
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --output results.json
+
+Compare two result files with `python -m benchmarks.compare old.json new.json`.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.harness import measure
+from benchmarks.synthetic import synthetic_vault
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_TAG_CARDINALITIES = (20, 200)
+PASSWORD = "benchmark_master_password"
+
+@contextlib.contextmanager
+def vault_workspace(credentials):
+    """A temporary working directory holding one user whose vault contains credentials."""
+    from app.password_logic import PasswordManager, vault_cache
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            os.mkdir('instance')
+            manager = PasswordManager(PASSWORD)
+            manager.set_key(PASSWORD)
+            manager.save_credentials(credentials)
+            vault_cache.clear()
+            yield manager
+        finally:
+            vault_cache.clear()
+            os.chdir(previous_cwd)
+
+def repeat_for(size, repeat):
+    # Whole-vault operations on big vaults are slow; keep the run time roughly constant
+    return max(3, min(repeat, repeat * 10_000 // size))
+
+def bench_password_manager(credentials, repeat):
+    from app.password_logic import vault_cache
+    results = {}
+    services = list(credentials)
+    scaled = repeat_for(len(credentials), repeat)
+    counter = itertools.count()
+
+    with vault_workspace(credentials) as manager:
+        salt = manager.load_salt()
+        results['derive_key'] = measure(lambda: manager.derive_key(PASSWORD, salt), repeat=min(repeat, 5), warmup=1)
+        results['load_credentials_cold'] = measure(manager.load_credentials, repeat=scaled, warmup=1, setup=vault_cache.clear)
+        results['load_credentials_warm'] = measure(manager.load_credentials, repeat=scaled)
+        results['save_credentials'] = measure(lambda: manager.save_credentials(credentials), repeat=scaled, warmup=1)
+        results['create_credential'] = measure(
+            lambda: manager.create_credential(f"bench-new-{next(counter)}", ["bench"], {"u": "x"}), repeat=repeat)
+        results['update_credential'] = measure(
+            lambda: manager.update_credential(services[0], ["bench", "updated"], {"u": "y"}), repeat=repeat)
+        results['delete_credential'] = measure(
+            lambda: manager.delete_credential(f"bench-del-{next(counter) - 1}"),
+            repeat=repeat,
+            setup=lambda: manager.create_credential(f"bench-del-{next(counter)}", ["bench"], {"u": "x"}),
+        )
+        results['search_credentials'] = measure(lambda: manager.search_credentials("serv"), repeat=repeat)
+        results['search_credentials_cold_index'] = measure(
+            lambda: manager.search_credentials("serv"), repeat=scaled, warmup=1, setup=vault_cache.clear)
+        results['get_all_tags'] = measure(manager.get_all_tags, repeat=repeat)
+        results['filter_credentials'] = measure(lambda: manager.filter_credentials(["email", "work"], 'or'), repeat=repeat)
+        results['list_credentials'] = measure(lambda: manager.list_credentials(limit=50), repeat=repeat)
+        results['get_credential'] = measure(lambda: manager.get_credential(services[-1]), repeat=repeat)
+    return results
+
+def bench_routes(credentials, repeat):
+    from app import main
+    results = {}
+    services = list(credentials)
+    scaled = repeat_for(len(credentials), repeat)
+    counter = itertools.count()
+    import_body = json.dumps({f"imported-{i}": {"tags": ["import"], "fields": {"u": "x"}} for i in range(100)}).encode()
+    # Each password change moves the vault to the other password, ending back on PASSWORD
+    passwords = itertools.cycle([f"{PASSWORD}-changed", PASSWORD])
+    current_password = [PASSWORD]
+
+    with vault_workspace(credentials):
+        main.key_cache.clear()
+        main.app.config['TESTING'] = True
+        client = main.app.test_client()
+
+        def login():
+            response = client.post('/api/login', json={"password": PASSWORD})
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        def request(method, url, **kwargs):
+            def call():
+                response = client.open(url, method=method, **kwargs)
+                assert response.status_code < 400, (url, response.status_code)
+                response.get_data()
+            return call
+
+        def factory_request(method, url_factory, body_factory=None):
+            def call():
+                kwargs = body_factory() if body_factory else {}
+                response = client.open(url_factory(), method=method, **kwargs)
+                assert response.status_code < 400, (method, response.status_code)
+                response.get_data()
+            return call
+
+        def change_password():
+            current_password[0] = next(passwords)
+            return {"json": {"new_password": current_password[0]}}
+
+        results['POST /api/login'] = measure(login, repeat=min(repeat, 5), warmup=1)
+        login()
+        # Taken before the writes below, so the sync request has their changes to return
+        since = client.get('/api/sync').get_json()["revision"]
+        results['GET /api/credentials'] = measure(request('GET', '/api/credentials'), repeat=scaled)
+        results['GET /api/credentials?limit=50'] = measure(request('GET', '/api/credentials?limit=50'), repeat=repeat)
+        results['GET /api/credential/<service>'] = measure(request('GET', f'/api/credential/{services[-1]}'), repeat=repeat)
+        results['GET /api/credentials/search'] = measure(request('GET', '/api/credentials/search?q=serv'), repeat=repeat)
+        results['GET /api/credentials/search?fuzzy=1'] = measure(
+            request('GET', '/api/credentials/search?q=servce&fuzzy=1'), repeat=repeat)
+        results['GET /api/credentials/filter'] = measure(
+            request('GET', '/api/credentials/filter?tag=email&tag=work&mode=or'), repeat=repeat)
+        results['GET /api/tags'] = measure(request('GET', '/api/tags'), repeat=repeat)
+        results['GET /api/tags/suggest'] = measure(request('GET', '/api/tags/suggest?prefix=w'), repeat=repeat)
+        results['POST /api/credentials'] = measure(factory_request(
+            'POST', lambda: '/api/credentials',
+            lambda: {"json": {"service": f"route-new-{next(counter)}", "tags": ["bench"], "fields": {"u": "x"}}},
+        ), repeat=repeat)
+        results['PUT /api/credential/<service>'] = measure(request(
+            'PUT', f'/api/credential/{services[0]}', json={"tags": ["bench"], "fields": {"u": "y"}}), repeat=repeat)
+        results['DELETE /api/credential/<service>'] = measure(
+            factory_request('DELETE', lambda: f'/api/credential/route-del-{next(counter) - 1}'),
+            repeat=repeat,
+            setup=lambda: client.post('/api/credentials', json={
+                "service": f"route-del-{next(counter)}", "tags": ["bench"], "fields": {"u": "x"}}),
+        )
+        results['POST /api/credentials/batch'] = measure(factory_request(
+            'POST', lambda: '/api/credentials/batch',
+            lambda: {"json": {"operations": [
+                {"op": "upsert", "service": f"route-batch-{next(counter)}", "tags": ["bench"], "fields": {"u": "x"}}
+                for _ in range(10)
+            ]}},
+        ), repeat=repeat)
+        results['GET /api/sync'] = measure(request('GET', f'/api/sync?since={since}'), repeat=repeat)
+        results['POST /api/export'] = measure(request('POST', '/api/export'), repeat=scaled)
+        results['POST /api/import'] = measure(factory_request(
+            'POST', lambda: '/api/import',
+            lambda: {"data": {"file": (io.BytesIO(import_body), "import.json")}},
+        ), repeat=scaled)
+        results['POST /api/password'] = measure(
+            factory_request('POST', lambda: '/api/password', change_password), repeat=min(repeat, 5), warmup=1)
+        if current_password[0] != PASSWORD:
+            client.post('/api/password', json={"new_password": PASSWORD})
+        results['POST /api/logout'] = measure(request('POST', '/api/logout'), repeat=min(repeat, 5), setup=login)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, tag_cardinalities, repeat, groups):
+    runs = []
+    for size in sizes:
+        for tag_cardinality in tag_cardinalities:
+            credentials = synthetic_vault(size, tag_cardinality)
+            run_result = {"size": size, "tag_cardinality": tag_cardinality}
+            if 'password_manager' in groups:
+                run_result['password_manager'] = bench_password_manager(credentials, repeat)
+            if 'routes' in groups:
+                run_result['routes'] = bench_routes(credentials, repeat)
+            runs.append(run_result)
+            print(f"Finished {size} credentials with {tag_cardinality} tags.", file=sys.stderr)
+    return {
+        "meta": {
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "repeat": repeat,
+        },
+        "runs": runs,
+    }
+
+def print_table(results):
+    for run_result in results['runs']:
+        print(f"\n{run_result['size']} credentials, {run_result['tag_cardinality']} distinct tags")
+        for group in ('password_manager', 'routes'):
+            for name, summary in run_result.get(group, {}).items():
+                print(f"  {name:<40} p50 {summary['p50_ms']:>10.3f} ms  p99 {summary['p99_ms']:>10.3f} ms"
+                      f"  {summary['ops_per_sec']:>10.1f} ops/s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--tag-cardinality', type=int, nargs='+', default=list(DEFAULT_TAG_CARDINALITIES))
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--only', choices=('password_manager', 'routes'), help="Run a single group of benchmarks.")
+    parser.add_argument('--output', help="Write results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    # Per-operation INFO logs would dominate the timings
+    import logging
+    logging.disable(logging.INFO)
+
+    groups = {args.only} if args.only else {'password_manager', 'routes'}
+    results = run(args.sizes, args.tag_cardinality, args.repeat, groups)
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""Deterministic synthetic vaults for benchmarks."""
+import random
+import string
+
+BASE_TAGS = ["email", "work", "dev", "finance", "social", "shopping"]
+
+def tag_pool(cardinality):
+    return (BASE_TAGS + [f"tag{i}" for i in range(max(0, cardinality - len(BASE_TAGS)))])[:cardinality]
+
+def synthetic_vault(size, tag_cardinality=200, seed=0, max_tags=4):
+    """Returns a credentials dict with size entries drawing tags from tag_cardinality distinct tags."""
+    rng = random.Random(seed)
+    tags = tag_pool(tag_cardinality)
+    credentials = {}
+    for i in range(size):
+        name = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        credentials[f"{name}-service{i}"] = {
+            "tags": rng.sample(tags, rng.randint(1, min(max_tags, len(tags)))),
+            "fields": {
+                "username": f"{name}@example.com",
+                "password": "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(16)),
+            },
+        }
+    return credentials
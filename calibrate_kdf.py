@@ -0,0 +1,49 @@
+import argparse
+import json
+import os
+import sys
+import time
+from app.kdf import ARGON2ID, PBKDF2, SCRYPT, KDFError, calibrate, derive, save_target_params
+from app.logging_config import configure_logging
+import logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+def measure(params, repeat=3):
+    # Median derivation time in seconds
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        derive('calibration password', b'\0' * 16, params)
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark this host and pick key derivation parameters for a target login latency.")
+    parser.add_argument('--algorithm', choices=(PBKDF2, SCRYPT, ARGON2ID), default=SCRYPT)
+    parser.add_argument('--target-ms', type=float, default=250, help="Time one key derivation may take.")
+    parser.add_argument('--max-memory-mib', type=int, default=256, help="Memory cap for scrypt and Argon2id.")
+    parser.add_argument('--write', action='store_true',
+                        help="Save the parameters to instance/kdf.json. New vaults use them, and "
+                             "existing vaults are rehashed to them when their user next logs in.")
+    args = parser.parse_args(argv)
+
+    try:
+        params = calibrate(args.algorithm, args.target_ms / 1000, args.max_memory_mib)
+    except KDFError as e:
+        logger.error(f"Calibration failed: {e}")
+        sys.exit(1)
+    logger.info(f"Selected parameters: {json.dumps(params)} ({measure(params) * 1000:.0f} ms per derivation)")
+
+    if args.write:
+        instance_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+        os.makedirs(instance_dir, exist_ok=True)
+        save_target_params(params)
+        logger.info(f"Parameters written to {os.path.join('instance', 'kdf.json')}")
+    else:
+        print(json.dumps(params, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
+import argparse
 import os
 import sys
 from app.password_logic import PasswordManager
+from app.user_registry import DEFAULT_SHARD_DEPTH, get_registry
+from app.logging_config import configure_logging
 import logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
-def create_new_user():
+def create_new_user(shard_depth=DEFAULT_SHARD_DEPTH):
     logger.info("--- Create New User ---")
     master_password = input("Enter a master password for the new user: ")
 
@@ -17,17 +20,15 @@ def create_new_user():
     # Create an instance of PasswordManager with the new master password as user_id
     pm = PasswordManager(master_password)
 
-    # Check if salt file already exists for this user_id
-    if os.path.exists(pm.salt_filename):
+    # Check if this user_id is already registered (or has legacy files)
+    if pm.exists():
         logger.warning(f"A user with this master password already exists. Salt file found at: {pm.salt_filename}")
         logger.warning("If you wish to create a new user, please choose a different master password.")
         return
 
-    # Set the key, which will generate a new salt and an empty credentials file
-    pm.set_key(master_password)
-
-    if pm.key is None:
-        logger.error("Failed to set encryption key. User creation failed.")
+    # Generate a new salt and an empty credentials file in a sharded directory, and register them
+    if not pm.provision(shard_depth):
+        logger.error("Failed to create user files. User creation failed.")
         return
 
     logger.info(f"\nUser successfully created!")
@@ -35,7 +36,39 @@ def create_new_user():
     logger.info(f"Salt will be stored in: {pm.salt_filename}")
     logger.info("You can now use this master password to log in to the main application.")
 
-if __name__ == "__main__":
+def provision_users(passwords, shard_depth=DEFAULT_SHARD_DEPTH, batch_size=1000):
+    """Creates a user per master password and registers them in batches. Returns (created, skipped)."""
+    registry = get_registry()
+    created = skipped = 0
+    pending = []
+    for master_password in passwords:
+        pm = PasswordManager(master_password)
+        if not pm.provision(shard_depth, register=False):
+            skipped += 1
+            continue
+        pending.append(pm.registry_row())
+        if len(pending) >= batch_size:
+            created += registry.register_many(pending)
+            pending.clear()
+    if pending:
+        created += registry.register_many(pending)
+    return created, skipped
+
+def read_passwords(stream):
+    # One master password per line; blank lines are ignored
+    for line in stream:
+        line = line.rstrip('\r\n')
+        if line:
+            yield line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create password manager users.")
+    parser.add_argument('--bulk', metavar='FILE',
+                        help="Provision one user per line of FILE ('-' for stdin) instead of prompting.")
+    parser.add_argument('--shard-depth', type=int, default=DEFAULT_SHARD_DEPTH,
+                        help="Directory levels under instance/ that new vaults are spread across.")
+    args = parser.parse_args(argv)
+
     # Ensure the 'instance' directory exists
     instance_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
     if not os.path.exists(instance_dir):
@@ -46,4 +79,17 @@ if __name__ == "__main__":
             logger.critical(f"Failed to create instance directory {instance_dir}: {e}")
             sys.exit(1) # Exit if we can't create the instance directory
 
-    create_new_user()
\ No newline at end of file
+    if args.bulk is None:
+        create_new_user(args.shard_depth)
+        return
+    if args.bulk == '-':
+        created, skipped = provision_users(read_passwords(sys.stdin), args.shard_depth)
+    else:
+        with open(args.bulk) as f:
+            created, skipped = provision_users(read_passwords(f), args.shard_depth)
+    logger.info(f"Provisioned {created} users; skipped {skipped} that already existed or failed.")
+    if skipped:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Gunicorn settings for the production server, picked up automatically by
+
+    gunicorn app.main:app
+
+from the project root. Each setting can be changed through the environment
+variable next to it.
+"""
+import os
+from app.crypto_pool import DEFAULT_WORKERS
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Workers share instance/: vault writes take an fcntl lock and each worker's
+# vault cache revalidates against the file, so any worker can serve any session.
+# A session landing on a worker without its cached key derives it once there.
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2, os.cpu_count() or 1)))
+# Requests block on the crypto pool and on disk, so each worker serves several at once
+worker_class = 'gthread'
+
+# Threads a login storm can never take: the crypto pool only admits workers + queue
+# jobs, so with threads above that, surplus logins get 503 and cheap routes still run
+RESERVED_THREADS = 2
+crypto_workers = int(os.environ.get('CRYPTO_POOL_WORKERS', DEFAULT_WORKERS))
+threads = int(os.environ.get('GUNICORN_THREADS', 2 * crypto_workers + RESERVED_THREADS))
+crypto_workers = max(1, min(crypto_workers, threads - RESERVED_THREADS))
+crypto_queue = max(0, threads - RESERVED_THREADS - crypto_workers)
+# app.main sizes its pool from these when the preloaded app is imported, after this file
+os.environ['CRYPTO_POOL_WORKERS'] = str(crypto_workers)
+os.environ['CRYPTO_POOL_MAX_QUEUE'] = str(min(int(os.environ.get('CRYPTO_POOL_MAX_QUEUE', crypto_queue)), crypto_queue))
+
+# Import the app once in the master; workers are forked with it already loaded
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 10
+
+# Worker heartbeats go to memory instead of the SD card or overlay filesystem
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Application logs go to stderr through app.logging_config; LOG_LEVEL sets both
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
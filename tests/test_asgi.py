@@ -0,0 +1,117 @@
+import asyncio
+import io
+import json
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.password_logic import PasswordManager
+
+pytest.importorskip('quart')
+from app import asgi, main
+
+PASSWORD = "master_password"
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "instance").mkdir()
+    PasswordManager(PASSWORD).set_key(PASSWORD)
+    main.key_cache.clear()
+    asgi.app.config['TESTING'] = True
+    return asgi.app.test_client()
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_login_and_crud(client):
+    async def scenario():
+        assert (await client.post('/api/login', json={"password": "nobody"})).status_code == 401
+        assert (await client.get('/api/credentials')).status_code == 401
+        assert (await client.post('/api/login', json={"password": PASSWORD})).status_code == 200
+
+        response = await client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+        assert response.status_code == 200
+        response = await client.put('/api/credentials/Google', json={"tags": ["work"], "fields": {"u": "b"}})
+        assert response.status_code == 200
+        assert await (await client.get('/api/credentials')).get_json() == {"Google": {"tags": ["work"], "fields": {"u": "b"}}}
+        assert await (await client.get('/api/credentials?limit=10')).get_json() == {
+            "items": [{"service": "Google", "tags": ["work"]}], "next_cursor": None}
+        assert await (await client.get('/api/credentials/search?q=goo')).get_json() == ["Google"]
+        assert await (await client.get('/api/tags')).get_json() == {"work": 1}
+        assert await (await client.get('/api/tags?top=5')).get_json() == [{"tag": "work", "count": 1}]
+        assert (await client.delete('/api/credentials/Google')).status_code == 200
+        assert (await client.get('/api/credential/Google')).status_code == 404
+
+        assert (await client.post('/api/logout')).status_code == 200
+        assert (await client.get('/api/credentials')).status_code == 401
+    run(scenario())
+
+def test_shares_vault_with_wsgi_app(client):
+    async def scenario():
+        assert (await client.post('/api/login', json={"password": PASSWORD})).status_code == 200
+        response = await client.post('/api/credentials/batch', json={"operations": [
+            {"op": "upsert", "service": "A", "tags": ["t"], "fields": {"u": "1"}},
+            {"op": "upsert", "service": "B", "tags": ["t"], "fields": {"u": "2"}},
+        ]})
+        assert (await response.get_json())["applied"] == 2
+    run(scenario())
+
+    main.app.config['TESTING'] = True
+    with main.app.test_client() as wsgi_client:
+        assert wsgi_client.post('/api/login', json={"password": PASSWORD}).status_code == 200
+        assert sorted(wsgi_client.get('/api/credentials').get_json()) == ["A", "B"]
+
+def test_export_and_import(client):
+    async def scenario():
+        assert (await client.post('/api/login', json={"password": PASSWORD})).status_code == 200
+        upload = json.dumps({"Imported": {"tags": ["x"], "fields": {"u": "1"}}}).encode()
+        response = await client.post('/api/import', files={
+            "file": FileStorage(io.BytesIO(upload), filename="import.json")})
+        assert (await response.get_json())["imported"] == 1
+
+        response = await client.post('/api/export')
+        assert json.loads(await response.get_data()) == {"Imported": {"tags": ["x"], "fields": {"u": "1"}}}
+
+        encrypted = await (await client.post('/api/export', json={"password": "backup"})).get_data()
+        assert (await client.delete('/api/credentials/Imported')).status_code == 200
+        response = await client.post('/api/import', files={
+            "file": FileStorage(io.BytesIO(encrypted), filename="credentials.pmexport")}, form={"password": "backup"})
+        assert (await response.get_json())["imported"] == 1
+    run(scenario())
+
+def test_saturated_crypto_pool_returns_503(client, monkeypatch):
+    def saturated(*args, **kwargs):
+        raise main.PoolSaturatedError(2)
+    # Routes run in worker threads, so they wait on the pool like the WSGI app's
+    monkeypatch.setattr(main.crypto_pool, 'run', saturated)
+
+    async def scenario():
+        response = await client.post('/api/login', json={"password": PASSWORD})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '2'
+    run(scenario())
+
+def test_conditional_requests_share_validators_with_wsgi_app(client):
+    async def scenario():
+        assert (await client.post('/api/login', json={"password": PASSWORD})).status_code == 200
+        await client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+        response = await client.get('/api/credentials?limit=10')
+        etag = response.headers['ETag']
+        assert (await client.get('/api/credentials?limit=10', headers={'If-None-Match': etag})).status_code == 304
+        return etag
+    etag = run(scenario())
+
+    main.app.config['TESTING'] = True
+    with main.app.test_client() as wsgi_client:
+        assert wsgi_client.post('/api/login', json={"password": PASSWORD}).status_code == 200
+        assert wsgi_client.get('/api/credentials?limit=10', headers={'If-None-Match': etag}).status_code == 304
+
+def test_sync_endpoint(client):
+    async def scenario():
+        assert (await client.post('/api/login', json={"password": PASSWORD})).status_code == 200
+        start = await (await client.get('/api/sync')).get_json()
+        await client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+        response = await client.get(f'/api/sync?since={start["revision"]}')
+        assert await response.get_json() == {"revision": start["revision"] + 1, "full_resync": False,
+                                             "upserts": [{"service": "Google", "tags": ["email"]}], "deletes": []}
+        assert (await client.get('/api/sync?since=-1')).status_code == 400
+    run(scenario())
@@ -0,0 +1,45 @@
+from benchmarks import bench_search, bench_serialization, bench_serving, bench_startup
+from benchmarks.compare import compare
+from benchmarks.harness import summarize
+from benchmarks.run import run
+
+def test_summarize_percentiles():
+    summary = summarize([0.001 * i for i in range(1, 101)])
+    assert summary["samples"] == 100
+    assert round(summary["p50_ms"]) == 51
+    assert round(summary["p99_ms"]) == 99
+    assert round(summary["max_ms"]) == 100
+
+def test_benchmark_run_smoke():
+    results = run([30], [5], repeat=1, groups={'password_manager', 'routes'})
+    (run_result,) = results["runs"]
+    assert "search_credentials" in run_result["password_manager"]
+    for route in ("GET /api/tags", "GET /api/sync", "GET /api/tags/suggest", "POST /api/password",
+                  "GET /api/credentials/search?fuzzy=1"):
+        assert route in run_result["routes"]
+    assert compare(results, results, threshold=1.25) == []
+
+def test_serving_benchmark_smoke():
+    results = bench_serving.run(['wsgi'], [2], duration=0.2, size=20)
+    summary = results["modes"]["wsgi"]["2"]
+    assert summary["samples"] > 0
+    assert summary["errors"] == 0
+
+def test_serialization_benchmark_smoke():
+    results = bench_serialization.run([20], ['json', 'binary+zlib'], repeat=1)
+    formats = results["runs"][0]["formats"]
+    assert formats["binary+zlib"]["file_bytes"] < formats["json"]["file_bytes"]
+    assert formats["json"]["load_all"]["samples"] > 0
+
+def test_fuzzy_search_benchmark_smoke():
+    results = bench_search.bench_fuzzy(200, repeat=2)
+    assert len(results["queries"]) == len(bench_search.FIXED_FUZZY_QUERIES) + 10
+    assert bench_search.over_budget(results, budget_ms=1e9) == {}
+    assert set(bench_search.over_budget(results, budget_ms=0)) == set(results["queries"]) | {"(first query)"}
+
+def test_startup_benchmark_smoke():
+    results = bench_startup.run(['werkzeug'], repeat=1)
+    # Crypto backends load on first use, not when the app is imported
+    assert results["cryptography_loaded_on_import"] is False
+    assert results["import"]["p50_ms"] > 0
+    assert results["first_login"]["werkzeug"]["p50_ms"] > 0
@@ -0,0 +1,34 @@
+from app.change_journal import ChangeJournal
+from app.vault_log import batch_record, delete_record, upsert_record
+
+def test_changes_since_reports_each_service_once_with_its_last_op():
+    journal = ChangeJournal()
+    journal.add_record(1, upsert_record("Google", {"tags": ["email"]}))
+    journal.add_record(2, batch_record([upsert_record("GitHub", {"tags": ["dev"]}), delete_record("Google")]))
+    journal.add_record(3, upsert_record("GitHub", {"tags": ["work"]}))
+
+    assert journal.changes_since(0) == {"GitHub": "upsert", "Google": "delete"}
+    assert journal.changes_since(2) == {"GitHub": "upsert"}
+    assert journal.changes_since(3) == {}
+
+def test_bounded_journal_moves_its_start():
+    journal = ChangeJournal(max_entries=3)
+    for revision in range(1, 6):
+        journal.add(revision, "upsert", f"service{revision}")
+    assert len(journal) == 3
+    assert journal.start == 2
+    assert journal.changes_since(1) is None
+    assert journal.changes_since(2) == {"service3": "upsert", "service4": "upsert", "service5": "upsert"}
+
+def test_restore_round_trip():
+    journal = ChangeJournal(5)
+    journal.add(6, "delete", "Google")
+    restored = ChangeJournal()
+    restored.restore(journal.to_dict(), 6)
+    assert restored.start == 5
+    assert restored.changes_since(5) == {"Google": "delete"}
+
+    # Snapshots without a journal are only complete from their own revision on
+    restored.restore(None, 9)
+    assert restored.changes_since(8) is None
+    assert restored.changes_since(9) == {}
@@ -0,0 +1,61 @@
+import os
+import runpy
+import threading
+import pytest
+from app.crypto_pool import CryptoPool, PoolSaturatedError
+
+def test_run_returns_result():
+    pool = CryptoPool(max_workers=2, max_queue=0)
+    assert pool.run(pow, 2, 10) == 1024
+    assert pool.stats() == {"in_flight": 0, "completed": 1, "rejected": 0}
+    pool.shutdown()
+
+def test_run_propagates_exceptions():
+    pool = CryptoPool(max_workers=1, max_queue=0)
+    with pytest.raises(ZeroDivisionError):
+        pool.run(lambda: 1 / 0)
+    # The failed job still frees its slot
+    assert pool.run(lambda: "ok") == "ok"
+    pool.shutdown()
+
+def test_saturated_pool_rejects_without_waiting():
+    pool = CryptoPool(max_workers=1, max_queue=1, retry_after=3)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait(5)
+
+    callers = [threading.Thread(target=pool.run, args=(blocked,)) for _ in range(2)]
+    for caller in callers:
+        caller.start()
+    started.wait(5)
+    while pool.stats()["in_flight"] < 2:
+        pass
+
+    with pytest.raises(PoolSaturatedError) as excinfo:
+        pool.run(lambda: None)
+    assert excinfo.value.retry_after == 3
+    assert pool.stats()["rejected"] == 1
+
+    release.set()
+    for caller in callers:
+        caller.join()
+    assert pool.run(lambda: "ok") == "ok"
+    pool.shutdown()
+
+def test_gunicorn_config_leaves_threads_free_of_the_crypto_pool(monkeypatch):
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+    for threads, workers, queue in [(None, '4', '16'), ('4', '4', None), ('12', '2', '3')]:
+        for name, value in [('GUNICORN_THREADS', threads), ('CRYPTO_POOL_WORKERS', workers), ('CRYPTO_POOL_MAX_QUEUE', queue)]:
+            if value is None:
+                monkeypatch.delenv(name, raising=False)
+            else:
+                monkeypatch.setenv(name, value)
+        config = runpy.run_path(config_path)
+        pool_slots = int(os.environ['CRYPTO_POOL_WORKERS']) + int(os.environ['CRYPTO_POOL_MAX_QUEUE'])
+        assert int(os.environ['CRYPTO_POOL_WORKERS']) >= 1
+        assert pool_slots <= config['threads'] - config['RESERVED_THREADS']
+    # Below the cap, an explicit queue is kept
+    assert os.environ['CRYPTO_POOL_MAX_QUEUE'] == '3'
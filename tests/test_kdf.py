@@ -0,0 +1,44 @@
+import pytest
+from app.kdf import (
+    LEGACY_PARAMS, KDF_MAGIC, KDFError, calibrate, decode_salt_file, derive, encode_salt_file,
+)
+
+SCRYPT_PARAMS = {"algorithm": "scrypt", "n": 1024, "r": 8, "p": 1}
+
+def test_legacy_salt_file_means_pbkdf2():
+    assert decode_salt_file(b"0123456789abcdef") == (b"0123456789abcdef", LEGACY_PARAMS, None)
+
+def test_salt_file_round_trip():
+    data = encode_salt_file(b"s" * 16, SCRYPT_PARAMS, pending=(b"t" * 16, LEGACY_PARAMS))
+    assert data.startswith(KDF_MAGIC)
+    assert decode_salt_file(data) == (b"s" * 16, SCRYPT_PARAMS, (b"t" * 16, LEGACY_PARAMS))
+    with pytest.raises(KDFError):
+        decode_salt_file(KDF_MAGIC + b"{not json")
+
+@pytest.mark.parametrize("params", [
+    {"algorithm": "pbkdf2-sha256", "iterations": 1000},
+    SCRYPT_PARAMS,
+    {"algorithm": "argon2id", "iterations": 1, "lanes": 1, "memory_cost": 64},
+])
+def test_derive_is_deterministic_per_algorithm(params):
+    if params["algorithm"] == "argon2id":
+        pytest.importorskip("cryptography.hazmat.primitives.kdf.argon2")
+    key = derive("password", b"s" * 16, params)
+    assert len(key) == 32
+    assert derive("password", b"s" * 16, params) == key
+    assert derive("other", b"s" * 16, params) != key
+
+def test_unknown_algorithm():
+    with pytest.raises(KDFError):
+        derive("password", b"s" * 16, {"algorithm": "md5"})
+
+def test_calibrate_scales_pbkdf2_to_target():
+    ticks = iter([0.0, 0.01])
+    params = calibrate("pbkdf2-sha256", target_seconds=1.0, clock=lambda: next(ticks))
+    # 20,000 sample iterations took 10 ms, so one second buys 100 times as many
+    assert params == {"algorithm": "pbkdf2-sha256", "iterations": 2_000_000}
+
+def test_calibrate_never_goes_below_the_floor():
+    ticks = iter([0.0, 10.0])
+    params = calibrate("pbkdf2-sha256", target_seconds=0.001, clock=lambda: next(ticks))
+    assert params["iterations"] == LEGACY_PARAMS["iterations"]
@@ -0,0 +1,68 @@
+import pytest
+from app.key_cache import KeyCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_put_and_get(clock):
+    cache = KeyCache(ttl=60, clock=clock)
+    token = cache.put("user", b"key")
+    assert cache.get(token, "user") == b"key"
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 0}
+
+def test_get_unknown_token_or_wrong_user_is_a_miss(clock):
+    cache = KeyCache(ttl=60, clock=clock)
+    token = cache.put("user", b"key")
+    assert cache.get("unknown", "user") is None
+    assert cache.get(None, "user") is None
+    # A token presented for a different user is dropped, not served
+    assert cache.get(token, "someone_else") is None
+    assert cache.get(token, "user") is None
+    assert cache.stats()["misses"] == 4
+
+def test_entries_expire_after_ttl(clock):
+    cache = KeyCache(ttl=60, clock=clock)
+    token = cache.put("user", b"key")
+    clock.now = 59
+    assert cache.get(token, "user") == b"key"
+    # Access slides the expiry forward
+    clock.now = 118
+    assert cache.get(token, "user") == b"key"
+    clock.now = 179
+    assert cache.get(token, "user") is None
+    assert len(cache) == 0
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = KeyCache(ttl=60, max_entries=2, clock=clock)
+    first = cache.put("a", b"1")
+    second = cache.put("b", b"2")
+    cache.get(first, "a")
+    third = cache.put("c", b"3")
+    assert cache.get(second, "b") is None
+    assert cache.get(first, "a") == b"1"
+    assert cache.get(third, "c") == b"3"
+
+def test_evict(clock):
+    cache = KeyCache(ttl=60, clock=clock)
+    token = cache.put("user", b"key")
+    assert cache.evict(token)
+    assert not cache.evict(token)
+    assert cache.get(token, "user") is None
+
+def test_evict_user(clock):
+    cache = KeyCache(ttl=60, clock=clock)
+    first = cache.put("user", b"key")
+    second = cache.put("user", b"key")
+    other = cache.put("other", b"key")
+    assert cache.evict_user("user") == 2
+    assert cache.get(first, "user") is None
+    assert cache.get(second, "user") is None
+    assert cache.get(other, "other") == b"key"
@@ -0,0 +1,356 @@
+import pytest
+from urllib.parse import quote
+from app import main
+from app.password_logic import PasswordManager
+
+PASSWORD = "master_password"
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # PasswordManager stores vaults under a relative 'instance' directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "instance").mkdir()
+    PasswordManager(PASSWORD).set_key(PASSWORD)
+    main.key_cache.clear()
+    main.app.config['TESTING'] = True
+    with main.app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def logged_in_client(client):
+    response = client.post('/api/login', json={"password": PASSWORD})
+    assert response.status_code == 200
+    return client
+
+def test_login_unknown_user(client):
+    response = client.post('/api/login', json={"password": "nobody"})
+    assert response.status_code == 401
+
+def test_warm_requests_skip_key_derivation(logged_in_client, monkeypatch):
+    calls = []
+    original_derive_key = PasswordManager.derive_key
+    def counting_derive_key(self, password, salt):
+        calls.append(password)
+        return original_derive_key(self, password, salt)
+    monkeypatch.setattr(PasswordManager, 'derive_key', counting_derive_key)
+
+    hits_before = main.key_cache.stats()["hits"]
+    for _ in range(3):
+        assert logged_in_client.get('/api/credentials').status_code == 200
+    assert calls == []
+    assert main.key_cache.stats()["hits"] == hits_before + 3
+
+def test_cold_session_rederives_key(logged_in_client):
+    main.key_cache.clear()
+    assert logged_in_client.get('/api/credentials').status_code == 200
+    assert len(main.key_cache) == 1
+
+def test_logout_evicts_cached_key(logged_in_client):
+    assert len(main.key_cache) == 1
+    assert logged_in_client.post('/api/logout').status_code == 200
+    assert len(main.key_cache) == 0
+    assert logged_in_client.get('/api/credentials').status_code == 401
+
+def test_filter_endpoint(logged_in_client):
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email", "work"], "fields": {"u": "a"}})
+    logged_in_client.post('/api/credentials', json={"service": "Gmail", "tags": ["email"], "fields": {"u": "b"}})
+
+    response = logged_in_client.get('/api/credentials/filter?tag=email&tag=work&mode=or&limit=1')
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "results": [{"service": "Google", "matches": 2}],
+        "total": 2,
+        "offset": 0,
+        "limit": 1,
+    }
+
+    assert logged_in_client.get('/api/credentials/filter?tag=email&mode=xor').status_code == 400
+    assert logged_in_client.get('/api/credentials/filter?tag=email&limit=0').status_code == 400
+
+def test_paginated_listing_and_single_credential(logged_in_client):
+    for service in ["Amazon", "GitHub", "Google"]:
+        logged_in_client.post('/api/credentials', json={"service": service, "tags": ["web"], "fields": {"password": "secret"}})
+
+    response = logged_in_client.get('/api/credentials?limit=2')
+    page = response.get_json()
+    assert page["items"] == [{"service": "Amazon", "tags": ["web"]}, {"service": "GitHub", "tags": ["web"]}]
+    assert "secret" not in response.get_data(as_text=True)
+
+    page = logged_in_client.get(f'/api/credentials?limit=2&cursor={page["next_cursor"]}').get_json()
+    assert page == {"items": [{"service": "Google", "tags": ["web"]}], "next_cursor": None}
+
+    assert logged_in_client.get('/api/credentials?limit=1&include=fields').get_json()["items"] == [
+        {"service": "Amazon", "fields": {"password": "secret"}}
+    ]
+    assert logged_in_client.get('/api/credentials?include=password').status_code == 400
+    assert logged_in_client.get('/api/credentials?cursor=%%%').status_code == 400
+
+    response = logged_in_client.get('/api/credential/GitHub')
+    assert response.get_json() == {"tags": ["web"], "fields": {"password": "secret"}}
+    assert logged_in_client.get('/api/credential/Missing').status_code == 404
+
+def test_credential_route_accepts_any_service_name(logged_in_client):
+    for service in ("example.com/login", "search", "filter", "a/b/c"):
+        logged_in_client.post('/api/credentials', json={"service": service, "tags": ["web"], "fields": {"u": service}})
+    for service in ("example.com/login", "search", "filter", "a/b/c"):
+        response = logged_in_client.get(f"/api/credential/{quote(service, safe='')}")
+        assert response.status_code == 200
+        assert response.get_json() == {"tags": ["web"], "fields": {"u": service}}
+    assert logged_in_client.get('/api/credential/example.com').status_code == 404
+    for service in ("example.com/login", "search", "a/b/c"):
+        path = f"/api/credential/{quote(service, safe='')}"
+        assert logged_in_client.put(path, json={"tags": ["new"], "fields": {"u": "x"}}).status_code == 200
+        assert logged_in_client.get(path).get_json() == {"tags": ["new"], "fields": {"u": "x"}}
+        assert logged_in_client.delete(path).status_code == 200
+        assert logged_in_client.get(path).status_code == 404
+    assert logged_in_client.get('/api/credential/filter').status_code == 200
+
+def test_batch_endpoint(logged_in_client):
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+
+    response = logged_in_client.post('/api/credentials/batch', json={"operations": [
+        {"op": "patch", "service": "Google", "tags": ["mail"]},
+        {"op": "upsert", "service": "GitHub", "tags": ["dev"], "fields": {"u": "b"}},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json() == {"success": True, "applied": 2}
+    assert logged_in_client.get('/api/credential/Google').get_json()["tags"] == ["mail"]
+
+    response = logged_in_client.post('/api/credentials/batch', json={"operations": [
+        {"op": "delete", "service": "GitHub"},
+        {"op": "delete", "service": "GitHub"},
+    ]})
+    assert response.status_code == 400
+    assert logged_in_client.get('/api/credential/GitHub').status_code == 200
+    assert logged_in_client.post('/api/credentials/batch', json={}).status_code == 400
+    for operation in ({"op": "upsert", "service": "X", "tags": "str", "fields": {"u": "x"}},
+                      {"op": "patch", "service": "Google", "fields": "str"}):
+        assert logged_in_client.post('/api/credentials/batch', json={"operations": [operation]}).status_code == 400
+
+def test_invalid_credentials_are_rejected(logged_in_client):
+    for body in ({"service": 5, "tags": ["email"], "fields": {"u": "a"}},
+                 {"service": "Google", "tags": [1], "fields": {"u": "a"}},
+                 {"service": "Google", "tags": ["email"], "fields": {"u": 1}}):
+        response = logged_in_client.post('/api/credentials', json=body)
+        assert response.status_code == 400
+        assert response.get_json()["success"] is False
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+    assert logged_in_client.put('/api/credential/Google', json={"tags": [1], "fields": {"u": "a"}}).status_code == 400
+
+    logged_in_client.post('/api/logout')
+    assert logged_in_client.post('/api/login', json={"password": PASSWORD}).status_code == 200
+    assert logged_in_client.get('/api/credential/Google').get_json() == {"tags": ["email"], "fields": {"u": "a"}}
+
+def test_import_endpoint(logged_in_client):
+    import io
+    import json
+    data = {
+        "GitHub": {"tags": ["dev"], "fields": {"u": "b"}},
+        "Broken": {"tags": [], "fields": {"u": "c"}},
+    }
+    response = logged_in_client.post('/api/import', data={
+        "file": (io.BytesIO(json.dumps(data).encode()), "export.json"),
+    })
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["imported"] == 1
+    assert result["skipped"] == [{"service": "Broken", "reason": "Tags must be a non-empty list of strings."}]
+    assert logged_in_client.get('/api/credential/GitHub').status_code == 200
+
+    response = logged_in_client.post('/api/import', data={
+        "file": (io.BytesIO(b'{"oops"'), "export.json"),
+    })
+    assert response.status_code == 400
+
+def test_export_streams_plain_and_encrypted(logged_in_client):
+    import io
+    import json
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+
+    response = logged_in_client.post('/api/export')
+    assert response.is_streamed
+    assert json.loads(response.get_data()) == {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+
+    response = logged_in_client.post('/api/export', json={"password": "backup"})
+    assert "credentials.pmexport" in response.headers["Content-Disposition"]
+    encrypted = response.get_data()
+    assert b"Google" not in encrypted
+
+    logged_in_client.delete('/api/credentials/Google')
+    response = logged_in_client.post('/api/import', data={"file": (io.BytesIO(encrypted), "credentials.pmexport")})
+    assert response.status_code == 400
+    response = logged_in_client.post('/api/import', data={
+        "file": (io.BytesIO(encrypted), "credentials.pmexport"),
+        "password": "backup",
+    })
+    assert response.status_code == 200
+    assert logged_in_client.get('/api/credential/Google').status_code == 200
+
+def test_metrics_endpoint_and_server_timing(client, monkeypatch):
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setattr(main.metrics, 'enabled', True)
+    monkeypatch.setitem(main.app.config, 'SERVER_TIMING', True)
+    response = client.post('/api/login', json={"password": PASSWORD})
+    assert 'kdf;dur=' in response.headers['Server-Timing']
+    assert 'total;dur=' in response.headers['Server-Timing']
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'pm_request_seconds_count{method="POST",route="/api/login"}' in text
+    assert 'pm_stage_seconds_count{stage="kdf"}' in text
+    assert 'pm_key_cache_hit_ratio' in text
+    assert 'pm_vault_cache_hit_ratio' in text
+
+def test_saturated_crypto_pool_returns_503(client, monkeypatch):
+    def saturated(*args, **kwargs):
+        raise main.PoolSaturatedError(2)
+    monkeypatch.setattr(main.crypto_pool, 'run', saturated)
+
+    response = client.post('/api/login', json={"password": PASSWORD})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    # Routes that need no key derivation are unaffected
+    assert client.post('/api/logout').status_code == 200
+
+def test_encrypted_export_and_import_derive_keys_in_crypto_pool(logged_in_client, monkeypatch):
+    import io
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+    encrypted = logged_in_client.post('/api/export', json={"password": "backup"}).get_data()
+
+    def saturated(*args, **kwargs):
+        raise main.PoolSaturatedError(1)
+    monkeypatch.setattr(main.crypto_pool, 'run', saturated)
+    assert logged_in_client.post('/api/export', json={"password": "backup"}).status_code == 503
+    response = logged_in_client.post('/api/import', data={
+        "file": (io.BytesIO(encrypted), "credentials.pmexport"),
+        "password": "backup",
+    })
+    assert response.status_code == 503
+    # Plain exports derive no key
+    assert logged_in_client.post('/api/export').status_code == 200
+
+def test_change_master_password(logged_in_client):
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+    assert logged_in_client.post('/api/password', json={}).status_code == 400
+    response = logged_in_client.post('/api/password', json={"new_password": "rotated_password"})
+    assert response.status_code == 200
+    assert list(logged_in_client.get('/api/credentials').get_json()) == ["Google"]
+
+    with main.app.test_client() as other_client:
+        assert other_client.post('/api/login', json={"password": PASSWORD}).status_code == 401
+        assert other_client.post('/api/login', json={"password": "rotated_password"}).status_code == 200
+
+def test_password_change_in_another_worker_ends_old_sessions(logged_in_client):
+    import os
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+    # Another worker changes the password; this worker's key cache still holds the old key
+    manager = PasswordManager(PASSWORD)
+    manager.set_key(PASSWORD)
+    assert manager.change_master_password("rotated_password") is not None
+
+    assert logged_in_client.get('/api/credentials').status_code == 401
+    assert logged_in_client.post('/api/credentials', json={"service": "Lost", "tags": ["x"], "fields": {"u": "b"}}).status_code == 401
+    assert not os.path.exists(manager.filename)
+    with main.app.test_client() as other_client:
+        assert other_client.post('/api/login', json={"password": "rotated_password"}).status_code == 200
+        assert list(other_client.get('/api/credentials').get_json()) == ["Google"]
+
+def test_rehash_in_another_worker_rederives_cached_keys(logged_in_client):
+    from app.kdf import save_target_params
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+    # Another worker logs in and rehashes; this worker's key cache still holds the old key
+    save_target_params({"algorithm": "scrypt", "n": 1024, "r": 8, "p": 1})
+    other_worker = PasswordManager(PASSWORD)
+    assert other_worker.unlock(PASSWORD) and other_worker.rehashed
+
+    response = logged_in_client.get('/api/credentials')
+    assert response.status_code == 200
+    assert list(response.get_json()) == ["Google"]
+    assert logged_in_client.post('/api/credentials', json={"service": "GitHub", "tags": ["dev"], "fields": {"u": "b"}}).status_code == 200
+
+def test_top_tags_endpoint(logged_in_client):
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email", "work"], "fields": {"u": "a"}})
+    logged_in_client.post('/api/credentials', json={"service": "Gmail", "tags": ["email"], "fields": {"u": "b"}})
+
+    response = logged_in_client.get('/api/tags?top=1')
+    assert response.status_code == 200
+    assert response.get_json() == [{"tag": "email", "count": 2}]
+    assert logged_in_client.get('/api/tags').get_json() == {"email": 2, "work": 1}
+    assert logged_in_client.get('/api/tags?top=0').status_code == 400
+    assert logged_in_client.get('/api/tags?top=many').status_code == 400
+
+def test_tag_suggest_endpoint(logged_in_client):
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email", "work"], "fields": {"u": "a"}})
+    logged_in_client.post('/api/credentials', json={"service": "Gmail", "tags": ["email", "Entertainment"], "fields": {"u": "b"}})
+
+    response = logged_in_client.get('/api/tags/suggest?prefix=e')
+    assert response.status_code == 200
+    assert response.get_json() == [{"tag": "email", "count": 2}, {"tag": "Entertainment", "count": 1}]
+    assert logged_in_client.get('/api/tags/suggest?prefix=emial').get_json() == [{"tag": "email", "count": 2}]
+    assert logged_in_client.get('/api/tags/suggest?prefix=e&limit=0').status_code == 400
+
+def test_fuzzy_search_endpoint(logged_in_client):
+    logged_in_client.post('/api/credentials', json={"service": "GitHub", "tags": ["dev"], "fields": {"u": "a"}})
+    logged_in_client.post('/api/credentials', json={"service": "Gmail", "tags": ["email"], "fields": {"u": "b"}})
+
+    assert logged_in_client.get('/api/credentials/search?q=gihtub').get_json() == []
+    response = logged_in_client.get('/api/credentials/search?q=gihtub&fuzzy=1')
+    assert response.status_code == 200
+    assert response.get_json() == ["GitHub"]
+    assert logged_in_client.get('/api/credentials/search?q=g&fuzzy=1&limit=1').get_json() == ["GitHub"]
+    assert logged_in_client.get('/api/credentials/search?q=g&fuzzy=1&limit=0').status_code == 400
+
+def test_read_endpoints_answer_conditional_requests(logged_in_client, monkeypatch):
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+    paths = ['/api/credentials', '/api/credentials?limit=10', '/api/tags', '/api/tags?top=5',
+             '/api/credentials/search?q=goo', '/api/credentials/search?q=gogle&fuzzy=1']
+    etags = {}
+    for path in paths:
+        response = logged_in_client.get(path)
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        etags[path] = response.headers['ETag']
+    # Each query is its own representation
+    assert len(set(etags.values())) == len(paths)
+
+    # Unchanged vault: 304 without building a body or opening a single credential
+    def fail(*args, **kwargs):
+        raise AssertionError("body built for a conditional request")
+    with monkeypatch.context() as patched:
+        for method in ('load_credentials', 'list_credentials', 'get_all_tags', 'get_top_tags',
+                       'search_credentials', 'fuzzy_search_credentials'):
+            patched.setattr(PasswordManager, method, fail)
+        for path in paths:
+            response = logged_in_client.get(path, headers={'If-None-Match': etags[path]})
+            assert response.status_code == 304
+            assert response.data == b''
+            assert response.headers['ETag'] == etags[path]
+
+    logged_in_client.put('/api/credentials/Google', json={"tags": ["work"], "fields": {"u": "b"}})
+    response = logged_in_client.get('/api/tags', headers={'If-None-Match': etags['/api/tags']})
+    assert response.status_code == 200
+    assert response.get_json() == {"work": 1}
+    assert response.headers['ETag'] != etags['/api/tags']
+
+def test_conditional_requests_need_a_session(logged_in_client):
+    etag = logged_in_client.get('/api/tags').headers['ETag']
+    logged_in_client.post('/api/logout')
+    assert logged_in_client.get('/api/tags', headers={'If-None-Match': etag}).status_code == 401
+
+def test_sync_endpoint_returns_changes_since_a_revision(logged_in_client):
+    logged_in_client.post('/api/credentials', json={"service": "Google", "tags": ["email"], "fields": {"u": "a"}})
+    start = logged_in_client.get('/api/sync').get_json()
+    assert start["full_resync"] is True
+
+    logged_in_client.post('/api/credentials', json={"service": "GitHub", "tags": ["dev"], "fields": {"u": "b"}})
+    logged_in_client.delete('/api/credentials/Google')
+    response = logged_in_client.get(f'/api/sync?since={start["revision"]}')
+    assert response.status_code == 200
+    assert response.get_json() == {"revision": start["revision"] + 2, "full_resync": False,
+                                   "upserts": [{"service": "GitHub", "tags": ["dev"]}], "deletes": ["Google"]}
+    response = logged_in_client.get(f'/api/sync?since={start["revision"]}&include=tags,fields')
+    assert response.get_json()["upserts"] == [{"service": "GitHub", "tags": ["dev"], "fields": {"u": "b"}}]
+
+    assert logged_in_client.get('/api/sync?since=-1').status_code == 400
+    assert logged_in_client.get('/api/sync?since=soon').status_code == 400
+    assert logged_in_client.get('/api/sync?since=0&include=secrets').status_code == 400
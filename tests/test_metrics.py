@@ -0,0 +1,46 @@
+from app.metrics import Metrics, cache_collector, format_server_timing
+from app.key_cache import KeyCache
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    with metrics.span('kdf'):
+        pass
+    assert metrics.start_request() is None
+    assert metrics.finish_request(None, '/api/login', 'POST') is None
+    assert 'pm_stage_seconds_count' not in metrics.render_prometheus()
+
+def test_spans_feed_histograms_and_request_timing():
+    metrics = Metrics(enabled=True)
+    token = metrics.start_request()
+    with metrics.span('decrypt'):
+        pass
+    with metrics.span('decrypt'):
+        pass
+    with metrics.span('parse'):
+        pass
+    spans = metrics.finish_request(token, '/api/credentials', 'GET')
+    assert [stage for stage, _ in spans] == ['decrypt', 'decrypt', 'parse', 'total']
+
+    # Spans outside a request still reach the histogram
+    with metrics.span('kdf'):
+        pass
+
+    text = metrics.render_prometheus()
+    assert 'pm_stage_seconds_count{stage="decrypt"} 2' in text
+    assert 'pm_stage_seconds_count{stage="kdf"} 1' in text
+    assert 'pm_stage_seconds_bucket{stage="parse",le="+Inf"} 1' in text
+    assert 'pm_request_seconds_count{method="GET",route="/api/credentials"} 1' in text
+
+def test_cache_collector_and_server_timing_format():
+    metrics = Metrics(enabled=True)
+    cache = KeyCache()
+    token = cache.put("user", b"key")
+    cache.get(token, "user")
+    cache.get("missing", "user")
+    metrics.register_collector(cache_collector('pm_key_cache', 'Key cache', cache))
+    text = metrics.render_prometheus()
+    assert 'pm_key_cache_hits_total 1' in text
+    assert 'pm_key_cache_hit_ratio 0.5' in text
+
+    assert format_server_timing([('decrypt', 0.001), ('decrypt', 0.002), ('total', 0.01)]) == \
+        'decrypt;dur=3.00, total;dur=10.00'
@@ -278,3 +278,750 @@ def test_get_all_tags(temp_password_manager):
     # Test when key is not set
     manager.key = None
     assert manager.get_all_tags() == {}
+
+def test_get_top_tags(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email", "work"], {"u": "a"})
+    manager.create_credential("GitHub", ["dev", "work"], {"u": "b"})
+    manager.create_credential("LinkedIn", ["social", "work", "dev"], {"u": "c"})
+    assert manager.get_top_tags(2) == [("work", 3), ("dev", 2)]
+    # Ties are ordered by name
+    assert manager.get_top_tags(4) == [("work", 3), ("dev", 2), ("email", 1), ("social", 1)]
+    assert manager.get_top_tags(10)[-1] == ("social", 1)
+
+def test_tag_counts_follow_every_mutation(temp_password_manager):
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email", "work"], {"u": "a"})
+    manager.create_credential("GitHub", ["dev", "work"], {"u": "b"})
+    manager.update_credential("Google", ["email"], {"u": "a"})
+    manager.delete_credential("GitHub")
+    manager.apply_batch([
+        {"op": "upsert", "service": "Amazon", "tags": ["shopping", "work"], "fields": {"u": "c"}},
+        {"op": "upsert", "service": "Bank", "tags": ["work"], "fields": {"u": "d"}},
+    ])
+    expected = {"email": 1, "shopping": 1, "work": 2}
+    assert manager.get_all_tags() == expected
+    # The same counts come out of replaying the log
+    vault_cache.clear()
+    assert manager.get_all_tags() == expected
+
+# Tests for the decrypted vault cache
+
+def test_repeated_loads_skip_decryption(temp_password_manager, monkeypatch):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+
+    decrypt_calls = []
+    original_decrypt = Fernet.decrypt
+    def counting_decrypt(self, token, *args, **kwargs):
+        decrypt_calls.append(token)
+        return original_decrypt(self, token, *args, **kwargs)
+    monkeypatch.setattr(Fernet, 'decrypt', counting_decrypt)
+
+    assert "Google" in manager.load_credentials()
+    assert manager.search_credentials("goo") == ["Google"]
+    assert manager.get_all_tags() == {"email": 1}
+    assert decrypt_calls == []
+
+def test_loaded_credentials_are_isolated_from_cache(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+
+    creds = manager.load_credentials()
+    creds["Google"]["tags"].append("mutated")
+    creds["Injected"] = {"tags": [], "fields": {}}
+
+    assert manager.load_credentials() == {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+
+def test_cache_invalidated_by_external_write(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    assert "Google" in manager.load_credentials()
+
+    # Another process rewrites the vault behind our back
+    other_manager = PasswordManager("test_user")
+    other_manager.key = manager.key
+    encrypted = Fernet(manager.key).encrypt(json.dumps({"GitHub": {"tags": ["dev"], "fields": {"u": "b"}}}).encode())
+    with open(other_manager.filename, 'wb') as f:
+        f.write(encrypted)
+
+    assert list(manager.load_credentials()) == ["GitHub"]
+
+def test_vault_cache_is_bounded():
+    from app.vault_cache import VaultCache
+    cache = VaultCache(max_entries=2, max_bytes=100)
+    key = Fernet.generate_key()
+    cache.put("a", key, 1, {"a": {}}, 10)
+    cache.put("b", key, 1, {"b": {}}, 10)
+    cache.put("c", key, 1, {"c": {}}, 10)
+    assert cache.get("a", key, 1) is None
+    assert cache.get("c", key, 1) == {"c": {}}
+
+    cache.put("d", key, 1, {"d": {}}, 95)
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 95
+
+    # An oversized vault is cached alone rather than not at all
+    cache.put("e", key, 1, {"e": {}}, 101)
+    assert cache.get("e", key, 1) == {"e": {}}
+    assert cache.stats()["entries"] == 1
+    cache.put("f", key, 1, {"f": {}}, 10)
+    assert cache.get("e", key, 1) is None
+    assert cache.stats()["bytes"] == 10
+    cache.put("d", key, 1, {"d": {}}, 95)
+    # A different key never gets a cached vault
+    assert cache.get("d", Fernet.generate_key(), 1) is None
+
+def test_vault_cache_counts_estimated_memory(temp_password_manager, monkeypatch):
+    from app.password_logic import ESTIMATED_BYTES_PER_CREDENTIAL, vault_cache
+    vault_cache.clear()
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.save_credentials({f"Service{i}": {"tags": ["t"], "fields": {"u": "x"}} for i in range(10)})
+    file_size = os.path.getsize(manager.filename)
+    assert vault_cache.stats()["bytes"] == file_size + 10 * ESTIMATED_BYTES_PER_CREDENTIAL
+
+    # A bound the file alone fits in is still too small for the decrypted, indexed state,
+    # which is then only kept until another vault is cached
+    monkeypatch.setattr(vault_cache, 'max_bytes', file_size * 2)
+    vault_cache.clear()
+    request_manager = PasswordManager("test_user")
+    request_manager.key = manager.key
+    assert len(request_manager.load_credentials()) == 10
+    assert vault_cache.stats()["entries"] == 1
+    vault_cache.put("other", manager.key, 1, {}, 1)
+    assert vault_cache.stats()["entries"] == 1
+    assert vault_cache.stats()["bytes"] == 1
+
+def test_each_manager_loads_an_uncached_vault_once(temp_password_manager, monkeypatch):
+    from app import password_logic
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    # As if other users' vaults kept evicting this one from the shared cache
+    monkeypatch.setattr(vault_cache, 'get', lambda filename, key, signature: None)
+    replays = []
+    original_read_log = password_logic.read_log
+    def counting_read_log(*args, **kwargs):
+        replays.append(args)
+        return original_read_log(*args, **kwargs)
+    monkeypatch.setattr(password_logic, 'read_log', counting_read_log)
+
+    request_manager = PasswordManager("test_user")
+    request_manager.key = manager.key
+    assert request_manager.can_decrypt()
+    assert request_manager.vault_version() is not None
+    assert request_manager.get_all_tags() == {"email": 1}
+    assert request_manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    assert request_manager.search_credentials("g") == ["GitHub", "Google"]
+    assert len(replays) == 1
+
+    # A write by another manager changes the file, so the kept state is not served stale
+    assert manager.delete_credential("Google")
+    assert len(replays) == 2
+    assert request_manager.search_credentials("g") == ["GitHub"]
+    assert len(replays) == 3
+
+# Tests for the append-only log vault format
+
+def _read_lines(manager):
+    with open(manager.filename, 'rb') as f:
+        return f.read().split(b'\n')
+
+def test_mutations_append_one_record(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    lines_before = _read_lines(manager)
+
+    manager.update_credential("Google", ["email", "work"], {"u": "b"})
+    manager.delete_credential("Google")
+    manager.create_credential("GitHub", ["dev"], {"u": "c"})
+
+    lines_after = _read_lines(manager)
+    # Earlier records are left untouched; each mutation appends exactly one
+    assert lines_after[:len(lines_before) - 1] == lines_before[:-1]
+    assert len(lines_after) == len(lines_before) + 3
+
+    # A fresh process replays the log to the same state
+    from app.password_logic import vault_cache
+    vault_cache.clear()
+    assert manager.load_credentials() == {"GitHub": {"tags": ["dev"], "fields": {"u": "c"}}}
+
+def test_legacy_vault_is_read_and_migrated(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    legacy = {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+    with open(manager.filename, 'wb') as f:
+        f.write(Fernet(manager.key).encrypt(json.dumps(legacy, indent=4).encode()))
+
+    assert manager.load_credentials() == legacy
+
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    with open(manager.filename, 'rb') as f:
+        assert f.read().startswith(b'PMVAULT1\n')
+    from app.password_logic import vault_cache
+    vault_cache.clear()
+    assert set(manager.load_credentials()) == {"Google", "GitHub"}
+
+def test_log_is_compacted(temp_password_manager):
+    from app.password_logic import COMPACTION_MIN_RECORDS
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    for i in range(COMPACTION_MIN_RECORDS):
+        manager.update_credential("Google", ["email"], {"u": str(i)})
+
+    # Header plus a handful of records, not one per update
+    assert len(_read_lines(manager)) < COMPACTION_MIN_RECORDS // 2
+    assert manager.load_credentials()["Google"]["fields"] == {"u": str(COMPACTION_MIN_RECORDS - 1)}
+
+def test_vault_revision_survives_compaction_and_reload(temp_password_manager):
+    from app.password_logic import COMPACTION_MIN_RECORDS, vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    empty_version = manager.vault_version()
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    for i in range(COMPACTION_MIN_RECORDS):
+        manager.update_credential("Google", ["email"], {"u": str(i)})
+    assert manager._load_state().revision == COMPACTION_MIN_RECORDS + 1
+    version = manager.vault_version()
+    assert version != empty_version
+
+    # Compaction rewrote the log but changed nothing, so the version holds, in this process and after a reload
+    assert manager.compact()
+    assert manager.vault_version() == version
+    vault_cache.clear()
+    assert manager.vault_version() == version
+
+    manager.delete_credential("Google")
+    assert manager._load_state().revision == COMPACTION_MIN_RECORDS + 2
+    assert manager.vault_version() != version
+    assert manager.save_credentials({"GitHub": {"tags": ["dev"], "fields": {"u": "b"}}})
+    assert manager._load_state().revision == COMPACTION_MIN_RECORDS + 3
+
+def test_changes_since_survives_compaction_reload_and_rewrap(temp_password_manager):
+    from app.password_logic import COMPACTION_MIN_RECORDS, vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    assert manager.changes_since(None) == (0, None, None)
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    revision, _, _ = manager.changes_since(0)
+    manager.update_credential("GitHub", ["work"], {"u": "c"})
+    manager.delete_credential("Google")
+    manager.create_credential("Gmail", ["email"], {"u": "d"})
+
+    expected = (revision + 3, [{"service": "GitHub", "tags": ["work"]}, {"service": "Gmail", "tags": ["email"]}], ["Google"])
+    assert manager.changes_since(revision) == expected
+    assert manager.changes_since(revision + 3) == (revision + 3, [], [])
+    # Ahead of the vault: its history was replaced
+    assert manager.changes_since(revision + 4) == (revision + 3, None, None)
+
+    assert manager.compact()
+    vault_cache.clear()
+    assert manager.changes_since(revision) == expected
+    new_manager = manager.change_master_password("new_password")
+    vault_cache.clear()
+    assert new_manager.changes_since(revision) == expected
+
+    # More changes than the journal holds: older clients have to reload
+    for i in range(COMPACTION_MIN_RECORDS):
+        new_manager.apply_batch([{"op": "upsert", "service": f"s{i}-{j}", "tags": ["t"], "fields": {"u": "x"}}
+                                 for j in range(20)])
+    latest, _, _ = new_manager.changes_since(None)
+    assert new_manager.changes_since(revision) == (latest, None, None)
+    assert len(new_manager.changes_since(latest - 1)[1]) == 20
+
+    # Replacing the whole vault resets the journal
+    assert new_manager.save_credentials({"Only": {"tags": ["x"], "fields": {"u": "y"}}})
+    assert new_manager.changes_since(latest) == (latest + 1, None, None)
+    assert new_manager.changes_since(latest + 1) == (latest + 1, [], [])
+
+def test_torn_trailing_record_is_ignored(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    with open(manager.filename, 'ab') as f:
+        f.write(b'gAAAAABtorn')
+
+    from app.password_logic import vault_cache
+    vault_cache.clear()
+    assert manager.load_credentials() == {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+
+def test_write_after_torn_record_keeps_vault_readable(temp_password_manager):
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    # A crash in the middle of the last append
+    with open(manager.filename, 'r+b') as f:
+        f.truncate(os.path.getsize(manager.filename) - 10)
+    vault_cache.clear()
+
+    assert manager.create_credential("Twitter", ["social"], {"u": "c"})
+    vault_cache.clear()
+    assert manager.load_credentials() == {
+        "Google": {"tags": ["email"], "fields": {"u": "a"}},
+        "Twitter": {"tags": ["social"], "fields": {"u": "c"}},
+    }
+    with open(manager.filename, 'rb') as f:
+        assert f.read().endswith(b'\n')
+
+def test_wrong_password_detected_on_empty_log(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    manager.delete_credential("Google")
+    assert manager.load_credentials() == {}
+
+    other_manager = PasswordManager("test_user")
+    other_manager.set_key("wrong_password")
+    assert other_manager.load_credentials() is None
+
+def test_search_index_follows_mutations(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    assert manager.search_credentials("mail") == ["Google"]
+
+    # The index is now built and must be maintained incrementally
+    manager.update_credential("Google", ["work"], {"u": "a"})
+    manager.create_credential("GitLab", ["dev"], {"u": "b"})
+    assert manager.search_credentials("mail") == []
+    assert manager.search_credentials("work") == ["Google"]
+    assert manager.search_credentials("git") == ["GitLab"]
+
+    manager.delete_credential("GitLab")
+    assert manager.search_credentials("git") == []
+
+def test_filter_credentials(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email", "work"], {"u": "a"})
+    manager.create_credential("GitHub", ["dev", "code", "work"], {"u": "b"})
+    manager.create_credential("Gmail", ["email"], {"u": "c"})
+    manager.create_credential("Amazon", ["shopping"], {"u": "d"})
+
+    results, total = manager.filter_credentials(["email", "work"], mode='and')
+    assert total == 1
+    assert results == [{"service": "Google", "matches": 2}]
+
+    # Most matching tags first, then by name
+    results, total = manager.filter_credentials(["email", "work"], mode='or')
+    assert total == 3
+    assert [r["service"] for r in results] == ["Google", "GitHub", "Gmail"]
+    assert [r["matches"] for r in results] == [2, 1, 1]
+
+    # Pagination
+    results, total = manager.filter_credentials(["email", "work"], mode='or', offset=1, limit=1)
+    assert total == 3
+    assert results == [{"service": "GitHub", "matches": 1}]
+
+    assert manager.filter_credentials([], mode='and') == ([], 0)
+    assert manager.filter_credentials(["missing"], mode='or') == ([], 0)
+    with pytest.raises(ValueError):
+        manager.filter_credentials(["email"], mode='xor')
+
+def test_list_credentials_pages_in_name_order(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    for service in ["delta", "Alpha", "charlie", "Bravo", "echo"]:
+        manager.create_credential(service, ["tag"], {"password": service})
+
+    items, last = manager.list_credentials(limit=2)
+    assert items == [{"service": "Alpha", "tags": ["tag"]}, {"service": "Bravo", "tags": ["tag"]}]
+    assert last == "Bravo"
+
+    # Mutations between pages do not disturb the cursor
+    manager.delete_credential("Alpha")
+    manager.create_credential("Cobra", ["tag"], {"password": "c"})
+    items, last = manager.list_credentials(after=last, limit=2, include=('fields',))
+    assert items == [{"service": "charlie", "fields": {"password": "charlie"}}, {"service": "Cobra", "fields": {"password": "c"}}]
+
+    items, last = manager.list_credentials(after=last, limit=2, include=())
+    assert items == [{"service": "delta"}, {"service": "echo"}]
+    assert last is None
+
+def test_get_credential(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+
+    credential = manager.get_credential("Google")
+    assert credential == {"tags": ["email"], "fields": {"u": "a"}}
+    credential["fields"]["u"] = "mutated"
+    assert manager.get_credential("Google")["fields"] == {"u": "a"}
+    assert manager.get_credential("missing") is None
+
+def test_batch_applies_all_operations_in_one_record(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email", "work"], {"u": "a", "p": "1"})
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    lines_before = len(_read_lines(manager))
+
+    with manager.batch() as batch:
+        batch.upsert("Amazon", ["shopping"], {"u": "c"})
+        batch.patch("Google", tags=["mail"], fields={"p": None, "otp": "x"})
+        batch.delete("GitHub")
+        # Later operations see earlier staged ones
+        batch.patch("Amazon", fields={"p": "2"})
+    assert batch.committed
+
+    assert len(_read_lines(manager)) == lines_before + 1
+    from app.password_logic import vault_cache
+    vault_cache.clear()
+    assert manager.load_credentials() == {
+        "Google": {"tags": ["mail"], "fields": {"u": "a", "otp": "x"}},
+        "Amazon": {"tags": ["shopping"], "fields": {"u": "c", "p": "2"}},
+    }
+    assert manager.search_credentials("git") == []
+
+def test_batch_is_all_or_nothing(temp_password_manager):
+    from app.password_logic import BatchError
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    before = manager.load_credentials()
+
+    with pytest.raises(BatchError, match="Operation 1"):
+        manager.apply_batch([
+            {"op": "delete", "service": "Google"},
+            {"op": "patch", "service": "Missing", "tags": ["x"]},
+        ])
+    assert manager.load_credentials() == before
+
+    with pytest.raises(BatchError):
+        manager.apply_batch([{"op": "rename", "service": "Google"}])
+    with pytest.raises(BatchError, match="Tags must be"):
+        manager.apply_batch([{"op": "upsert", "service": "New", "tags": "str", "fields": {"f": "v"}}])
+    with pytest.raises(BatchError, match="Fields must be"):
+        manager.apply_batch([{"op": "upsert", "service": "New", "tags": ["t"], "fields": ["v"]}])
+    with pytest.raises(BatchError, match="Patched fields"):
+        manager.apply_batch([{"op": "patch", "service": "Google", "fields": "str"}])
+    with pytest.raises(BatchError, match="Tags must be"):
+        manager.apply_batch([{"op": "patch", "service": "Google", "tags": "str"}])
+    assert manager.load_credentials() == before
+    assert manager.apply_batch([{"op": "upsert", "service": "New", "tags": ["t"], "fields": {"f": "v"}}])
+    assert set(manager.load_credentials()) == {"Google", "New"}
+
+def test_invalid_credentials_are_not_written(temp_password_manager):
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    with open(manager.filename, 'rb') as f:
+        before = f.read()
+
+    assert not manager.create_credential(5, ["email"], {"u": "a"})
+    assert not manager.create_credential("GitHub", [1], {"u": "a"})
+    assert not manager.create_credential("GitHub", ["dev"], {"u": 1})
+    assert not manager.update_credential("Google", [1], {"u": "a"})
+    assert not manager._append_records(manager._load_state(), [{"op": "upsert", "service": 5, "data": {}}])
+    with open(manager.filename, 'rb') as f:
+        assert f.read() == before
+    vault_cache.clear()
+    assert manager.load_credentials() == {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+
+def test_vault_with_non_string_tags_and_services_still_loads(temp_password_manager):
+    from app.password_logic import vault_cache
+    from app.vault_log import encode_envelope_record, make_fernet, upsert_record
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    # Records an earlier version wrote without checking them
+    fernet = make_fernet(manager._load_state().data_key)
+    with open(manager.filename, 'ab') as f:
+        f.write(encode_envelope_record(fernet, upsert_record("GitHub", {"tags": [1, "dev"], "fields": {"u": "b"}}), 2))
+        f.write(encode_envelope_record(fernet, upsert_record(5, {"tags": ["num"], "fields": {"u": "c"}}), 3))
+    vault_cache.clear()
+
+    assert manager.can_decrypt()
+    assert manager.search_credentials("g") == ["GitHub", "Google"]
+    assert [service for service, _ in manager.fuzzy_search_credentials("githb", 5)] == ["GitHub"]
+    assert manager.get_all_tags() == {"email": 1, "dev": 1, "num": 1}
+    assert manager.create_credential("Amazon", ["shopping"], {"u": "d"})
+    assert manager.delete_credential("GitHub")
+    assert manager.search_credentials("") == ["Amazon", "Google"]
+
+# Tests for envelope encryption
+
+def test_index_reads_leave_fields_sealed(temp_password_manager, monkeypatch):
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.apply_batch([
+        {"op": "upsert", "service": f"Service{i}", "tags": ["t"], "fields": {"p": str(i)}} for i in range(10)
+    ])
+    vault_cache.clear()
+    key = manager.key
+    manager = PasswordManager("test_user")
+    manager.key = key
+
+    decrypted = []
+    original_decrypt = Fernet.decrypt
+    def counting_decrypt(self, token, *args, **kwargs):
+        decrypted.append(token)
+        return original_decrypt(self, token, *args, **kwargs)
+    monkeypatch.setattr(Fernet, 'decrypt', counting_decrypt)
+
+    assert len(manager.search_credentials("service")) == 10
+    assert manager.get_all_tags() == {"t": 10}
+    items, _ = manager.list_credentials(limit=5)
+    assert len(items) == 5
+    # The header and one index record per credential (the first write is a snapshot); no fields blobs
+    assert len(decrypted) == 11
+
+    assert manager.get_credential("Service3")["fields"] == {"p": "3"}
+    assert len(decrypted) == 12
+
+def test_swapped_fields_blobs_are_rejected(temp_password_manager):
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"p": "google"})
+    manager.create_credential("GitHub", ["dev"], {"p": "github"})
+
+    lines = _read_lines(manager)
+    first, second = lines[-3].split(b' '), lines[-2].split(b' ')
+    first[1], second[1] = second[1], first[1]
+    lines[-3], lines[-2] = b' '.join(first), b' '.join(second)
+    with open(manager.filename, 'wb') as f:
+        f.write(b'\n'.join(lines))
+    vault_cache.clear()
+
+    assert manager.search_credentials("g") == ["GitHub", "Google"]
+    assert manager.get_credential("Google") is None
+    assert manager.load_credentials() is None
+
+def test_version_1_log_is_read_and_migrated(temp_password_manager):
+    from app.password_logic import vault_cache
+    from app.vault_log import MAGIC, encode_record, upsert_record
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    fernet = Fernet(manager.key)
+    with open(manager.filename, 'wb') as f:
+        f.write(MAGIC + encode_record(fernet, {"op": "header", "version": 1})
+                + encode_record(fernet, upsert_record("Google", {"tags": ["email"], "fields": {"u": "a"}})))
+    vault_cache.clear()
+
+    assert manager.load_credentials() == {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    header = json.loads(fernet.decrypt(_read_lines(manager)[1]))
+    assert header["version"] == 2
+    vault_cache.clear()
+    assert set(manager.load_credentials()) == {"Google", "GitHub"}
+
+def test_change_master_password_rewraps_only_the_header(temp_password_manager):
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    expected = manager.load_credentials()
+    lines_before = _read_lines(manager)
+
+    new_manager = manager.change_master_password("new_password")
+    assert new_manager is not None
+    assert not os.path.exists(manager.filename)
+    assert not os.path.exists(manager.salt_filename)
+    lines_after = _read_lines(new_manager)
+    assert lines_after[0] == lines_before[0]
+    assert lines_after[1] != lines_before[1]
+    assert lines_after[2:] == lines_before[2:]
+
+    vault_cache.clear()
+    reopened = PasswordManager("new_password")
+    reopened.set_key("new_password")
+    assert reopened.load_credentials() == expected
+    # The new vault is already in use; it cannot be claimed twice
+    assert reopened.change_master_password("new_password") is None
+
+def test_moved_vault_is_never_recreated(temp_password_manager):
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    assert manager.change_master_password("new_password") is not None
+
+    # A process still holding the old key
+    stale = PasswordManager("master_password")
+    stale.key = manager.key
+    assert stale.load_credentials() is None
+    assert not stale.create_credential("Lost", ["x"], {"u": "b"})
+    assert not os.path.exists(stale.filename)
+
+# Tests for per-vault KDF parameters
+
+def test_new_salt_file_records_kdf_parameters(temp_password_manager):
+    from app.kdf import KDF_MAGIC, LEGACY_PARAMS
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    with open(manager.salt_filename, 'rb') as f:
+        assert f.read().startswith(KDF_MAGIC)
+    assert len(manager.load_salt()) == 16
+    assert manager.kdf_params == LEGACY_PARAMS
+
+def test_login_rehashes_to_configured_parameters(temp_password_manager):
+    from app.kdf import save_target_params
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    lines_before = _read_lines(manager)
+
+    scrypt_params = {"algorithm": "scrypt", "n": 1024, "r": 8, "p": 1}
+    save_target_params(scrypt_params)
+    session = PasswordManager("test_user")
+    assert session.unlock("master_password")
+    assert session.rehashed
+    assert session.kdf_params == scrypt_params
+    # Only the wrapped data key changed
+    lines_after = _read_lines(session)
+    assert lines_after[1] != lines_before[1]
+    assert lines_after[2:] == lines_before[2:]
+
+    vault_cache.clear()
+    fresh = PasswordManager("test_user")
+    assert fresh.unlock("master_password")
+    assert not fresh.rehashed
+    assert fresh.load_credentials() == {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+    assert not PasswordManager("test_user").unlock("wrong_password")
+
+def test_interrupted_rehash_is_completed_on_next_login(temp_password_manager, monkeypatch):
+    from app.kdf import decode_salt_file, save_target_params
+    from app.password_logic import vault_cache
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    save_target_params({"algorithm": "scrypt", "n": 1024, "r": 8, "p": 1})
+
+    # Crash after the vault was re-wrapped but before the salt file was finalised
+    writes = []
+    original_replace_file = PasswordManager._replace_file
+    def crashing_replace_file(self, data, filename=None):
+        writes.append(filename)
+        if len(writes) == 3:
+            raise OSError("simulated crash")
+        return original_replace_file(self, data, filename)
+    monkeypatch.setattr(PasswordManager, '_replace_file', crashing_replace_file)
+    session = PasswordManager("test_user")
+    assert session.unlock("master_password")
+    assert not session.rehashed
+    monkeypatch.setattr(PasswordManager, '_replace_file', original_replace_file)
+    with open(manager.salt_filename, 'rb') as f:
+        assert decode_salt_file(f.read())[2] is not None
+
+    vault_cache.clear()
+    recovered = PasswordManager("test_user")
+    assert recovered.unlock("master_password")
+    assert recovered.kdf_params["algorithm"] == "scrypt"
+    assert recovered.load_credentials() == {"Google": {"tags": ["email"], "fields": {"u": "a"}}}
+    with open(manager.salt_filename, 'rb') as f:
+        assert decode_salt_file(f.read())[2] is None
+
+# Tests for payload formats
+
+def test_vault_reads_records_of_mixed_payload_formats(temp_password_manager):
+    from app.password_logic import vault_cache
+    from app.serializers import payload_codec
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    try:
+        manager.create_credential("Google", ["email"], {"u": "a"})
+        payload_codec.configure_from_spec("binary+zlib")
+        manager.create_credential("GitHub", ["dev"], {"token": "x" * 200})
+        manager.update_credential("Google", ["email", "work"], {"u": "b"})
+    finally:
+        payload_codec.configure_from_spec("json")
+    manager.create_credential("Bank", ["finance"], {"pin": "1234"})
+
+    vault_cache.clear()
+    assert manager.load_credentials() == {
+        "Google": {"tags": ["email", "work"], "fields": {"u": "b"}},
+        "GitHub": {"tags": ["dev"], "fields": {"token": "x" * 200}},
+        "Bank": {"tags": ["finance"], "fields": {"pin": "1234"}},
+    }
+
+# Tests for the search result cache
+
+def test_search_results_are_cached_refined_and_invalidated(temp_password_manager, monkeypatch):
+    from app.search_index import SearchIndex
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    manager.create_credential("Gmail", ["email"], {"u": "c"})
+
+    searches = []
+    original_search = SearchIndex.search
+    def counting_search(self, query):
+        searches.append(query)
+        return original_search(self, query)
+    monkeypatch.setattr(SearchIndex, 'search', counting_search)
+
+    assert manager.search_credentials("g") == ["GitHub", "Gmail", "Google"]
+    assert manager.search_credentials("G") == ["GitHub", "Gmail", "Google"]
+    # Longer queries are narrowed down from the cached shorter prefix
+    assert manager.search_credentials("go") == ["Google"]
+    assert manager.search_credentials("em") == ["Gmail", "Google"]
+    assert searches == ["g", "em"]
+    results = manager.search_credentials("go")
+    results.append("mutated by caller")
+    assert manager.search_credentials("go") == ["Google"]
+
+    # Any change to the vault drops the cached results
+    manager.create_credential("GoDaddy", ["web"], {"u": "d"})
+    assert manager.search_credentials("go") == ["GoDaddy", "Google"]
+    assert searches == ["g", "em", "go"]
+
+def test_fuzzy_search_results_are_cached(temp_password_manager, monkeypatch):
+    from app.search_index import SearchIndex
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("GitHub", ["dev"], {"u": "b"})
+    calls = []
+    original_fuzzy_search = SearchIndex.fuzzy_search
+    def counting_fuzzy_search(self, query, limit, matches=None):
+        calls.append(query)
+        return original_fuzzy_search(self, query, limit, matches)
+    monkeypatch.setattr(SearchIndex, 'fuzzy_search', counting_fuzzy_search)
+
+    assert manager.fuzzy_search_credentials("gihtub")[0][0] == "GitHub"
+    assert manager.fuzzy_search_credentials("GIHTUB")[0][0] == "GitHub"
+    assert calls == ["gihtub"]
+    manager.delete_credential("GitHub")
+    assert manager.fuzzy_search_credentials("gihtub") == []
+    assert calls == ["gihtub", "gihtub"]
+
+def test_fuzzy_search_refines_from_a_cached_prefix(temp_password_manager, monkeypatch):
+    from app.search_index import SearchIndex
+    manager = temp_password_manager
+    manager.set_key("master_password")
+    manager.create_credential("Google", ["email"], {"u": "a"})
+    manager.create_credential("GoDaddy", ["web"], {"u": "b"})
+    manager.create_credential("Bank", ["google"], {"u": "c"})
+    manager.create_credential("Logout", [], {"u": "d"})
+
+    lookups = []
+    original_narrow_search = SearchIndex.narrow_search
+    def counting_narrow_search(self, query, max_results):
+        lookups.append(query)
+        return original_narrow_search(self, query, max_results)
+    monkeypatch.setattr(SearchIndex, 'narrow_search', counting_narrow_search)
+
+    # As the search box sends them, one keystroke at a time
+    for query in ["go", "goo", "goog", "googl", "googel"]:
+        fresh = SearchIndex.build(manager.load_credentials()).fuzzy_search(query, 20)
+        assert manager.fuzzy_search_credentials(query) == fresh, query
+    # Only the first query is looked up; the rest narrow down its cached matches
+    assert lookups == ["go"]
+    assert manager.search_credentials("goog") == ["Bank", "Google"]
@@ -0,0 +1,169 @@
+import random
+import string
+from app.search_index import SearchIndex
+
+def linear_search(credentials, query):
+    query_lower = query.lower()
+    return sorted(
+        (service for service, data in credentials.items()
+         if query_lower in service.lower() or any(query_lower in tag.lower() for tag in data.get('tags', []))),
+        key=str.lower,
+    )
+
+def random_vault(rng, size):
+    words = ["".join(rng.choice("abcdeghio") for _ in range(rng.randint(2, 8))) for _ in range(size)]
+    tags = ["Tag" + rng.choice(string.ascii_lowercase[:6]) for _ in range(10)]
+    return {f"{word}{i}": {"tags": rng.sample(tags, rng.randint(0, 3)), "fields": {}} for i, word in enumerate(words)}
+
+def test_index_matches_linear_scan():
+    rng = random.Random(1234)
+    credentials = random_vault(rng, 300)
+    index = SearchIndex.build(credentials)
+    queries = ["", "a", "AB", "bad", "tagc", "gica", "hio1", "zzz", "ag", "e2"]
+    for query in queries:
+        assert index.search(query) == linear_search(credentials, query), query
+
+def test_index_incremental_updates():
+    credentials = {
+        "Google": {"tags": ["email", "work"], "fields": {}},
+        "GitHub": {"tags": ["dev"], "fields": {}},
+    }
+    index = SearchIndex.build(credentials)
+    assert index.search("work") == ["Google"]
+
+    index.remove("Google", credentials["Google"])
+    index.add("Google", {"tags": ["personal"], "fields": {}})
+    assert index.search("work") == []
+    assert index.search("pers") == ["Google"]
+    assert index.services_with_tag("personal") == {"Google"}
+
+    index.remove("GitHub", credentials["GitHub"])
+    assert index.search("git") == []
+    assert "dev" not in index.tag_postings
+
+def test_index_tolerates_malformed_entries():
+    index = SearchIndex.build({"odd": "not a dict", "also_odd": {"tags": "dev"}})
+    assert index.search("odd") == ["also_odd", "odd"]
+
+def test_suggest_tags_ranks_prefix_matches_by_count():
+    credentials = {
+        "a": {"tags": ["finance", "work"]},
+        "b": {"tags": ["finance", "Fitness"]},
+        "c": {"tags": ["fitness", "workout"]},
+        "d": {"tags": ["Fitness"]},
+    }
+    index = SearchIndex.build(credentials)
+    assert index.suggest_tags("fi", 10) == [("Fitness", 2), ("finance", 2), ("fitness", 1)]
+    # Prefix matches come before close matches
+    assert index.suggest_tags("FIN", 10) == [("finance", 2), ("Fitness", 2), ("fitness", 1)]
+    assert index.suggest_tags("", 2) == [("Fitness", 2), ("finance", 2)]
+    # Typos fall back to close matches
+    assert index.suggest_tags("wrok", 1) == [("work", 1)]
+    assert index.suggest_tags("zzz", 5) == []
+
+def test_suggest_tags_after_updates_matches_rebuild():
+    rng = random.Random(99)
+    credentials = random_vault(rng, 200)
+    index = SearchIndex.build(credentials)
+    services = list(credentials)
+    for _ in range(300):
+        service = rng.choice(services)
+        index.remove(service, credentials[service])
+        credentials[service] = {"tags": rng.sample(["Taga", "tagb", "x1", "x2", "x3"], rng.randint(0, 3)), "fields": {}}
+        index.add(service, credentials[service])
+    rebuilt = SearchIndex.build(credentials)
+    assert index.tags_by_count == rebuilt.tags_by_count
+    for prefix in ["", "t", "TAG", "x", "q"]:
+        assert index.suggest_tags(prefix, 3) == rebuilt.suggest_tags(prefix, 3)
+
+def test_suggest_tags_walks_counts_for_broad_prefixes():
+    credentials = {f"s{i}": {"tags": [f"tag{i % 400}"] + (["tag7"] if i % 3 == 0 else [])} for i in range(1200)}
+    index = SearchIndex.build(credentials)
+    assert index.suggest_tags("tag", 2) == [("tag7", 402), ("tag0", 3)]
+
+def test_edit_distance_counts_transpositions():
+    from app.search_index import edit_distance
+    assert edit_distance("gihtub", "github", 2) == 1
+    assert edit_distance("gmial", "gmail", 2) == 1
+    assert edit_distance("kitten", "sitting", 3) == 3
+    # Gives up once the limit is exceeded
+    assert edit_distance("kitten", "sitting", 1) == 2
+    assert edit_distance("abc", "abcdefg", 2) == 3
+
+def test_fuzzy_search_tolerates_typos():
+    credentials = {
+        "GitHub": {"tags": ["dev", "code"]},
+        "Gmail personal": {"tags": ["email"]},
+        "Bank of Finance": {"tags": ["finance"]},
+        "Notes": {"tags": ["personal"]},
+    }
+    index = SearchIndex.build(credentials)
+    assert index.fuzzy_search("gihtub", 5)[0][0] == "GitHub"
+    assert index.fuzzy_search("gihtu", 5)[0][0] == "GitHub"
+    assert index.fuzzy_search("gmial persnal", 5)[0][0] == "Gmail personal"
+    # Through a misspelled tag
+    assert [service for service, _ in index.fuzzy_search("fiannce", 5)] == ["Bank of Finance"]
+    assert index.fuzzy_search("zzzzzz", 5) == []
+
+def test_build_indexes_words_before_the_first_fuzzy_search():
+    index = SearchIndex.build({"GitHub 2": {"tags": ["dev"]}})
+    assert set(index.service_words.word_keys) == {"github", "2"}
+    assert set(index.tag_words.word_keys) == {"dev"}
+    # Numbers are only matched exactly, so their trigrams are not indexed
+    assert not any("2" in gram for gram in index.service_words.gram_words)
+
+def test_fuzzy_search_ranks_exact_matches_first():
+    credentials = {
+        "Personal site": {"tags": []},
+        "My personal mail": {"tags": []},
+        "Diary": {"tags": ["personal"]},
+        "Persnal typo": {"tags": []},
+    }
+    index = SearchIndex.build(credentials)
+    results = index.fuzzy_search("personal", 10)
+    assert [service for service, _ in results] == ["Personal site", "My personal mail", "Diary", "Persnal typo"]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    assert len(index.fuzzy_search("personal", 2)) == 2
+
+def test_fuzzy_search_limits_dense_matches_in_name_order():
+    credentials = {f"{name}-service{i}": {"tags": []} for i, name in enumerate(["delta", "alpha", "charlie", "bravo"] * 50)}
+    index = SearchIndex.build(credentials)
+    expected = sorted(credentials, key=str.lower)[:5]
+    assert [service for service, _ in index.fuzzy_search("serv", 5)] == expected
+    assert [service for service, _ in index.fuzzy_search("", 5)] == expected
+    assert len(index.fuzzy_search("servce", 5)) == 5
+
+def test_fuzzy_search_after_updates_matches_rebuild():
+    rng = random.Random(7)
+    credentials = random_vault(rng, 200)
+    index = SearchIndex.build(credentials)
+    services = list(credentials)
+    for i in range(100):
+        service = services.pop(rng.randrange(len(services)))
+        index.remove(service, credentials.pop(service))
+        new_service = f"Renamed{i} entry"
+        credentials[new_service] = {"tags": ["Tagz", f"label{i % 7}"], "fields": {}}
+        index.add(new_service, credentials[new_service])
+        services.append(new_service)
+    rebuilt = SearchIndex.build(credentials)
+    for query in ["renamd1", "entyr", "lable3", "tagz", "hio", "badd"]:
+        assert index.fuzzy_search(query, 10) == rebuilt.fuzzy_search(query, 10), query
+
+def test_refine_matches_fresh_search():
+    rng = random.Random(5)
+    credentials = random_vault(rng, 300)
+    index = SearchIndex.build(credentials)
+    for prefix, query in [("a", "ab"), ("ta", "tagc"), ("hi", "hio1"), ("e", "e2"), ("b", "bzz")]:
+        assert index.refine(index.search(prefix), query) == index.search(query), query
+
+def test_fuzzy_search_with_matches_matches_fresh_search():
+    rng = random.Random(11)
+    credentials = random_vault(rng, 300)
+    index = SearchIndex.build(credentials)
+    for query in ["ab", "tagc", "hio", "e2", "bzz", "tgc", "", "a"]:
+        assert index.fuzzy_search(query, 15, index.search(query)) == index.fuzzy_search(query, 15), query
+        narrow = index.narrow_search(query, 1000)
+        assert narrow is None or narrow == index.search(query), query
+    assert index.narrow_search("a", 1000) is None
+    assert index.narrow_search("ab", 0) is None
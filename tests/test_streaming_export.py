@@ -0,0 +1,53 @@
+import io
+import json
+import pytest
+from app.streaming_export import (
+    DecryptedExportStream, ExportDecryptionError, ExportHeader, iter_decrypted_export, iter_encrypted_export,
+    iter_json_export,
+)
+
+CREDENTIALS = {f"service{i}": {"tags": ["t", "ü"], "fields": {"password": "x" * (i % 50)}} for i in range(300)}
+
+def test_json_export_round_trips():
+    assert json.loads("".join(iter_json_export(CREDENTIALS.items()))) == CREDENTIALS
+    assert json.loads("".join(iter_json_export([]))) == {}
+
+def _encrypt(password="export_password", segment_size=1024):
+    header = ExportHeader.new()
+    chunks = iter_json_export(CREDENTIALS.items())
+    return b"".join(iter_encrypted_export(chunks, header, header.derive_key(password), segment_size=segment_size))
+
+def _decrypt(encrypted, password="export_password"):
+    stream = io.BytesIO(encrypted)
+    header = ExportHeader.read(stream)
+    return iter_decrypted_export(stream, header, header.derive_key(password))
+
+def test_encrypted_export_round_trips_in_segments():
+    encrypted = _encrypt()
+    segments = list(_decrypt(encrypted))
+    assert len(segments) > 5
+    assert all(len(segment) <= 1024 for segment in segments)
+    assert json.loads(b"".join(segments)) == CREDENTIALS
+    stream = io.BytesIO(encrypted)
+    header = ExportHeader.read(stream)
+    assert json.loads(DecryptedExportStream(stream, header, header.derive_key("export_password")).read()) == CREDENTIALS
+
+def test_encrypted_export_rejects_wrong_password():
+    with pytest.raises(ExportDecryptionError):
+        list(_decrypt(_encrypt(), "wrong_password"))
+
+def test_encrypted_export_detects_truncation():
+    encrypted = _encrypt()
+    # Dropping whole trailing segments must not go unnoticed
+    for cut in (len(encrypted) - 1, len(encrypted) // 2):
+        with pytest.raises(ExportDecryptionError):
+            list(_decrypt(encrypted[:cut]))
+
+def test_export_header_bounds_key_derivation_cost():
+    encrypted = _encrypt()
+    header_end = encrypted.index(b"\n", len(b"PMEXPORT1\n"))
+    line = json.loads(encrypted[len(b"PMEXPORT1\n"):header_end])
+    line["iterations"] = 10 ** 9
+    forged = b"PMEXPORT1\n" + json.dumps(line).encode() + encrypted[header_end:]
+    with pytest.raises(ExportDecryptionError, match="unsupported parameters"):
+        ExportHeader.read(io.BytesIO(forged))
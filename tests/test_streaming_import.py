@@ -0,0 +1,68 @@
+import io
+import json
+import pytest
+from app.password_logic import PasswordManager
+from app.streaming_import import (
+    ImportFormatError, ImportTooLargeError, import_stream, iter_json_object_items,
+)
+
+def _items(text, chunk_size=7, **kwargs):
+    return list(iter_json_object_items(io.BytesIO(text.encode('utf-8')), chunk_size=chunk_size, **kwargs))
+
+def test_parser_yields_entries_across_chunk_boundaries():
+    data = {
+        "Google": {"tags": ["email"], "fields": {"u": "ä☃"}},
+        "Numbers": 1234567890,
+        "Empty": {},
+        "Escaped \"quote\"": [1, 2, {"nested": True}],
+    }
+    text = json.dumps(data, indent=4)
+    for chunk_size in (1, 3, 7, 64):
+        assert _items(text, chunk_size=chunk_size) == list(data.items())
+    assert _items("{}") == []
+    assert _items(" \n{ } \n") == []
+
+@pytest.mark.parametrize("text", ["[]", '{"a": 1', '{"a" 1}', '{"a": 1,}', '{"a": 1} x', '{1: 2}', ""])
+def test_parser_rejects_invalid_json(text):
+    with pytest.raises(ImportFormatError):
+        _items(text)
+
+def test_parser_limits_buffer_size():
+    text = json.dumps({"big": "x" * 1000})
+    with pytest.raises(ImportTooLargeError):
+        _items(text, chunk_size=64, max_buffer_bytes=200)
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "instance").mkdir()
+    manager = PasswordManager("master_password")
+    manager.set_key("master_password")
+    manager.create_credential("Existing", ["old"], {"u": "old"})
+    return manager
+
+def test_import_merges_in_batches_and_reports_skips(manager):
+    data = {f"service{i}": {"tags": ["bulk"], "fields": {"n": str(i)}} for i in range(25)}
+    data["Existing"] = {"tags": ["new"], "fields": {"u": "new"}}
+    data["bad_tags"] = {"tags": "oops", "fields": {"u": "x"}}
+    data["not_an_object"] = 5
+    progress = []
+
+    report = import_stream(manager, io.BytesIO(json.dumps(data).encode()), batch_size=10, chunk_size=128,
+                           progress=lambda r: progress.append(r.imported))
+
+    assert report.imported == 26
+    assert report.batches == 3
+    assert progress == [10, 20, 26]
+    assert report.skipped_count == 2
+    assert [skip["service"] for skip in report.skipped] == ["bad_tags", "not_an_object"]
+    credentials = manager.load_credentials()
+    assert len(credentials) == 26
+    assert credentials["Existing"] == {"tags": ["new"], "fields": {"u": "new"}}
+
+def test_import_keeps_committed_batches_on_parse_error(manager):
+    text = json.dumps({f"s{i}": {"tags": ["t"], "fields": {"f": "v"}} for i in range(5)})[:-10]
+    with pytest.raises(ImportFormatError) as excinfo:
+        import_stream(manager, io.BytesIO(text.encode()), batch_size=2)
+    assert excinfo.value.report.imported == 4
+    assert len(manager.load_credentials()) == 5
@@ -0,0 +1,68 @@
+import os
+import pytest
+import create_user
+from app.password_logic import PasswordManager
+from app.user_registry import UserRegistry, get_registry, shard_paths
+
+@pytest.fixture
+def instance(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "instance").mkdir()
+    return tmp_path / "instance"
+
+def test_register_lookup_and_remove(tmp_path):
+    registry = UserRegistry(str(tmp_path / "registry.sqlite3"))
+    assert registry.lookup("abc") is None
+    assert registry.register("abc", "vault", "salt", {"algorithm": "pbkdf2-sha256"})
+    assert not registry.register("abc", "other", "other")
+    assert registry.lookup("abc") == {"vault": "vault", "salt": "salt", "kdf": {"algorithm": "pbkdf2-sha256"}}
+    assert registry.update_kdf("abc", {"algorithm": "scrypt"})
+    assert registry.lookup("abc")["kdf"] == {"algorithm": "scrypt"}
+    assert registry.register_many([("abc", "v", "s", None), ("def", "v", "s", None), ("ghi", "v", "s", None)]) == 2
+    assert len(registry) == 3
+    assert registry.remove("abc")
+    assert registry.lookup("abc") is None
+
+def test_shard_paths():
+    vault, salt = shard_paths("abcdef", depth=2)
+    assert vault == os.path.join("instance", "ab", "cd", "abcdef_credentials.json")
+    assert salt == os.path.join("instance", "ab", "cd", "abcdef_salt.key")
+
+def test_provisioned_user_is_sharded_and_found_without_probing(instance, monkeypatch):
+    manager = PasswordManager("new_user")
+    assert manager.provision()
+    assert os.path.dirname(manager.filename) == os.path.join("instance", manager.user_key[:2])
+
+    probes = []
+    original_exists = os.path.exists
+    monkeypatch.setattr(os.path, 'exists', lambda path: probes.append(path) or original_exists(path))
+    found = PasswordManager("new_user")
+    assert found.exists()
+    assert (found.filename, found.salt_filename) == (manager.filename, manager.salt_filename)
+    assert probes == []
+
+    assert found.unlock("new_user")
+    assert not PasswordManager("new_user").provision()
+
+def test_legacy_user_is_registered_on_unlock(instance):
+    manager = PasswordManager("legacy_user")
+    manager.set_key("legacy_user")
+    get_registry().remove(manager.user_key)
+    legacy = PasswordManager("legacy_user")
+    assert not legacy.registered
+    assert legacy.exists()
+
+    assert legacy.unlock("legacy_user")
+    registered = PasswordManager("legacy_user")
+    assert registered.registered
+    assert registered.filename == manager.filename
+
+def test_bulk_provisioning(instance):
+    created, skipped = create_user.provision_users([f"user-{i}" for i in range(20)], batch_size=7)
+    assert (created, skipped) == (20, 0)
+    assert len(get_registry()) == 20
+    assert create_user.provision_users(["user-3", "user-20"]) == (1, 1)
+
+    manager = PasswordManager("user-5")
+    assert manager.unlock("user-5")
+    assert manager.load_credentials() == {}
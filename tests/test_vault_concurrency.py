@@ -0,0 +1,92 @@
+import multiprocessing
+import threading
+import pytest
+from app import password_logic
+from app.password_logic import PasswordManager, vault_cache
+
+PASSWORD = "master_password"
+WRITERS = 8
+WRITES_PER_WRITER = 20
+
+@pytest.fixture
+def vault_dir(tmp_path, monkeypatch):
+    # Compact often, so writers also race full rewrites and not just appends
+    monkeypatch.setattr(password_logic, 'COMPACTION_MIN_RECORDS', 8)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "instance").mkdir()
+    manager = PasswordManager(PASSWORD)
+    manager.set_key(PASSWORD)
+    manager.create_credential("seed", ["seed"], {"u": "seed"})
+    return tmp_path
+
+def _write_many(writer, key):
+    for i in range(WRITES_PER_WRITER):
+        # A fresh manager per request, as the Flask routes do
+        manager = PasswordManager(PASSWORD)
+        manager.key = key
+        service = f"w{writer}-{i}"
+        assert manager.create_credential(service, ["stress", f"w{writer}"], {"n": "0"})
+        assert manager.update_credential(service, ["stress", f"w{writer}"], {"n": "1"})
+        assert manager.update_credential(service, ["stress", f"w{writer}"], {"n": "2"})
+
+def _expected_services():
+    return {"seed"} | {f"w{w}-{i}" for w in range(WRITERS) for i in range(WRITES_PER_WRITER)}
+
+def _reload(key):
+    vault_cache.clear()
+    manager = PasswordManager(PASSWORD)
+    manager.key = key
+    credentials = manager.load_credentials()
+    assert all(credentials[service]["fields"] == {"n": "2"} for service in credentials if service != "seed")
+    return credentials
+
+def test_concurrent_thread_writers_lose_no_updates(vault_dir):
+    key = PasswordManager(PASSWORD)
+    key.set_key(PASSWORD)
+    threads = [threading.Thread(target=_write_many, args=(w, key.key)) for w in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert set(_reload(key.key)) == _expected_services()
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_process_writers_lose_no_updates(vault_dir):
+    key = PasswordManager(PASSWORD)
+    key.set_key(PASSWORD)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_write_many, args=(w, key.key)) for w in range(WRITERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert set(_reload(key.key)) == _expected_services()
+
+def test_readers_see_consistent_vault_during_writes(vault_dir):
+    key = PasswordManager(PASSWORD)
+    key.set_key(PASSWORD)
+    errors = []
+    done = threading.Event()
+
+    def read_loop():
+        manager = PasswordManager(PASSWORD)
+        manager.key = key.key
+        while not done.is_set():
+            try:
+                manager.search_credentials("w")
+                manager.get_all_tags()
+                manager.list_credentials(limit=10)
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read_loop) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    _write_many(0, key.key)
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []